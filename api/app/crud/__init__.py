@@ -1,2 +1,6 @@
 from .user import get_user, get_user_by_email, create_user, get_user_by_username
-from .event import create_event, get_event, create_event_photographer_price
\ No newline at end of file
+from .event import create_event, get_event, create_event_photographer_price
+from .photo import (
+    get_photos_by_ids, parse_bib_numbers, sync_photo_bibs,
+    list_photos_page, encode_photo_cursor, decode_photo_cursor,
+)
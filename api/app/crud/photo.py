@@ -0,0 +1,137 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, load_only
+
+from app.models.photo import Photo as PhotoModel
+from app.models.photo_bib import PhotoBib
+
+def get_photos_by_ids(db: Session, photo_ids: Sequence[int], columns: Optional[Sequence] = None) -> List[PhotoModel]:
+    """
+    Fetch photos for a page of search results in one IN query, returned in the order of photo_ids.
+    Ids that no longer exist are skipped. `columns` limits the loaded attributes.
+    """
+    photo_ids = [int(photo_id) for photo_id in photo_ids]
+    if not photo_ids:
+        return []
+    query = db.query(PhotoModel).filter(PhotoModel.id.in_(photo_ids))
+    if columns:
+        query = query.options(load_only(*columns))
+    photos_by_id = {photo.id: photo for photo in query}
+    return [photos_by_id[photo_id] for photo_id in photo_ids if photo_id in photos_by_id]
+
+
+def parse_bib_numbers(bib_numbers: Optional[str]) -> List[str]:
+    """Splits a comma-separated bib_numbers string into distinct, non-empty bibs, in order."""
+    if not bib_numbers:
+        return []
+    bibs = [bib.strip() for bib in bib_numbers.split(",")]
+    return list(dict.fromkeys(bib for bib in bibs if bib))
+
+
+def sync_photo_bibs(db: Session, photo: PhotoModel) -> None:
+    """
+    Rewrites the photo_bibs rows of a photo from its bib_numbers and event_id.
+    Adds to the session without committing, so the rows commit with the photo.
+    """
+    db.query(PhotoBib).filter(PhotoBib.photo_id == photo.id).delete(synchronize_session=False)
+    db.add_all(
+        PhotoBib(photo_id=photo.id, bib=bib, event_id=photo.event_id)
+        for bib in parse_bib_numbers(photo.bib_numbers)
+    )
+
+
+def encode_photo_cursor(photo: PhotoModel) -> str:
+    """Opaque keyset cursor positioned after `photo` in (timestamp, id) order."""
+    position = {"t": photo.timestamp.isoformat() if photo.timestamp else None, "i": photo.id}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_photo_cursor(cursor: str) -> Optional[Tuple[Optional[datetime], int]]:
+    """Returns (timestamp, id) from a cursor, or None if it is malformed."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode()))
+        timestamp = datetime.fromisoformat(position["t"]) if position["t"] is not None else None
+        return timestamp, int(position["i"])
+    except Exception:
+        return None
+
+
+def list_photos_page(
+    db: Session,
+    event_id: Optional[int] = None,
+    bib: Optional[str] = None,
+    after: Optional[Tuple[Optional[datetime], int]] = None,
+    limit: int = 50,
+    columns: Optional[Sequence[str]] = None,
+    public_only: bool = True,
+    offset: int = 0,
+) -> Tuple[List[PhotoModel], Optional[str]]:
+    """
+    One page of photos with keyset pagination, so deep pages cost the same as the first.
+
+    Within an event photos are ordered by (timestamp, id), which the
+    ix_photos_event_id_is_public_timestamp_id index serves directly; photos without a
+    timestamp come first, ordered by id. Without an event, photos are ordered by id.
+
+    Args:
+        db (Session): The SQLAlchemy DB session.
+        event_id (Optional[int]): Restrict to one event.
+        bib (Optional[str]): Restrict to photos tagged with this bib.
+        after (Optional[Tuple]): Decoded cursor of the previous page.
+        limit (int): Page size.
+        columns (Optional[Sequence[str]]): Photo attributes to load; others stay unloaded.
+        public_only (bool): Skip hidden photos.
+        offset (int): Legacy OFFSET paging, only used without `after`; deep offsets are
+            as slow as ever.
+
+    Returns:
+        Tuple[List[PhotoModel], Optional[str]]: The photos and the cursor of the next page
+        (None on the last page).
+    """
+    query = db.query(PhotoModel)
+    if columns:
+        query = query.options(load_only(*[getattr(PhotoModel, name) for name in columns]))
+    if event_id is not None:
+        query = query.filter(PhotoModel.event_id == event_id)
+    if public_only:
+        query = query.filter(PhotoModel.is_public == True)
+    if bib is not None:
+        query = query.join(PhotoBib, PhotoBib.photo_id == PhotoModel.id).filter(PhotoBib.bib == bib.strip())
+
+    after_timestamp, after_id = after if after is not None else (None, None)
+    if after is None and offset > 0:
+        order = (PhotoModel.id,) if event_id is None else (PhotoModel.timestamp.isnot(None), PhotoModel.timestamp, PhotoModel.id)
+        photos = query.order_by(*order).offset(offset).limit(limit + 1).all()
+    elif event_id is None:
+        if after_id is not None:
+            query = query.filter(PhotoModel.id > after_id)
+        photos = query.order_by(PhotoModel.id).limit(limit + 1).all()
+    elif after is None or after_timestamp is None:
+        # Photos without a timestamp first, then the timestamped ones
+        untimed = query.filter(PhotoModel.timestamp.is_(None))
+        if after_id is not None:
+            untimed = untimed.filter(PhotoModel.id > after_id)
+        photos = untimed.order_by(PhotoModel.id).limit(limit + 1).all()
+        if len(photos) <= limit:
+            photos += (
+                query.filter(PhotoModel.timestamp.isnot(None))
+                .order_by(PhotoModel.timestamp, PhotoModel.id)
+                .limit(limit + 1 - len(photos))
+                .all()
+            )
+    else:
+        photos = (
+            query.filter(tuple_(PhotoModel.timestamp, PhotoModel.id) > tuple_(after_timestamp, after_id))
+            .order_by(PhotoModel.timestamp, PhotoModel.id)
+            .limit(limit + 1)
+            .all()
+        )
+
+    if len(photos) <= limit:
+        return photos, None
+    photos = photos[:limit]
+    return photos, encode_photo_cursor(photos[-1])
@@ -4,6 +4,7 @@ from fastapi.staticfiles import StaticFiles
 import os
 from dotenv import load_dotenv
 import logging # Added
+import threading
 
 # --- Early Logging Configuration (adjust as needed) ---
 # This ensures loggers in other modules will output if not configured elsewhere.
@@ -13,9 +14,13 @@ logger = logging.getLogger(__name__) # Logger for this main module
 # Load environment variables from .env file
 load_dotenv()
 
-from app.database import engine, Base
-from app.routers import auth, users, events, photos, bib_detection, admin, payments, photographer
-from app.utils.faiss_utils import get_faiss_index # Added for FAISS index loading
+from app.database import engine, Base, SessionLocal
+from app.routers import auth, users, events, photos, bib_detection, admin, payments, photographer, saved_searches
+from app.utils.faiss_utils import FAISS_SERVICE_SOCKET, FAISS_SERVICE_NODES, get_index_stats # Added for FAISS index loading
+from app.utils.index_service import load_index
+from app.utils.person_clip_utils import warm_text_embedding_cache
+from app.utils.identity_clusters import run_clustering
+from app.utils.knn_graph import run_graph_refresh
 
 # Create tables if they don't exist
 # Base.metadata.create_all(bind=engine)
@@ -33,7 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"]  # Add this to expose headers for file downloads
+    expose_headers=["Content-Disposition", "X-Next-Cursor"]  # File download names and listing cursors
 )
 
 # Include routers
@@ -45,6 +50,7 @@ app.include_router(bib_detection.router, prefix="/api")
 app.include_router(admin.router, prefix="/api")
 app.include_router(payments.router, prefix="/api")
 app.include_router(photographer.router, prefix="/api")
+app.include_router(saved_searches.router, prefix="/api")
 
 # Ensure upload directories exist
 os.makedirs("uploads/photos", exist_ok=True)
@@ -63,12 +69,35 @@ def read_root():
 @app.on_event("startup")
 async def startup_event():
     logger.info("Application startup: Initializing resources...")
-    # Load or initialize the FAISS index
-    faiss_index = get_faiss_index()
-    if faiss_index is not None:
-        logger.info(f"FAISS index loaded/initialized successfully. Index contains {faiss_index.ntotal} vectors.")
+    if FAISS_SERVICE_NODES or FAISS_SERVICE_SOCKET:
+        # The index lives in the index service process(es); just check they are reachable
+        service = FAISS_SERVICE_NODES or FAISS_SERVICE_SOCKET
+        stats = get_index_stats()
+        if stats and stats.get("nodes_up"):
+            logger.info(f"Using FAISS index service at {service}: {stats}")
+        else:
+            logger.error(f"FAISS index service at {service} is unreachable. Search functionality might be affected.")
     else:
-        logger.error("FAISS index could not be loaded or initialized. Search functionality might be affected.")
+        # Load or initialize the FAISS index, plus the per-vector photo/event/visibility table
+        # used for filtered search (rebuilt from the DB if the saved copy is missing or stale)
+        try:
+            load_index()
+        except Exception as e:
+            logger.error(f"FAISS index or vector metadata could not be loaded: {e}. Search functionality might be affected.")
+
+    if os.getenv("WARM_TEXT_EMBEDDINGS", "1") == "1":
+        # Precompute common outfit queries in the background; startup doesn't wait on CLIP
+        threading.Thread(target=warm_text_embedding_cache, daemon=True).start()
+
+    if os.getenv("IDENTITY_CLUSTERING", "0") == "1":
+        # Group new person detections into per-event identities. Opt-in: set
+        # IDENTITY_CLUSTERING=1 on exactly one worker, or run cluster_identities.py instead.
+        threading.Thread(target=run_clustering, args=(SessionLocal,), daemon=True).start()
+
+    if os.getenv("KNN_GRAPH_REFRESH", "0") == "1":
+        # Extend the per-event "similar photos" graphs with new detections. Opt-in, on exactly
+        # one worker like the clustering, or run build_knn_graphs.py instead.
+        threading.Thread(target=run_graph_refresh, args=(SessionLocal,), daemon=True).start()
     
     # You can add other startup tasks here, e.g., DB connection checks (though Depends handles this per request)
     logger.info("Application startup complete.")
@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Float, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import json # For storing bbox as JSON string initially, or use separate Float columns
 
 from app.database import Base
+from app.models.identity_cluster import IdentityCluster  # noqa: F401 (target of cluster_id)
 
 class PersonEmbedding(Base):
     __tablename__ = "person_embeddings"
@@ -22,7 +23,12 @@ class PersonEmbedding(Base):
 
     # Link to the FAISS index
     # This ID corresponds to the 0-based index of the vector in the FAISS index file.
-    faiss_id = Column(Integer, nullable=False, index=True, unique=True)
+    # With several index nodes the node number is stored in the high bits (see index_router.py).
+    faiss_id = Column(BigInteger, nullable=False, index=True, unique=True)
+
+    # Identity cluster within the event (app/utils/identity_clusters.py); None until the
+    # background clusterer has seen this detection
+    cluster_id = Column(Integer, ForeignKey("identity_clusters.id", ondelete="SET NULL"), nullable=True, index=True)
 
     # The actual CLIP embedding will be stored in FAISS.
     # We might store a reference or an ID here if needed, or rely on row order.
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class IdentityCluster(Base):
+    """
+    A group of person detections within one event believed to be the same runner, built
+    online by app.utils.identity_clusters. Members are the PersonEmbedding rows whose
+    cluster_id points here.
+    """
+    __tablename__ = "identity_clusters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=True, index=True)
+    # float32 bytes: sum of the members' L2-normalized vectors. The centroid is its direction,
+    # and merging two clusters is just adding sums.
+    vector_sum = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
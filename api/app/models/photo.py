@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -28,6 +28,11 @@ class Photo(Base):
     event = relationship("Event", back_populates="photos")
     photographer = relationship("User")
 
+    __table_args__ = (
+        # Serves keyset-paginated event listings (app.crud.photo.list_photos_page)
+        Index("ix_photos_event_id_is_public_timestamp_id", "event_id", "is_public", "timestamp", "id"),
+    )
+
 
 # Add the reverse relationship to Event
 from app.models.event import Event
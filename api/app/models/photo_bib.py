@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+
+from app.database import Base
+
+
+class PhotoBib(Base):
+    """
+    One row per bib number tagged on a photo. Mirrors Photo.bib_numbers (kept in sync by
+    app.crud.photo.sync_photo_bibs) so bib search is an index lookup instead of LIKE scans
+    over the comma-separated string.
+    """
+    __tablename__ = "photo_bibs"
+
+    photo_id = Column(Integer, ForeignKey("photos.id", ondelete="CASCADE"), primary_key=True)
+    bib = Column(String, primary_key=True)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=True) # Denormalized from photos
+
+    __table_args__ = (
+        # Serves bib search across all events and within one event
+        Index("ix_photo_bibs_bib_event_id", "bib", "event_id", "photo_id"),
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Boolean, LargeBinary, Index, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class SavedSearch(Base):
+    """
+    A runner's standing search in one event: a bib, a query vector (fused selfie/outfit
+    embedding), or both. Newly ingested photos are matched against it and hits land in
+    the runner's inbox (SavedSearchMatch).
+    """
+    __tablename__ = "saved_searches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clerk_user_id = Column(String, nullable=False, index=True) # Runners may not have a users row
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False, index=True)
+    bib = Column(String, nullable=True)
+    query_vector = Column(LargeBinary, nullable=True) # float32 bytes, L2-normalized
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class SavedSearchMatch(Base):
+    """A photo that matched a saved search when it was ingested: one inbox entry."""
+    __tablename__ = "saved_search_matches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    saved_search_id = Column(Integer, ForeignKey("saved_searches.id", ondelete="CASCADE"), nullable=False)
+    clerk_user_id = Column(String, nullable=False) # Denormalized so the inbox is one index range
+    photo_id = Column(Integer, ForeignKey("photos.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+    match_type = Column(String, nullable=False) # "bib" or "visual"
+    seen = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("saved_search_id", "photo_id", name="uq_saved_search_matches_search_photo"),
+        Index("ix_saved_search_matches_user_id", "clerk_user_id", "id"),
+    )
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, BigInteger, Boolean, Float, LargeBinary, Index
+
+from app.database import Base
+
+
+class PersonVector(Base):
+    """
+    Person embedding stored in the database, for the SQL vector store backend
+    (app/utils/vector_store.py). Rows mirror the FAISS vector metadata table, so the same
+    search filters apply; faiss_id is the id PersonEmbedding rows point at.
+    """
+    __tablename__ = "person_vectors"
+
+    faiss_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    embedding = Column(LargeBinary, nullable=False) # float32 bytes, L2-normalized
+
+    # Denormalized from photos so filtering needs no join
+    photo_id = Column(Integer, nullable=True, index=True)
+    event_id = Column(Integer, nullable=True)
+    photographer_id = Column(Integer, nullable=True)
+    is_public = Column(Boolean, nullable=False, default=False)
+    timestamp = Column(BigInteger, nullable=True) # Epoch seconds, like VectorMetadata
+    bbox_x = Column(Float, nullable=True)
+    bbox_y = Column(Float, nullable=True)
+    bbox_w = Column(Float, nullable=True)
+    bbox_h = Column(Float, nullable=True)
+    deleted = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index("ix_person_vectors_event_id_deleted", "event_id", "deleted"),
+    )
+
+
+class InactiveVectorEvent(Base):
+    """Events excluded by SearchFilter.active_events_only in the SQL vector store."""
+    __tablename__ = "person_vector_inactive_events"
+
+    event_id = Column(Integer, primary_key=True, autoincrement=False)
+
+
+class PersonVectorIdCounter(Base):
+    """
+    Single-row counter the SQL vector store allocates FAISS ids from. Adds bump it with an
+    UPDATE, which locks the row until their transaction ends, so concurrent adds in any
+    process get disjoint id ranges.
+    """
+    __tablename__ = "person_vector_ids"
+
+    id = Column(Integer, primary_key=True, autoincrement=False) # Always 1
+    next_id = Column(BigInteger, nullable=False)
@@ -8,6 +8,7 @@ from app.models.event import Event
 from app.models.photo import Photo
 from app.models.user import User
 from app.utils.auth import get_current_admin_user
+from app.utils.result_cache import get_search_result_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -52,6 +53,17 @@ def get_admin_stats(
     }
 
 
+@router.get("/search-cache")
+def get_search_cache_stats(
+    # Temporarily disable auth for development
+    # current_user = Depends(get_current_admin_user),
+):
+    """
+    Search result cache hit rate and size (admin only) - Auth temporarily disabled for development
+    """
+    return get_search_result_cache().stats()
+
+
 @router.get("/recent-activity")
 def get_recent_activity(
     # Temporarily disable auth for development
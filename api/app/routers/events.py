@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Body, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Body, UploadFile, File, Form, Response, Query
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from sqlalchemy import func
@@ -11,12 +11,17 @@ from app.database import get_db
 from app.schemas.event import Event, EventCreate, EventUpdate, EventSummary
 from app.utils.auth import get_current_active_user, get_current_admin_user
 from app.utils.file import is_valid_image, save_upload_file
+from app.utils.vector_store import get_vector_store
+from app.utils.result_cache import bump_ingest_watermark
+from app.utils.knn_graph import delete_event_graph
 from app import models, schemas
 from app.crud import (
     get_user,
     create_event as create_event_crud,
     get_event,
-    create_event_photographer_price
+    create_event_photographer_price,
+    list_photos_page,
+    decode_photo_cursor,
 )
 from app.models.user import User
 
@@ -215,27 +220,37 @@ def read_event(
 @router.get("/{event_id}/photos", response_model=List[Dict])
 def read_event_photos(
     event_id: int,
-    skip: int = 0, 
-    limit: int = 50, 
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
     """
-    Get photos for a specific event (public endpoint)
+    Get photos for a specific event (public endpoint), ordered by timestamp.
+
+    Paginated by keyset so deep pages cost the same as the first: pass the X-Next-Cursor
+    header of a response as `cursor` to get the next page (the header is absent on the last
+    page). `skip` is kept for old clients.
     """
     from app.models.event import Event as EventModel
-    from app.models.photo import Photo
-    
+
     # Check if event exists
-    event = db.query(EventModel).filter(EventModel.id == event_id).first()
-    if not event:
+    if db.query(EventModel.id).filter(EventModel.id == event_id).first() is None:
         raise HTTPException(status_code=404, detail="Event not found")
-    
-    # Query photos for this event
-    photos = db.query(Photo).filter(
-        Photo.event_id == event_id,
-        Photo.is_public == True
-    ).offset(skip).limit(limit).all()
-    
+
+    after = None
+    if cursor:
+        after = decode_photo_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    photos, next_cursor = list_photos_page(
+        db, event_id=event_id, after=after, limit=limit,
+        columns=("id", "thumbnail_path", "path", "bib_numbers", "timestamp"), offset=skip,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
     # Format the results
     result = []
     for photo in photos:
@@ -346,6 +361,10 @@ async def update_event(
             print(f"Database error during event update: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+        if is_active is not None:
+            get_vector_store().set_event_active(event.id, bool(event.is_active))
+            bump_ingest_watermark(event.id)
+
         # Get photo count
         photo_count = db.query(func.count(Photo.id)).filter(Photo.event_id == event.id).scalar()
 
@@ -392,6 +411,8 @@ def delete_event(
     # For now, just delete the event record
     db.delete(db_event)
     db.commit()
+    bump_ingest_watermark(event_id)
+    delete_event_graph(event_id)
 
     return # Return None for 204 No Content
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Body
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Body, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from fastapi.responses import FileResponse
@@ -7,14 +7,29 @@ from PIL import Image, ImageDraw, ImageFont
 import io
 import json
 import logging
+import hashlib
+import numpy as np
 
 from app.database import get_db
-from app.schemas.photo import Photo, PhotoCreate, PhotoUpdate, PhotoSummary, PhotoSearchResult
+from app.schemas.photo import Photo, PhotoCreate, PhotoUpdate, PhotoSummary, PhotoSearchResult, PhotoSearchPage, BibSuggestion
 from app.utils.auth import get_current_active_user, get_current_admin_user
-from app.utils.file import save_upload_file, is_valid_image
+from app.utils.file import save_upload_file, is_valid_image, read_capture_time
 from app.utils.bib_detection import bib_detector
-from app.utils.person_clip_utils import generate_and_prepare_person_embeddings
-from app.utils.faiss_utils import save_faiss_index
+from app.utils.person_clip_utils import (
+    generate_and_prepare_person_embeddings, embed_largest_person, get_clip_embedding_for_text, normalize_text_query
+)
+from app.utils.vector_store import get_vector_store
+from app.utils.vector_metadata import SearchFilter, to_epoch_seconds
+from app.utils.result_cache import get_search_result_cache, encode_cursor, decode_cursor, bump_ingest_watermark, TTLCache
+from app.crud.photo import get_photos_by_ids, parse_bib_numbers, sync_photo_bibs, list_photos_page, decode_photo_cursor
+from app.utils.bib_index import get_bib_index
+from app.utils.bib_expansion import expand_bib_hits
+from app.utils.identity_clusters import resolve_cluster, merge_cluster_ranking, release_detections
+from app.utils.knn_graph import get_event_graph
+from app.utils.combined_search import fuse_query_vectors, rank_combined, COMBINED_BIB_CANDIDATES
+from app.utils.group_search import rank_group
+from app.utils.saved_search_matching import match_new_photos
+from app.utils.temporal_index import get_temporal_index, TEMPORAL_WINDOW_SECONDS
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
@@ -23,20 +38,167 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/photos", tags=["photos"])
 
+def _match_saved_searches(db: Session, photo) -> None:
+    """Adds a newly ingested or retagged photo to the inboxes of the saved searches it matches."""
+    try:
+        match_new_photos(db, photo.event_id, [photo.id])
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Saved search matching failed for photo {photo.id}: {e}")
+
+
+def _refresh_bib_index(photo) -> None:
+    """Pushes a photo's committed bibs and visibility to the in-memory bib index."""
+    get_bib_index().update_photo(photo.id, photo.event_id, parse_bib_numbers(photo.bib_numbers), photo.is_public is not False)
+
+
+def _refresh_temporal_index(photo) -> None:
+    """Pushes a photo's committed event, photographer, capture time and visibility to the temporal index."""
+    get_temporal_index().update_photo(photo.id, photo.event_id, photo.photographer_id, photo.timestamp, photo.is_public is not False)
+
+
+def _sync_photo_vectors(db: Session, photo, event_changed: bool) -> None:
+    """
+    Pushes a photo's committed event, visibility and time to its people's vectors. When the
+    event changed, every column is rewritten through move_vectors, since a sharded index
+    keeps vectors on their event's node and gives moved ones new FAISS ids.
+    """
+    from app.models.embedding import PersonEmbedding
+    rows = db.query(
+        PersonEmbedding.id, PersonEmbedding.faiss_id,
+        PersonEmbedding.bbox_x, PersonEmbedding.bbox_y, PersonEmbedding.bbox_w, PersonEmbedding.bbox_h,
+    ).filter(PersonEmbedding.photo_id == photo.id).all()
+    if not rows:
+        return
+    faiss_ids = [row.faiss_id for row in rows]
+    columns = {
+        "event_id": [photo.event_id if photo.event_id is not None else -1] * len(rows),
+        "is_public": [photo.is_public is not False] * len(rows),
+        "timestamp": [to_epoch_seconds(photo.timestamp or photo.created_at)] * len(rows),
+    }
+    store = get_vector_store()
+    if not event_changed:
+        store.update_metadata(faiss_ids, **columns)
+        store.snapshot()
+        return
+
+    columns.update(
+        photo_id=[photo.id] * len(rows),
+        photographer_id=[photo.photographer_id if photo.photographer_id is not None else -1] * len(rows),
+        bbox=[[row.bbox_x, row.bbox_y, row.bbox_w, row.bbox_h] for row in rows],
+    )
+    new_ids = store.move_vectors(faiss_ids, columns)
+    if new_ids is None:
+        logger.error(f"Could not move the vectors of photo {photo.id} to event {photo.event_id}.")
+        return
+    store.snapshot()
+    moved = [{"id": row.id, "faiss_id": new_id} for row, new_id in zip(rows, new_ids) if new_id != row.faiss_id]
+    if moved:
+        try:
+            db.bulk_update_mappings(PersonEmbedding, moved)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Could not record the new FAISS ids of photo {photo.id}: {e}")
+
+
+# Person hits fetched per vector search; photos are ranked by their best hit, so this bounds
+# how many photos a search can return
+VECTOR_SEARCH_K = int(os.getenv("VECTOR_SEARCH_K", "2000"))
+# Most photos /batch hydrates per call
+PHOTO_BATCH_MAX = 300
+# Most selfies a group search takes
+GROUP_SEARCH_MAX_FACES = int(os.getenv("GROUP_SEARCH_MAX_FACES", "10"))
+
+# Display fields of public photos by id, for /batch. Dropped on edit here; other workers'
+# copies expire after the TTL
+_photo_display_cache = TTLCache(
+    max_entries=int(os.getenv("PHOTO_DISPLAY_CACHE_SIZE", "20000")),
+    ttl=float(os.getenv("PHOTO_DISPLAY_TTL_SECONDS", "300")),
+)
+
+
+def _forget_photo_display(photo_id: int) -> None:
+    _photo_display_cache.pop(photo_id)
+
+
+# Columns listings load; the rest (metadata, embedding paths, ...) stays unloaded
+PHOTO_LISTING_COLUMNS = ("id", "event_id", "thumbnail_path", "path", "bib_numbers", "timestamp")
+
 
 @router.get("/", response_model=List[PhotoSummary])
 def read_photos(
+    response: Response,
     event_id: Optional[int] = None,
     bib_number: Optional[str] = None,
+    cursor: Optional[str] = None,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
     """
-    Get photos with optional filtering by event or bib number
+    Get public photos with optional filtering by event or bib number.
+
+    Paginated by keyset: pass the X-Next-Cursor header of a response as `cursor` to get the
+    next page (the header is absent on the last page). `skip` is kept for old clients.
     """
-    # Placeholder - This would query photos from the database
-    return []
+    after = None
+    if cursor:
+        after = decode_photo_cursor(cursor)
+        if after is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    photos, next_cursor = list_photos_page(
+        db, event_id=event_id, bib=bib_number or None, after=after, limit=limit,
+        columns=PHOTO_LISTING_COLUMNS, offset=skip,
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return photos
+
+
+@router.get("/batch", response_model=List[PhotoSummary])
+def read_photos_batch(
+    ids: str = Query(..., description="Comma-separated photo ids"),
+    db: Session = Depends(get_db)
+):
+    """
+    Display fields of up to PHOTO_BATCH_MAX public photos in one call, in the order asked
+    for, e.g. to render a page of search results. Cached per id; the rest are loaded with
+    one IN query. Ids that don't exist or are hidden are left out.
+    """
+    try:
+        photo_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    if len(photo_ids) > PHOTO_BATCH_MAX:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {PHOTO_BATCH_MAX} ids per call")
+
+    from app.models.photo import Photo as PhotoModel
+    found = {}
+    missing = []
+    for photo_id in photo_ids:
+        cached = _photo_display_cache.get(photo_id)
+        if cached is not None:
+            found[photo_id] = cached
+        else:
+            missing.append(photo_id)
+    if missing:
+        for photo in get_photos_by_ids(db, missing, columns=(
+            PhotoModel.id, PhotoModel.event_id, PhotoModel.thumbnail_path, PhotoModel.path,
+            PhotoModel.bib_numbers, PhotoModel.timestamp, PhotoModel.is_public,
+        )):
+            if photo.is_public is False:
+                continue
+            found[photo.id] = {
+                "id": photo.id,
+                "event_id": photo.event_id,
+                "thumbnail_path": photo.thumbnail_path,
+                "path": photo.path,
+                "bib_numbers": photo.bib_numbers,
+                "timestamp": photo.timestamp,
+            }
+            _photo_display_cache.put(photo.id, found[photo.id])
+    return [found[photo_id] for photo_id in photo_ids if photo_id in found]
 
 
 @router.post("/upload", response_model=Photo, status_code=status.HTTP_201_CREATED)
@@ -122,15 +284,20 @@ async def upload_photo(
         thumbnail_path=thumbnail_path,
         photographer_id=photographer_id,
         bib_numbers=bib_numbers_str,
+        timestamp=read_capture_time(file_path), # From EXIF; None if the camera didn't record it
         is_public=True
         # body_embedding_path is not set here directly anymore if we link via PersonEmbedding table
     )
     
     try:
         db.add(new_photo)
+        db.flush() # Assigns the id the bib rows point at
+        sync_photo_bibs(db, new_photo)
         db.commit()
         db.refresh(new_photo)
         logger.info(f"Photo record created in DB with ID: {new_photo.id}")
+        _refresh_bib_index(new_photo)
+        _refresh_temporal_index(new_photo)
     except Exception as e:
         db.rollback()
         logger.error(f"Failed to create photo record in DB: {e}")
@@ -156,11 +323,11 @@ async def upload_photo(
             db.commit() # Commit PersonEmbedding records
             logger.info(f"Person embeddings for photo ID: {new_photo.id} committed to DB.")
             
-            logger.info(f"Attempting to save FAISS index after adding embeddings for photo ID: {new_photo.id}")
-            if save_faiss_index():
-                logger.info(f"FAISS index saved successfully after processing photo ID: {new_photo.id}.")
+            logger.info(f"Attempting to save vector store after adding embeddings for photo ID: {new_photo.id}")
+            if get_vector_store().snapshot():
+                logger.info(f"Vector store saved successfully after processing photo ID: {new_photo.id}.")
             else:
-                logger.warning(f"Failed to save FAISS index after processing photo ID: {new_photo.id}. Index might be stale.")
+                logger.warning(f"Failed to save vector store after processing photo ID: {new_photo.id}. Index might be stale.")
         elif embeddings_prepared_count == 0:
             logger.info(f"No person embeddings were generated or prepared for photo ID: {new_photo.id}.")
         # If embeddings_prepared_count is < 0, it would be an error code, but our function returns int >= 0
@@ -178,6 +345,10 @@ async def upload_photo(
         # Not raising HTTPException here as photo is already uploaded. This is a background processing failure.
         # Consider a background task system for more robust handling of this step.
 
+    # The photo's bibs and people are searchable now; cached searches over the event are stale
+    bump_ingest_watermark(new_photo.event_id)
+    _match_saved_searches(db, new_photo)
+
     # Prepare response (ensure all fields from Photo schema are present)
     # Refresh new_photo again in case PersonEmbedding processing changed related fields (though unlikely now)
     db.refresh(new_photo) 
@@ -199,56 +370,529 @@ async def upload_photo(
     }
 
 
+def _bib_ranking(db: Session, bib_number: str, event_id: Optional[int], expand: bool):
+    """
+    Photos tagged with exactly this bib (an index lookup on photo_bibs), then with `expand`
+    the untagged photos of the same runner and the frames shot around the tagged ones.
+    Returns put()'s arguments for the result cache.
+    """
+    from app.models.photo import Photo as PhotoModel
+    from app.models.photo_bib import PhotoBib
+    from app.models.event import Event as EventModel
+
+    query = db.query(PhotoModel).join(
+        PhotoBib, PhotoBib.photo_id == PhotoModel.id
+    ).join(
+        EventModel, PhotoModel.event_id == EventModel.id
+    ).filter(
+        PhotoBib.bib == bib_number,
+        PhotoModel.is_public == True,
+        EventModel.is_active == True
+    )
+    if event_id is not None:
+        query = query.filter(PhotoBib.event_id == event_id)
+    photos = query.order_by(PhotoModel.id).all()
+
+    photo_ids = [photo.id for photo in photos]
+    scores = [1.0] * len(photos) # For exact matches assign score 1.0
+    match_types = ["bib"] * len(photos)
+    if expand and photos:
+        expanded = [(photo_id, score, "visual") for photo_id, score in expand_bib_hits(db, photos)]
+        # Then the frames shot around each hit by the same photographer (bursts)
+        hits_by_event = {}
+        for photo in photos:
+            hits_by_event.setdefault(photo.event_id, []).append((photo.id, 1.0))
+        seen = set(photo_ids) | {photo_id for photo_id, _, _ in expanded}
+        for hit_event_id, hits in hits_by_event.items():
+            if hit_event_id is None:
+                continue
+            for photo_id, score in get_temporal_index().expand(db, hit_event_id, hits):
+                if photo_id not in seen:
+                    seen.add(photo_id)
+                    expanded.append((photo_id, score, "burst"))
+        expanded.sort(key=lambda item: -item[1])
+        for photo_id, score, match_type in expanded:
+            photo_ids.append(photo_id)
+            scores.append(score)
+            match_types.append(match_type)
+    return np.asarray(photo_ids, dtype=np.int64), np.asarray(scores, dtype=np.float32), match_types
+
+
+def _bib_search_token(db: Session, bib_number: str, event_id: Optional[int], expand: bool) -> str:
+    bib_number = bib_number.strip()
+    key = ("bib", bib_number, event_id, expand)
+    return get_search_result_cache().get_or_compute(
+        key, event_id, lambda: _bib_ranking(db, bib_number, event_id, expand)
+    )
+
+
 @router.get("/search", response_model=List[PhotoSearchResult])
 def search_photos(
     bib_number: Optional[str] = None,
+    expand: bool = False,
     db: Session = Depends(get_db)
 ):
     """
-    Search photos by bib number
+    Search photos by bib number; returns every match.
+    With `expand`, photos of the same runner where the bib wasn't read are added after the
+    exact matches, found by comparing the people already detected in the matched photos,
+    along with the frames shot just before and after the matches.
     """
     # Return empty array if no bib number is provided
-    if not bib_number:
+    if not bib_number or not bib_number.strip():
         return []
-    
-    from app.models.photo import Photo as PhotoModel
+
+    token = _bib_search_token(db, bib_number, None, expand)
+    return _ranked_page(db, token, 0, None)["results"]
+
+
+@router.get("/search/bib", response_model=PhotoSearchPage)
+def search_photos_by_bib(
+    bib_number: Optional[str] = None,
+    event_id: Optional[int] = None,
+    expand: bool = True,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Paginated bib search, optionally within one event. Unlike /search, expands the exact
+    matches by default (see `expand` there); pages after the first are served from the
+    cached result list.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+    if not bib_number or not bib_number.strip():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A bib number or a cursor is required")
+    return _ranked_page(db, _bib_search_token(db, bib_number, event_id, expand), 0, limit)
+
+
+def _ranked_page(db: Session, token: str, offset: int, limit: Optional[int]) -> dict:
+    """
+    Serves one page of a cached ranked photo list (see app.utils.result_cache), or the rest
+    of the list from `offset` if `limit` is None. Photos deleted since the search ran are skipped.
+    """
+    cached = get_search_result_cache().get(token)
+    if cached is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Search results expired, please search again")
+    photo_ids, scores, match_types = cached
+    if limit is None:
+        limit = max(len(photo_ids) - offset, 0)
+    page = slice(offset, offset + limit)
+    page_ids = photo_ids[page].tolist()
+    score_by_id = dict(zip(page_ids, scores[page].tolist()))
+    match_type_by_id = dict(zip(page_ids, match_types[page])) if match_types is not None else {}
+    photos = get_photos_by_ids(db, page_ids)
+    next_offset = offset + limit
+    return {
+        "results": [
+            {
+                "id": photo.id,
+                "event_id": photo.event_id,
+                "thumbnail_path": photo.thumbnail_path,
+                "path": photo.path,
+                "bib_numbers": photo.bib_numbers,
+                "score": score_by_id[photo.id],
+                "match_type": match_type_by_id.get(photo.id),
+            }
+            for photo in photos
+        ],
+        "total": len(photo_ids),
+        "next_cursor": encode_cursor(token, next_offset) if next_offset < len(photo_ids) else None,
+    }
+
+
+def _page_from_cursor(db: Session, cursor: str, limit: int) -> dict:
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    token, offset = decoded
+    return _ranked_page(db, token, offset, limit)
+
+
+def _vector_ranking(query_vector, search_filter: SearchFilter, exclude_photo_ids: Optional[List[int]] = None):
+    """
+    Runs a person vector search and ranks photos by their best matching person.
+    Returns put()'s arguments for the result cache.
+    """
+    store = get_vector_store()
+    result = store.search(query_vector.reshape(1, -1), VECTOR_SEARCH_K, search_filter=search_filter)
+    if result is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Vector search is unavailable")
+    photo_ids, scores = store.aggregate_to_photos(*result)
+    if exclude_photo_ids:
+        keep = ~np.isin(photo_ids, exclude_photo_ids)
+        photo_ids, scores = photo_ids[keep], scores[keep]
+    return photo_ids, scores
+
+
+def _identity_ranking(db: Session, cluster_id: int, score: float, vector_ranking,
+                      exclude_photo_ids: Optional[List[int]] = None):
+    """
+    A vector ranking with an identity cluster's photos merged in (see merge_cluster_ranking),
+    as put()'s arguments for the result cache.
+    """
+    return merge_cluster_ranking(db, cluster_id, score, *vector_ranking, exclude_photo_ids=exclude_photo_ids or ())
+
+
+def _cached_search_page(db: Session, key: tuple, event_id: Optional[int], compute, limit: int) -> dict:
+    """First page of a search, computed only if the cache has no current result for `key`."""
+    token = get_search_result_cache().get_or_compute(key, event_id, compute)
+    return _ranked_page(db, token, 0, limit)
+
+
+@router.post("/search/selfie", response_model=PhotoSearchPage)
+def search_photos_by_selfie(
+    event_id: int,
+    selfie: Optional[UploadFile] = File(None),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Find photos of a runner in an event from a selfie.
+    The largest person in the selfie is embedded and matched against the people detected in
+    the event's photos; each photo is scored by its best matching person. If it also matches
+    one of the event's identity clusters, the cluster's photos are ranked in as well. Pass
+    the returned next_cursor (without the selfie) to get the next page.
+    Re-uploading the same image reuses the cached result without running the models.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+    if selfie is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A selfie or a cursor is required")
+    if not is_valid_image(selfie.filename):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not a valid image. Supported formats: .jpg, .jpeg, .png"
+        )
+
     from app.models.event import Event as EventModel
-    from sqlalchemy import or_
-    
-    # Look for photos with this bib number
-    query = db.query(PhotoModel).join(
-        EventModel, PhotoModel.event_id == EventModel.id
-    ).filter(
-        PhotoModel.is_public == True,
-        EventModel.is_active == True,
-        or_(
-            PhotoModel.bib_numbers.ilike(f"%{bib_number}%"),
-            PhotoModel.bib_numbers == bib_number,
-            PhotoModel.bib_numbers.ilike(f"{bib_number},%"),
-            PhotoModel.bib_numbers.ilike(f"%,{bib_number},%"),
-            PhotoModel.bib_numbers.ilike(f"%,{bib_number}")
+    if db.query(EventModel.id).filter(EventModel.id == event_id).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+
+    content = selfie.file.read()
+
+    def compute():
+        try:
+            image = Image.open(io.BytesIO(content)).convert("RGB")
+        except Exception as e:
+            logger.warning(f"Could not read selfie for event {event_id}: {e}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not read the uploaded image")
+        query_vector = embed_largest_person(image)
+        if query_vector is None:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not embed the selfie")
+        ranking = _vector_ranking(query_vector, search_filter)
+        resolved = resolve_cluster(db, event_id, query_vector)
+        if resolved is not None:
+            return _identity_ranking(db, *resolved, ranking)
+        return ranking
+
+    search_filter = SearchFilter.for_event(event_id)
+    key = ("selfie", hashlib.sha256(content).hexdigest(), event_id, search_filter)
+    return _cached_search_page(db, key, event_id, compute, limit)
+
+
+@router.post("/search/group", response_model=PhotoSearchPage)
+def search_photos_by_group(
+    event_id: int,
+    selfies: Optional[List[UploadFile]] = File(None),
+    k: Optional[List[int]] = Form(None),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Find photos of a group of runners in an event (or of one runner from several selfies).
+    Each selfie's largest person is a face of the query; `k` optionally gives the number
+    of person hits to fetch per face, in upload order (default VECTOR_SEARCH_K each). All
+    faces are searched in one batched call and photos showing more of the group rank
+    first. Pass the returned next_cursor (without the selfies) to get the next page.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+    if not selfies:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Selfies or a cursor are required")
+    if len(selfies) > GROUP_SEARCH_MAX_FACES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {GROUP_SEARCH_MAX_FACES} selfies can be searched together"
+        )
+    if k is not None and len(k) != len(selfies):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Give one k per selfie")
+    if any(not is_valid_image(selfie.filename) for selfie in selfies):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not a valid image. Supported formats: .jpg, .jpeg, .png"
+        )
+    ks = [min(max(value, 1), VECTOR_SEARCH_K) for value in k] if k is not None else [VECTOR_SEARCH_K] * len(selfies)
+
+    from app.models.event import Event as EventModel
+    if db.query(EventModel.id).filter(EventModel.id == event_id).first() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+
+    contents = [selfie.file.read() for selfie in selfies]
+
+    def compute():
+        query_vectors = []
+        for content in contents:
+            try:
+                image = Image.open(io.BytesIO(content)).convert("RGB")
+            except Exception as e:
+                logger.warning(f"Could not read group selfie for event {event_id}: {e}")
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not read an uploaded image")
+            query_vector = embed_largest_person(image)
+            if query_vector is None:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not embed a selfie")
+            query_vectors.append(np.asarray(query_vector, dtype=np.float32).reshape(-1))
+        ranking = rank_group(np.vstack(query_vectors), ks, search_filter)
+        if ranking is None:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Vector search is unavailable")
+        return ranking
+
+    search_filter = SearchFilter.for_event(event_id)
+    key = ("group", tuple(hashlib.sha256(content).hexdigest() for content in contents), tuple(ks), event_id, search_filter)
+    return _cached_search_page(db, key, event_id, compute, limit)
+
+
+@router.get("/search/text", response_model=PhotoSearchPage)
+def search_photos_by_text(
+    q: Optional[str] = Query(None, max_length=200),
+    event_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Find photos by outfit description, e.g. "red shirt, blue shorts".
+    The text is embedded with CLIP (cached, so repeated queries skip the model) and matched
+    against the people detected in photos, optionally within one event.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+    if not q or not q.strip():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A query or a cursor is required")
+
+    def compute():
+        query_vector = get_clip_embedding_for_text(q)
+        if query_vector is None:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not embed the query")
+        return _vector_ranking(query_vector, search_filter)
+
+    search_filter = SearchFilter.for_event(event_id)
+    key = ("text", normalize_text_query(q), event_id, search_filter)
+    return _cached_search_page(db, key, event_id, compute, limit)
+
+
+@router.post("/search/combined", response_model=PhotoSearchPage)
+def search_photos_combined(
+    event_id: int,
+    selfie: Optional[UploadFile] = File(None),
+    q: Optional[str] = Form(None, max_length=200),
+    bib: Optional[str] = Form(None, max_length=20),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Find photos of a runner in an event from any mix of a selfie, an outfit description
+    (`q`) and a roughly known bib. The selfie and text embeddings are fused into one query;
+    a bib restricts the candidates to photos with a matching or close bib (exact, OCR
+    confusion, prefix, one edit), which are then scored together in one pass. Pass the
+    returned next_cursor (without the other fields) to get the next page.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+    q = q if q and q.strip() else None
+    bib = bib.strip() if bib and bib.strip() else None
+    if selfie is None and q is None and bib is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A selfie, a description, a bib or a cursor is required")
+    if selfie is not None and not is_valid_image(selfie.filename):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File is not a valid image. Supported formats: .jpg, .jpeg, .png"
         )
+
+    from app.models.event import Event as EventModel
+    event = db.query(EventModel.id, EventModel.is_active).filter(EventModel.id == event_id).first()
+    if event is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+
+    content = selfie.file.read() if selfie is not None else None
+
+    def compute():
+        selfie_vector = text_vector = None
+        if content is not None:
+            try:
+                image = Image.open(io.BytesIO(content)).convert("RGB")
+            except Exception as e:
+                logger.warning(f"Could not read selfie for event {event_id}: {e}")
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Could not read the uploaded image")
+            selfie_vector = embed_largest_person(image)
+            if selfie_vector is None:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not embed the selfie")
+        if q is not None:
+            text_vector = get_clip_embedding_for_text(q)
+            if text_vector is None:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not embed the query")
+        bib_photos = None
+        if bib is not None:
+            # The bib index only holds public photos; inactive events have none to offer
+            bib_photos = get_bib_index().photos_for_query(db, event_id, bib, COMBINED_BIB_CANDIDATES) if event.is_active else {}
+        ranking = rank_combined(db, event_id, fuse_query_vectors(selfie_vector, text_vector), bib_photos, VECTOR_SEARCH_K)
+        if ranking is None:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Vector search is unavailable")
+        return ranking
+
+    key = (
+        "combined", hashlib.sha256(content).hexdigest() if content is not None else None,
+        normalize_text_query(q) if q is not None else None, bib, event_id,
     )
-    
-    photos = query.all()
-    
-    # Format results
-    results = []
-    for photo in photos:
-        results.append({
-            "id": photo.id,
-            "event_id": photo.event_id,
-            "thumbnail_path": photo.thumbnail_path,
-            "path": photo.path,
-            "bib_numbers": photo.bib_numbers,
-            "score": 1.0  # For exact matches assign score 1.0
-        })
-    
-    # If no results, return empty list
-    if not results:
+    return _cached_search_page(db, key, event_id, compute, limit)
+
+
+@router.get("/search/person/{person_embedding_id}", response_model=PhotoSearchPage)
+def search_photos_by_person(
+    person_embedding_id: int,
+    event_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    "Find more of this person": other photos showing a person detected in a gallery photo.
+    Queries with the detection's stored vector, so nothing is re-encoded. Within the
+    detection's own event, the other photos of its identity cluster are ranked in as well.
+    """
+    if cursor:
+        return _page_from_cursor(db, cursor, limit)
+
+    from app.models.embedding import PersonEmbedding
+    from app.models.photo import Photo as PhotoModel
+    detection = db.query(
+        PersonEmbedding.faiss_id, PersonEmbedding.photo_id, PersonEmbedding.event_id, PersonEmbedding.cluster_id
+    ).join(
+        PhotoModel, PhotoModel.id == PersonEmbedding.photo_id
+    ).filter(
+        PersonEmbedding.id == person_embedding_id,
+        PhotoModel.is_public == True
+    ).first()
+    if detection is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+
+    def compute():
+        clustered = detection.cluster_id is not None and event_id == detection.event_id
+        found_ids, vectors = get_vector_store().get_vectors([detection.faiss_id])
+        if len(found_ids):
+            ranking = _vector_ranking(vectors[0], search_filter, exclude_photo_ids=[detection.photo_id])
+        elif clustered:
+            ranking = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        else:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person is no longer indexed")
+        if clustered:
+            return _identity_ranking(db, detection.cluster_id, 1.0, ranking, exclude_photo_ids=[detection.photo_id])
+        return ranking
+
+    if event_id is None:
+        event_id = detection.event_id
+    search_filter = SearchFilter.for_event(event_id)
+    key = ("person", person_embedding_id, event_id, search_filter)
+    return _cached_search_page(db, key, event_id, compute, limit)
+
+
+@router.get("/{photo_id}/similar", response_model=List[PhotoSearchResult])
+def read_similar_photos(
+    photo_id: int,
+    limit: int = Query(24, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    "More photos like this" for a photo page: photos of the same event whose people are
+    nearest to this photo's people in the event's precomputed kNN graph
+    (app/utils/knn_graph.py), so no vector search runs. Empty until the graph is built.
+    """
+    from app.models.photo import Photo as PhotoModel
+    photo = db.query(PhotoModel.id, PhotoModel.event_id).filter(
+        PhotoModel.id == photo_id, PhotoModel.is_public == True
+    ).first()
+    if photo is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
+    graph = get_event_graph(photo.event_id) if photo.event_id is not None else None
+    if graph is None:
         return []
-        
-    return results
+
+    # Over-fetch a little: hidden or deleted photos are still in the graph
+    similar = graph.similar_photos(photo_id, limit * 2)
+    score_by_id = dict(similar)
+    photos = get_photos_by_ids(db, [other for other, _ in similar], columns=(
+        PhotoModel.id, PhotoModel.event_id, PhotoModel.thumbnail_path, PhotoModel.path,
+        PhotoModel.bib_numbers, PhotoModel.is_public,
+    ))
+    return [
+        {
+            "id": other.id,
+            "event_id": other.event_id,
+            "thumbnail_path": other.thumbnail_path,
+            "path": other.path,
+            "bib_numbers": other.bib_numbers,
+            "score": score_by_id[other.id],
+            "match_type": "similar",
+        }
+        for other in photos if other.is_public is not False
+    ][:limit]
+
+
+@router.get("/{photo_id}/nearby", response_model=List[PhotoSearchResult])
+def read_nearby_photos(
+    photo_id: int,
+    seconds: float = Query(TEMPORAL_WINDOW_SECONDS, gt=0, le=300),
+    limit: int = Query(24, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Frames the same photographer shot within ±`seconds` of a photo (its burst), nearest
+    first, from the in-memory temporal index. Empty if the photo has no capture time.
+    """
+    from app.models.photo import Photo as PhotoModel
+    photo = db.query(PhotoModel.id, PhotoModel.event_id).filter(
+        PhotoModel.id == photo_id, PhotoModel.is_public == True
+    ).first()
+    if photo is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
+    if photo.event_id is None:
+        return []
+
+    nearby = get_temporal_index().expand(db, photo.event_id, [(photo_id, 1.0)], seconds=seconds)[:limit]
+    score_by_id = dict(nearby)
+    photos = get_photos_by_ids(db, [other for other, _ in nearby], columns=(
+        PhotoModel.id, PhotoModel.event_id, PhotoModel.thumbnail_path, PhotoModel.path, PhotoModel.bib_numbers,
+    ))
+    return [
+        {
+            "id": other.id,
+            "event_id": other.event_id,
+            "thumbnail_path": other.thumbnail_path,
+            "path": other.path,
+            "bib_numbers": other.bib_numbers,
+            "score": score_by_id[other.id],
+            "match_type": "burst",
+        }
+        for other in photos
+    ]
+
+
+@router.get("/bibs/suggest", response_model=List[BibSuggestion])
+def suggest_bibs(
+    event_id: int,
+    q: str = Query(..., max_length=20),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Bib autocomplete for an event's search box: exact, OCR-confusable (1/7, 0/8, ...),
+    prefix and one-edit matches, from the in-memory bib index.
+    """
+    return get_bib_index().suggest(db, event_id, q, limit)
 
 
 @router.get("/watermarked/{photo_id}")
@@ -373,6 +1017,7 @@ async def update_photo(
     photo = db.query(PhotoModel).filter(PhotoModel.id == photo_id).first()
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
+    old_event_id = photo.event_id
     
     # Update fields if provided in the request
     if photo_update.bib_numbers is not None:
@@ -398,6 +1043,18 @@ async def update_photo(
     
     if photo_update.is_public is not None:
         photo.is_public = photo_update.is_public
+
+    if photo_update.bib_numbers is not None or photo_update.event_id is not None:
+        sync_photo_bibs(db, photo)
+
+    event_changed = photo.event_id != old_event_id
+    if event_changed:
+        # Detections carry their photo's event for person search, clusters and kNN graphs; they
+        # leave their old event's clusters and are clustered again in the new event
+        from app.models.embedding import PersonEmbedding
+        release_detections(db, [photo.id])
+        db.query(PersonEmbedding).filter(PersonEmbedding.photo_id == photo.id).update(
+            {PersonEmbedding.event_id: photo.event_id}, synchronize_session=False)
     
     # Save changes to database
     try:
@@ -406,6 +1063,21 @@ async def update_photo(
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating photo: {str(e)}")
+
+    if photo_update.bib_numbers is not None or photo_update.event_id is not None or photo_update.is_public is not None:
+        _refresh_bib_index(photo)
+    if photo_update.event_id is not None or photo_update.is_public is not None or photo_update.timestamp is not None:
+        _refresh_temporal_index(photo)
+    bump_ingest_watermark(old_event_id)
+    if event_changed:
+        bump_ingest_watermark(photo.event_id)
+    _forget_photo_display(photo.id)
+    if photo_update.bib_numbers is not None or photo_update.event_id is not None or photo_update.is_public:
+        _match_saved_searches(db, photo)
+
+    # Keep the vector metadata in line with the photo's event, visibility and time
+    if photo_update.event_id is not None or photo_update.is_public is not None or photo_update.timestamp is not None:
+        _sync_photo_vectors(db, photo, event_changed)
     
     # Return updated photo
     return {
@@ -454,13 +1126,14 @@ async def untag_photo(
         return {"message": "Photo has no bib numbers"}
     
     # Convert comma-separated string to list
-    bib_list = photo.bib_numbers.split(",")
+    bib_list = parse_bib_numbers(photo.bib_numbers)
     
     # Remove the specified bib number if it exists
     if bib_number in bib_list:
         bib_list.remove(bib_number)
         # Convert back to comma-separated string or None if empty
         photo.bib_numbers = ",".join(bib_list) if bib_list else None
+        sync_photo_bibs(db, photo)
         
         # Save changes to database
         try:
@@ -468,6 +1141,9 @@ async def untag_photo(
         except Exception as e:
             db.rollback()
             raise HTTPException(status_code=500, detail=f"Error updating photo: {str(e)}")
+        _refresh_bib_index(photo)
+        bump_ingest_watermark(photo.event_id)
+        _forget_photo_display(photo.id)
         
         return {"message": f"Bib number {bib_number} removed from photo {photo_id}"}
     else:
@@ -513,6 +1189,7 @@ async def delete_photo(
     photo = db.query(PhotoModel).filter(PhotoModel.id == photo_id).first()
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
+    event_id = photo.event_id
     
     # Get file paths to delete from disk
     file_paths = []
@@ -521,13 +1198,33 @@ async def delete_photo(
     if photo.thumbnail_path:
         file_paths.append(os.path.join(os.getcwd(), photo.thumbnail_path.lstrip('/')))
     
+    # Person embeddings reference the photo; drop them with it and tombstone their vectors
+    from app.models.embedding import PersonEmbedding
+    embeddings_query = db.query(PersonEmbedding).filter(PersonEmbedding.photo_id == photo_id)
+    faiss_ids = [row.faiss_id for row in embeddings_query.with_entities(PersonEmbedding.faiss_id)]
+
     # Delete from database first
+    from app.models.photo_bib import PhotoBib
+    from app.models.saved_search import SavedSearchMatch
     try:
+        release_detections(db, [photo_id])
+        embeddings_query.delete(synchronize_session=False)
+        db.query(PhotoBib).filter(PhotoBib.photo_id == photo_id).delete(synchronize_session=False)
+        db.query(SavedSearchMatch).filter(SavedSearchMatch.photo_id == photo_id).delete(synchronize_session=False)
         db.delete(photo)
         db.commit()
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting photo from database: {str(e)}")
+    get_bib_index().remove_photo(photo_id)
+    get_temporal_index().remove_photo(photo_id)
+    bump_ingest_watermark(event_id)
+    _forget_photo_display(photo_id)
+
+    if faiss_ids:
+        store = get_vector_store()
+        store.delete(faiss_ids)
+        store.snapshot()
     
     # Then attempt to delete files from disk
     for path in file_paths:
@@ -0,0 +1,216 @@
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Body
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import List, Dict, Any, Optional
+from PIL import Image
+import io
+import logging
+
+from app.database import get_db
+from app.schemas.saved_search import SavedSearch, SavedSearchInbox
+from app.utils.auth import get_current_active_user
+from app.utils.file import is_valid_image
+from app.utils.person_clip_utils import embed_largest_person, get_clip_embedding_for_text
+from app.utils.combined_search import fuse_query_vectors
+from app.utils.saved_search_matching import invalidate_event_searches, MAX_SAVED_SEARCHES_PER_USER
+from app.models.saved_search import SavedSearch as SavedSearchModel, SavedSearchMatch as SavedSearchMatchModel
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/saved-searches", tags=["saved-searches"])
+
+
+def _clerk_user_id(claims: Dict[str, Any]) -> str:
+    clerk_user_id = claims.get('sub')
+    if not clerk_user_id:
+        raise HTTPException(status_code=401, detail="User ID missing from token claims")
+    return clerk_user_id
+
+
+def _saved_search_out(search: SavedSearchModel, unseen_count: int = 0) -> dict:
+    return {
+        "id": search.id,
+        "event_id": search.event_id,
+        "bib": search.bib,
+        "has_query_vector": search.query_vector is not None,
+        "unseen_count": unseen_count,
+        "created_at": search.created_at,
+    }
+
+
+@router.post("/", response_model=SavedSearch, status_code=status.HTTP_201_CREATED)
+def create_saved_search(
+    event_id: int = Form(...),
+    bib: Optional[str] = Form(None, max_length=20),
+    q: Optional[str] = Form(None, max_length=200),
+    selfie: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
+    claims: Dict[str, Any] = Depends(get_current_active_user)
+):
+    """
+    Save a search in an event: a bib, a selfie and/or an outfit description (fused into one
+    query vector, as in the combined search). Photos ingested from now on that match it are
+    added to the inbox.
+    """
+    clerk_user_id = _clerk_user_id(claims)
+    bib = bib.strip() if bib and bib.strip() else None
+    q = q if q and q.strip() else None
+    if bib is None and q is None and selfie is None:
+        raise HTTPException(status_code=400, detail="A bib, a selfie or a description is required")
+
+    from app.models.event import Event as EventModel
+    if db.query(EventModel.id).filter(EventModel.id == event_id).first() is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    saved_count = db.query(func.count(SavedSearchModel.id)).filter(SavedSearchModel.clerk_user_id == clerk_user_id).scalar()
+    if saved_count >= MAX_SAVED_SEARCHES_PER_USER:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SAVED_SEARCHES_PER_USER} saved searches are allowed")
+
+    selfie_vector = text_vector = None
+    if selfie is not None:
+        if not is_valid_image(selfie.filename):
+            raise HTTPException(status_code=400, detail="File is not a valid image. Supported formats: .jpg, .jpeg, .png")
+        try:
+            image = Image.open(io.BytesIO(selfie.file.read())).convert("RGB")
+        except Exception as e:
+            logger.warning(f"Could not read selfie for saved search in event {event_id}: {e}")
+            raise HTTPException(status_code=400, detail="Could not read the uploaded image")
+        selfie_vector = embed_largest_person(image)
+        if selfie_vector is None:
+            raise HTTPException(status_code=500, detail="Could not embed the selfie")
+    if q is not None:
+        text_vector = get_clip_embedding_for_text(q)
+        if text_vector is None:
+            raise HTTPException(status_code=500, detail="Could not embed the query")
+    query_vector = fuse_query_vectors(selfie_vector, text_vector)
+
+    search = SavedSearchModel(
+        clerk_user_id=clerk_user_id,
+        event_id=event_id,
+        bib=bib,
+        query_vector=query_vector.tobytes() if query_vector is not None else None,
+    )
+    db.add(search)
+    db.commit()
+    db.refresh(search)
+    invalidate_event_searches(event_id)
+    return _saved_search_out(search)
+
+
+@router.get("/", response_model=List[SavedSearch])
+def read_saved_searches(
+    db: Session = Depends(get_db),
+    claims: Dict[str, Any] = Depends(get_current_active_user)
+):
+    """The current user's saved searches, each with its number of unseen matches."""
+    from app.models.photo import Photo as PhotoModel
+
+    clerk_user_id = _clerk_user_id(claims)
+    searches = db.query(SavedSearchModel).filter(
+        SavedSearchModel.clerk_user_id == clerk_user_id
+    ).order_by(SavedSearchModel.id).all()
+    unseen = dict(
+        db.query(SavedSearchMatchModel.saved_search_id, func.count(SavedSearchMatchModel.id))
+        .join(PhotoModel, PhotoModel.id == SavedSearchMatchModel.photo_id)
+        .filter(
+            SavedSearchMatchModel.clerk_user_id == clerk_user_id,
+            SavedSearchMatchModel.seen == False,
+            PhotoModel.is_public == True
+        )
+        .group_by(SavedSearchMatchModel.saved_search_id)
+        .all()
+    )
+    return [_saved_search_out(search, unseen.get(search.id, 0)) for search in searches]
+
+
+@router.delete("/{saved_search_id}", status_code=200)
+def delete_saved_search(
+    saved_search_id: int,
+    db: Session = Depends(get_db),
+    claims: Dict[str, Any] = Depends(get_current_active_user)
+):
+    """Delete one of the current user's saved searches and its inbox entries."""
+    clerk_user_id = _clerk_user_id(claims)
+    search = db.query(SavedSearchModel).filter(
+        SavedSearchModel.id == saved_search_id, SavedSearchModel.clerk_user_id == clerk_user_id
+    ).first()
+    if search is None:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    event_id = search.event_id
+    db.query(SavedSearchMatchModel).filter(SavedSearchMatchModel.saved_search_id == saved_search_id).delete(synchronize_session=False)
+    db.delete(search)
+    db.commit()
+    invalidate_event_searches(event_id)
+    return {"message": "Saved search deleted successfully"}
+
+
+@router.get("/inbox", response_model=SavedSearchInbox)
+def read_inbox(
+    unseen_only: bool = False,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    claims: Dict[str, Any] = Depends(get_current_active_user)
+):
+    """
+    New photos that matched the current user's saved searches, newest first. Pass
+    next_before_id back as `before_id` for older entries.
+    """
+    from app.models.photo import Photo as PhotoModel
+
+    clerk_user_id = _clerk_user_id(claims)
+    query = db.query(SavedSearchMatchModel, PhotoModel.event_id, PhotoModel.thumbnail_path, PhotoModel.path).join(
+        PhotoModel, PhotoModel.id == SavedSearchMatchModel.photo_id
+    ).filter(
+        SavedSearchMatchModel.clerk_user_id == clerk_user_id,
+        PhotoModel.is_public == True
+    )
+    if unseen_only:
+        query = query.filter(SavedSearchMatchModel.seen == False)
+    if before_id is not None:
+        query = query.filter(SavedSearchMatchModel.id < before_id)
+    rows = query.order_by(SavedSearchMatchModel.id.desc()).limit(limit + 1).all()
+
+    unseen_count = db.query(func.count(SavedSearchMatchModel.id)).join(
+        PhotoModel, PhotoModel.id == SavedSearchMatchModel.photo_id
+    ).filter(
+        SavedSearchMatchModel.clerk_user_id == clerk_user_id,
+        SavedSearchMatchModel.seen == False,
+        PhotoModel.is_public == True
+    ).scalar()
+    return {
+        "matches": [
+            {
+                "id": match.id,
+                "saved_search_id": match.saved_search_id,
+                "photo_id": match.photo_id,
+                "event_id": event_id,
+                "thumbnail_path": thumbnail_path,
+                "path": path,
+                "score": match.score,
+                "match_type": match.match_type,
+                "seen": match.seen,
+                "created_at": match.created_at,
+            }
+            for match, event_id, thumbnail_path, path in rows[:limit]
+        ],
+        "unseen_count": unseen_count,
+        "next_before_id": rows[limit - 1][0].id if len(rows) > limit else None,
+    }
+
+
+@router.post("/inbox/seen", status_code=200)
+def mark_inbox_seen(
+    up_to_id: Optional[int] = Body(None, embed=True),
+    db: Session = Depends(get_db),
+    claims: Dict[str, Any] = Depends(get_current_active_user)
+):
+    """Mark the current user's inbox entries as seen, all of them or those with id <= up_to_id."""
+    clerk_user_id = _clerk_user_id(claims)
+    query = db.query(SavedSearchMatchModel).filter(
+        SavedSearchMatchModel.clerk_user_id == clerk_user_id, SavedSearchMatchModel.seen == False
+    )
+    if up_to_id is not None:
+        query = query.filter(SavedSearchMatchModel.id <= up_to_id)
+    updated = query.update({SavedSearchMatchModel.seen: True}, synchronize_session=False)
+    db.commit()
+    return {"updated": updated}
@@ -67,6 +67,7 @@ class PhotoSummary(BaseModel):
     id: int
     event_id: int
     thumbnail_path: str
+    path: Optional[str] = None
     bib_numbers: Optional[str] = None
     timestamp: Optional[datetime] = None
 
@@ -82,6 +83,21 @@ class PhotoSearchResult(BaseModel):
     path: str
     bib_numbers: Optional[str] = None
     score: Optional[float] = None  # Similarity score for vector searches
+    match_type: Optional[str] = None  # "bib" for tagged photos, "visual" for photos found by appearance, "burst" for frames shot around a hit
 
     class Config:
         from_attributes = True
+
+
+# A page of ranked vector search results
+class PhotoSearchPage(BaseModel):
+    results: List[PhotoSearchResult]
+    total: int  # Photos in the full ranked list
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for the next page; None on the last page
+
+
+# Bib autocomplete entry
+class BibSuggestion(BaseModel):
+    bib: str
+    match: str  # "exact", "ocr", "prefix" or "fuzzy"
+    photo_count: int
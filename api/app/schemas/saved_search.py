@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+
+class SavedSearch(BaseModel):
+    id: int
+    event_id: int
+    bib: Optional[str] = None
+    has_query_vector: bool  # Saved with a selfie and/or outfit description
+    unseen_count: int = 0
+    created_at: Optional[datetime] = None
+
+
+# One inbox entry: a newly ingested photo that matched a saved search
+class SavedSearchMatch(BaseModel):
+    id: int
+    saved_search_id: int
+    photo_id: int
+    event_id: int
+    thumbnail_path: str
+    path: str
+    score: float
+    match_type: str  # "bib" or "visual"
+    seen: bool
+    created_at: Optional[datetime] = None
+
+
+class SavedSearchInbox(BaseModel):
+    matches: List[SavedSearchMatch]
+    unseen_count: int
+    next_before_id: Optional[int] = None  # Pass back as `before_id` for older entries
@@ -0,0 +1,111 @@
+"""
+Bib-seeded expansion: finds photos of a runner whose bib isn't readable.
+
+For the photos a bib search matched, the person most likely wearing the bib is picked
+from the stored detections, their already-indexed vectors are fetched (no YOLO or CLIP
+run), and those vectors query the same event for visually matching photos.
+"""
+
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.crud.photo import parse_bib_numbers
+from app.utils.vector_metadata import SearchFilter
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+BIB_EXPANSION_MAX_SEEDS = int(os.getenv("BIB_EXPANSION_MAX_SEEDS", "20"))
+BIB_EXPANSION_K = int(os.getenv("BIB_EXPANSION_K", "200")) # Hits per seed
+# Cosine similarity a photo's best person needs to count as the same runner
+BIB_EXPANSION_MIN_SCORE = float(os.getenv("BIB_EXPANSION_MIN_SCORE", "0.85"))
+# Expansion scores are scaled by this so they always rank below exact bib hits (score 1.0)
+BIB_EXPANSION_WEIGHT = 0.9
+# A photo's score averages its best matches against this many seeds, so one wrongly
+# picked seed box can't pull in a stranger on its own
+BIB_EXPANSION_VOTES = 3
+
+
+def _bib_wearer_score(bbox_x: float, bbox_w: float, bbox_h: float) -> float:
+    """
+    How likely a detection is the runner whose bib was read: readable bibs belong to large,
+    central people. bbox_x is the normalized box center.
+    """
+    return bbox_w * bbox_h * (1.0 - abs(bbox_x - 0.5))
+
+
+def select_seed_detections(db: Session, photos: Sequence) -> Dict[int, List[int]]:
+    """
+    Picks one detection per bib-matched photo as the likely bib wearer.
+    Photos with a single tagged bib and few people come first, since their pick is the
+    most reliable; at most BIB_EXPANSION_MAX_SEEDS are kept.
+
+    Returns:
+        Dict[int, List[int]]: FAISS IDs of the picked detections, grouped by event id.
+    """
+    from app.models.embedding import PersonEmbedding
+
+    photos_by_id = {photo.id: photo for photo in photos}
+    detections = defaultdict(list)
+    rows = db.query(
+        PersonEmbedding.photo_id, PersonEmbedding.faiss_id,
+        PersonEmbedding.bbox_x, PersonEmbedding.bbox_w, PersonEmbedding.bbox_h,
+    ).filter(PersonEmbedding.photo_id.in_(list(photos_by_id)))
+    for photo_id, faiss_id, bbox_x, bbox_w, bbox_h in rows:
+        detections[photo_id].append((_bib_wearer_score(bbox_x, bbox_w, bbox_h), faiss_id))
+
+    ranked = sorted(
+        detections,
+        key=lambda photo_id: (len(parse_bib_numbers(photos_by_id[photo_id].bib_numbers)), len(detections[photo_id])),
+    )
+    seeds = defaultdict(list)
+    for photo_id in ranked[:BIB_EXPANSION_MAX_SEEDS]:
+        _, faiss_id = max(detections[photo_id])
+        seeds[photos_by_id[photo_id].event_id].append(faiss_id)
+    return seeds
+
+
+def expand_bib_hits(db: Session, bib_photos: Sequence) -> List[Tuple[int, float]]:
+    """
+    Finds photos in the same events that show the runner(s) of the bib-matched photos.
+
+    Args:
+        db (Session): The SQLAlchemy DB session.
+        bib_photos (Sequence): Photo rows that matched the bib.
+
+    Returns:
+        List[Tuple[int, float]]: (photo_id, score) for matching photos not already in
+        bib_photos, best first. Scores are below 1.0, the score of an exact bib hit.
+    """
+    if not bib_photos:
+        return []
+    store = get_vector_store()
+    matched = {photo.id for photo in bib_photos}
+    best: Dict[int, float] = {}
+    for event_id, seed_ids in select_seed_detections(db, bib_photos).items():
+        found_ids, seeds = store.get_vectors(seed_ids)
+        if not len(found_ids):
+            continue
+        result = store.search(seeds, BIB_EXPANSION_K, search_filter=SearchFilter.for_event(event_id))
+        if result is None:
+            logger.warning(f"Bib expansion search failed for event {event_id}.")
+            continue
+        distances, indices = result
+        # Best match of each photo against each seed, then the mean of its top votes
+        votes = defaultdict(list)
+        for row in range(len(found_ids)):
+            photo_ids, scores = store.aggregate_to_photos(distances[row:row + 1], indices[row:row + 1])
+            for photo_id, score in zip(photo_ids.tolist(), scores.tolist()):
+                votes[photo_id].append(score)
+        for photo_id, scores in votes.items():
+            if photo_id in matched or max(scores) < BIB_EXPANSION_MIN_SCORE:
+                continue
+            top = sorted(scores, reverse=True)[:BIB_EXPANSION_VOTES]
+            # Missing votes count as zero once there are enough seeds to vote
+            score = sum(top) / min(BIB_EXPANSION_VOTES, len(found_ids))
+            best[photo_id] = max(best.get(photo_id, 0.0), BIB_EXPANSION_WEIGHT * score)
+    return sorted(best.items(), key=lambda item: -item[1])
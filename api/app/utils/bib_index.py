@@ -0,0 +1,194 @@
+"""
+In-memory bib index for search-as-you-type.
+
+Per event, a sorted array of bibs (for prefix ranges via bisect) and a dict from bib to
+the set of public photo ids tagged with it. Events are loaded from photo_bibs on first
+use and then kept current by the photo endpoints, so lookups rarely touch SQL; each event
+is reloaded every BIB_INDEX_TTL_SECONDS to pick up writes made by other API workers.
+"""
+
+import bisect
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.utils.event_index import EventIndexes
+
+logger = logging.getLogger(__name__)
+
+# Seconds a loaded event is served before it is reloaded; bounds how long other API
+# workers' retags and deletes take to show up here
+BIB_INDEX_TTL_SECONDS = float(os.getenv("BIB_INDEX_TTL_SECONDS", "60"))
+
+# Digit pairs OCR commonly mixes up on race bibs; substitutions between them rank
+# above other single-character edits
+OCR_CONFUSIONS = {("1", "7"), ("0", "8"), ("3", "8"), ("5", "6"), ("6", "8"), ("0", "6")}
+_CONFUSABLE = {a: set() for pair in OCR_CONFUSIONS for a in pair}
+for _a, _b in OCR_CONFUSIONS:
+    _CONFUSABLE[_a].add(_b)
+    _CONFUSABLE[_b].add(_a)
+
+# Match kinds, best first
+EXACT, OCR_CONFUSION, PREFIX, EDIT = 0, 1, 2, 3
+
+
+class EventBibIndex:
+    """Bibs of one event. Not thread-safe on its own; BibIndex serializes access."""
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self.sorted_bibs: List[str] = []
+        self.alphabet: Set[str] = set()
+
+    def add(self, photo_id: int, bibs: Iterable[str]) -> None:
+        for bib in bibs:
+            photos = self.postings.get(bib)
+            if photos is None:
+                photos = self.postings[bib] = set()
+                bisect.insort(self.sorted_bibs, bib)
+                self.alphabet.update(bib)
+            photos.add(photo_id)
+
+    def remove(self, photo_id: int, bibs: Iterable[str]) -> None:
+        for bib in bibs:
+            photos = self.postings.get(bib)
+            if photos is None:
+                continue
+            photos.discard(photo_id)
+            if not photos:
+                del self.postings[bib]
+                del self.sorted_bibs[bisect.bisect_left(self.sorted_bibs, bib)]
+
+    def prefix(self, prefix: str, limit: int) -> List[str]:
+        start = bisect.bisect_left(self.sorted_bibs, prefix)
+        matches = []
+        for bib in self.sorted_bibs[start:start + limit]:
+            if not bib.startswith(prefix):
+                break
+            matches.append(bib)
+        return matches
+
+    def fuzzy(self, bib: str) -> List[Tuple[str, int]]:
+        """Indexed bibs within edit distance 1 of `bib`, as (bib, match kind), best first."""
+        found: Dict[str, int] = {}
+        def consider(candidate, kind):
+            if candidate in self.postings and kind < found.get(candidate, EDIT + 1):
+                found[candidate] = kind
+        consider(bib, EXACT)
+        for i, char in enumerate(bib):
+            consider(bib[:i] + bib[i + 1:], EDIT) # deletion
+            for other in self.alphabet:
+                if other != char:
+                    kind = OCR_CONFUSION if other in _CONFUSABLE.get(char, ()) else EDIT
+                    consider(bib[:i] + other + bib[i + 1:], kind) # substitution
+        for i in range(len(bib) + 1):
+            for other in self.alphabet:
+                consider(bib[:i] + other + bib[i:], EDIT) # insertion
+        return sorted(found.items(), key=lambda item: (item[1], item[0]))
+
+
+class BibIndex(EventIndexes[EventBibIndex]):
+    """
+    Per-event EventBibIndexes, loaded lazily from photo_bibs, kept current by this worker's
+    photo writes and reloaded every BIB_INDEX_TTL_SECONDS to pick up other workers' writes.
+    """
+
+    name = "bib index"
+
+    def __init__(self, ttl: float = BIB_INDEX_TTL_SECONDS):
+        super().__init__(ttl)
+
+    def _load_entries(self, db: Session, event_id: int) -> Dict[int, Tuple[str, ...]]:
+        bibs_by_photo: Dict[int, Tuple[str, ...]] = {}
+        for photo_id, bib in _load_event_rows(db, event_id):
+            bibs_by_photo[photo_id] = bibs_by_photo.get(photo_id, ()) + (bib,)
+        return bibs_by_photo
+
+    def _build(self, entries: Dict[int, Tuple[str, ...]]) -> EventBibIndex:
+        index = EventBibIndex()
+        for photo_id, bibs in entries.items():
+            index.add(photo_id, bibs)
+        return index
+
+    def _add(self, index: EventBibIndex, photo_id: int, bibs: Tuple[str, ...]) -> None:
+        index.add(photo_id, bibs)
+
+    def _remove(self, index: EventBibIndex, photo_id: int, bibs: Tuple[str, ...]) -> None:
+        index.remove(photo_id, bibs)
+
+    def update_photo(self, photo_id: int, event_id: Optional[int], bibs: Iterable[str], is_public: bool = True) -> None:
+        """Records a photo's committed bibs. Hidden photos are dropped from the index."""
+        bibs = tuple(bibs) if is_public else ()
+        self._update(photo_id, event_id, bibs or None)
+
+    def remove_photo(self, photo_id: int) -> None:
+        self.update_photo(photo_id, None, ())
+
+    def photos_for_bib(self, db: Session, event_id: int, bib: str) -> Set[int]:
+        index = self._event(db, event_id)
+        with self._lock:
+            return set(index.postings.get(bib, ()))
+
+    @staticmethod
+    def _ranked(index: EventBibIndex, query: str, limit: int) -> List[Tuple[str, int]]:
+        kinds = {bib: PREFIX for bib in index.prefix(query, limit)}
+        for bib, kind in index.fuzzy(query):
+            if kind != EDIT or bib not in kinds:
+                kinds[bib] = kind
+        return sorted(kinds.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+    def suggest(self, db: Session, event_id: int, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Bibs for a partially typed query, ranked exact match, OCR confusion (1/7, 0/8, ...),
+        prefix completion, then other single edits. Each suggestion has the bib, its match
+        kind and photo count.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        index = self._event(db, event_id)
+        with self._lock:
+            return [
+                {"bib": bib, "match": _MATCH_NAMES[kind], "photo_count": len(index.postings[bib])}
+                for bib, kind in self._ranked(index, query, limit)
+            ]
+
+    def photos_for_query(self, db: Session, event_id: int, query: str, limit: int = 10) -> Dict[int, str]:
+        """
+        Photos tagged with any of the `limit` best bibs for a roughly known bib (same ranking
+        as suggest), each with the match kind of its best bib.
+        """
+        query = query.strip()
+        if not query:
+            return {}
+        index = self._event(db, event_id)
+        photos: Dict[int, str] = {}
+        with self._lock:
+            for bib, kind in self._ranked(index, query, limit):
+                for photo_id in index.postings[bib]:
+                    photos.setdefault(photo_id, _MATCH_NAMES[kind])
+        return photos
+
+
+_MATCH_NAMES = {EXACT: "exact", OCR_CONFUSION: "ocr", PREFIX: "prefix", EDIT: "fuzzy"}
+
+
+def _load_event_rows(db: Session, event_id: int) -> List[Tuple[int, str]]:
+    from app.models.photo import Photo
+    from app.models.photo_bib import PhotoBib
+
+    return (
+        db.query(PhotoBib.photo_id, PhotoBib.bib)
+        .join(Photo, Photo.id == PhotoBib.photo_id)
+        .filter(PhotoBib.event_id == event_id, Photo.is_public == True)
+        .all()
+    )
+
+
+_bib_index = BibIndex()
+
+
+def get_bib_index() -> BibIndex:
+    return _bib_index
@@ -0,0 +1,97 @@
+"""
+Combined search: any mix of a selfie, an outfit description and a roughly known bib.
+
+The selfie and text CLIP embeddings are fused into one weighted query vector. Without a
+bib, that vector runs one filtered search over the event. With a bib, the bib index picks
+the candidate photos (exact, OCR-confusable, prefix and one-edit matches) and the same
+search is restricted to their people (SearchFilter.photo_ids, an ID selector inside FAISS).
+Each candidate's score blends its visual similarity with the strength of its bib match.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.utils.vector_metadata import SearchFilter
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Relative weights of the query parts; only the parts given are used
+COMBINED_SELFIE_WEIGHT = float(os.getenv("COMBINED_SELFIE_WEIGHT", "1.0"))
+COMBINED_TEXT_WEIGHT = float(os.getenv("COMBINED_TEXT_WEIGHT", "0.5"))
+# Share of a candidate's score coming from its bib match when there is also a query vector
+COMBINED_BIB_WEIGHT = float(os.getenv("COMBINED_BIB_WEIGHT", "0.3"))
+# How much each kind of bib match (see app.utils.bib_index) counts
+BIB_MATCH_STRENGTH = {"exact": 1.0, "ocr": 0.8, "prefix": 0.6, "fuzzy": 0.5}
+# Bibs from the bib index a rough bib expands to
+COMBINED_BIB_CANDIDATES = int(os.getenv("COMBINED_BIB_CANDIDATES", "10"))
+
+
+def fuse_query_vectors(selfie_vector: Optional[np.ndarray], text_vector: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """Weighted, L2-normalized sum of the query embeddings given, or None if there are none."""
+    parts = [
+        (COMBINED_SELFIE_WEIGHT, selfie_vector),
+        (COMBINED_TEXT_WEIGHT, text_vector),
+    ]
+    parts = [(weight, np.asarray(vector, dtype=np.float32).reshape(-1)) for weight, vector in parts if vector is not None]
+    if not parts:
+        return None
+    fused = sum(weight * vector / max(np.linalg.norm(vector), 1e-12) for weight, vector in parts)
+    return (fused / max(np.linalg.norm(fused), 1e-12)).astype(np.float32)
+
+
+def rank_combined(db: Session, event_id: int, query_vector: Optional[np.ndarray],
+                  bib_photos: Optional[Dict[int, str]], vector_k: int) -> Optional[Tuple[np.ndarray, np.ndarray, List[str]]]:
+    """
+    Ranks photos for a combined query.
+
+    Args:
+        db (Session): The SQLAlchemy DB session.
+        event_id (int): Event searched.
+        query_vector (Optional[np.ndarray]): Fused selfie/text embedding.
+        bib_photos (Optional[Dict[int, str]]): Candidate photos from the bib index with their
+            bib match kind, or None when no bib was given.
+        vector_k (int): Person hits fetched per search; with a bib, enough to cover the
+            candidates' people.
+
+    Returns:
+        Tuple: (photo_ids, scores, match_types), best first, as the result cache stores them;
+        None if the vector search failed.
+    """
+    store = get_vector_store()
+    if bib_photos is None:
+        result = store.search(query_vector.reshape(1, -1), vector_k, search_filter=SearchFilter.for_event(event_id))
+        if result is None:
+            return None
+        photo_ids, scores = store.aggregate_to_photos(*result)
+        return photo_ids, scores, ["visual"] * len(photo_ids)
+
+    candidates = list(bib_photos)
+    visual: Dict[int, float] = {}
+    if query_vector is not None and candidates:
+        search_filter = SearchFilter.for_event(event_id, photo_ids=tuple(sorted(candidates)))
+        result = store.search(query_vector.reshape(1, -1), vector_k, search_filter=search_filter)
+        if result is None:
+            return None
+        visual = dict(zip(*(values.tolist() for values in store.aggregate_to_photos(*result))))
+    ranked = []
+    for photo_id in candidates:
+        bib_score = BIB_MATCH_STRENGTH[bib_photos[photo_id]]
+        if query_vector is None:
+            ranked.append((bib_score, photo_id, "bib"))
+        elif photo_id in visual:
+            score = (1 - COMBINED_BIB_WEIGHT) * visual[photo_id] + COMBINED_BIB_WEIGHT * bib_score
+            ranked.append((score, photo_id, "combined"))
+        else:
+            # No detected people to compare: the bib alone vouches for the photo
+            ranked.append((COMBINED_BIB_WEIGHT * bib_score, photo_id, "bib"))
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return (
+        np.asarray([photo_id for _, photo_id, _ in ranked], dtype=np.int64),
+        np.asarray([score for score, _, _ in ranked], dtype=np.float32),
+        [match_type for _, _, match_type in ranked],
+    )
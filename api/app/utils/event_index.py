@@ -0,0 +1,130 @@
+"""
+Shared scaffolding for in-memory per-event indexes (bib index, temporal index).
+
+An event's index is built from the DB on first use and then kept current by this worker's
+photo writes. Writes committed while an event is still loading are replayed over the rows
+read, since they are newer. Loaded events expire after `ttl` seconds and are rebuilt on
+their next use; that is how writes made by other API workers (retags, deletes, hidden
+photos) reach this worker.
+"""
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+IndexT = TypeVar("IndexT")
+
+
+class _LoadedEvent(Generic[IndexT]):
+    def __init__(self, index: IndexT, entries: Dict[int, Any], expires_at: float):
+        self.index = index
+        self.entries = entries # photo_id -> entry, as indexed
+        self.expires_at = expires_at
+
+
+class EventIndexes(Generic[IndexT], ABC):
+    """
+    Per-event indexes plus the event and entry each indexed photo currently has, so updates
+    can take a photo's old entry out (or move it between events) without a DB read.
+
+    Subclasses define how an event's entries ({photo_id: entry}) are loaded and how an index
+    is built from them and updated. `_lock` guards the indexes; hold it while reading one.
+    """
+
+    name = "index"
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._events: Dict[int, _LoadedEvent] = {}
+        self._photos: Dict[int, int] = {} # photo_id -> event_id it is indexed under
+        self._loading: Dict[int, List[Tuple]] = {} # event_id -> updates that arrived while loading
+
+    @abstractmethod
+    def _load_entries(self, db: Session, event_id: int) -> Dict[int, Any]:
+        """Reads the event's indexed photos from the DB as {photo_id: entry}."""
+
+    @abstractmethod
+    def _build(self, entries: Dict[int, Any]) -> IndexT:
+        """Builds an event's index from its entries."""
+
+    @abstractmethod
+    def _add(self, index: IndexT, photo_id: int, entry: Any) -> None:
+        """Adds one photo's entry to a built index."""
+
+    @abstractmethod
+    def _remove(self, index: IndexT, photo_id: int, entry: Any) -> None:
+        """Takes a photo's entry, as it was indexed, out of a built index."""
+
+    def _drop_event(self, event_id: int) -> None:
+        """Forgets a loaded event and its photos. Caller holds the lock."""
+        for photo_id in self._events.pop(event_id).entries:
+            if self._photos.get(photo_id) == event_id:
+                del self._photos[photo_id]
+
+    def _event(self, db: Session, event_id: int) -> IndexT:
+        """The event's index, loading it from the DB if it isn't loaded or has expired."""
+        with self._lock:
+            loaded = self._events.get(event_id)
+            if loaded is not None:
+                if loaded.expires_at > time.monotonic():
+                    return loaded.index
+                self._drop_event(event_id)
+            self._loading.setdefault(event_id, [])
+        try:
+            entries = self._load_entries(db, event_id)
+        except Exception:
+            with self._lock:
+                self._loading.pop(event_id, None)
+            raise
+        with self._lock:
+            if event_id in self._events: # Another request finished loading first
+                return self._events[event_id].index
+            # Writes committed while the rows were being read are newer than the rows
+            for photo_id, new_event_id, entry in self._loading.pop(event_id, []):
+                if new_event_id == event_id and entry is not None:
+                    entries[photo_id] = entry
+                else:
+                    entries.pop(photo_id, None)
+            index = self._build(entries)
+            self._events[event_id] = _LoadedEvent(index, entries, time.monotonic() + self.ttl)
+            for photo_id in entries:
+                other_event_id = self._photos.get(photo_id)
+                if other_event_id is not None and other_event_id != event_id:
+                    # Moved by another worker; these rows are newer than the other event's
+                    other = self._events[other_event_id]
+                    self._remove(other.index, photo_id, other.entries.pop(photo_id))
+                self._photos[photo_id] = event_id
+            logger.info(f"Loaded {self.name} for event {event_id}: {len(entries)} photos.")
+            return index
+
+    def _update(self, photo_id: int, event_id: Optional[int], entry: Any) -> None:
+        """Records a photo's committed entry; None drops the photo from every event."""
+        if event_id is None:
+            entry = None
+        with self._lock:
+            old_event_id = self._photos.pop(photo_id, None)
+            if old_event_id is not None:
+                loaded = self._events[old_event_id]
+                self._remove(loaded.index, photo_id, loaded.entries.pop(photo_id))
+            loaded = self._events.get(event_id) if entry is not None else None
+            if loaded is not None:
+                self._add(loaded.index, photo_id, entry)
+                loaded.entries[photo_id] = entry
+                self._photos[photo_id] = event_id
+            # Events being loaded may have read this photo's old rows; replayed once loaded.
+            # Events not loaded at all pick the photo up from the DB when they are.
+            for pending in self._loading.values():
+                pending.append((photo_id, event_id, entry))
+
+    def clear(self) -> None:
+        """Drops every loaded event; each reloads from the DB on its next lookup."""
+        with self._lock:
+            self._events.clear()
+            self._photos.clear()
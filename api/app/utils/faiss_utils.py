@@ -2,7 +2,17 @@ import faiss
 import numpy as np
 import os
 import logging
-from typing import Optional, Tuple, List
+import threading
+import time
+import queue
+from contextlib import contextmanager
+from multiprocessing.connection import Client
+from typing import Optional, Tuple, List, Dict, Sequence
+
+from app.utils.raw_vector_store import RawVectorStore
+from app.utils.vector_metadata import VectorMetadata, SearchFilter, build_id_selector
+from app.utils.index_router import IndexRouter
+from app.utils.search_batcher import SearchBatcher
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,9 +26,211 @@ FAISS_INDEX_PATH = os.path.join(FAISS_DATA_DIR, FAISS_INDEX_FILENAME)
 
 EMBEDDING_DIM = 512  # For CLIP ViT-B/32 model
 
+# --- Index type / codec ---
+# "flat"  : exact float32, 2048 bytes per vector (the original IndexFlatIP)
+# "fp16"  : float16 scalar quantizer, 1024 bytes per vector, effectively lossless for CLIP
+# "sq8"   : 8-bit scalar quantizer, 512 bytes per vector, needs training
+# "ivfpq" : inverted lists + product quantizer, ~64 bytes per vector, needs training; for very large events
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+FAISS_INDEX_FACTORY_STRINGS = {
+    "flat": "Flat",
+    "fp16": "SQfp16",
+    "sq8": "SQ8",
+    "ivfpq": "IVF{nlist},PQ64",
+}
+# Number of inverted lists probed per query for IVF indexes
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+
+# --- Exact re-ranking ---
+# Uncompressed float32 copy of every vector, row i = FAISS ID i (see raw_vector_store.py)
+RAW_VECTORS_FILENAME = "raw_vectors.npy"
+# Per-vector photo/event/time/bbox table, saved alongside the index
+VECTOR_METADATA_FILENAME = "vector_metadata.npz"
+# Approximate indexes fetch k * factor candidates which are then re-scored exactly
+FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+
+# --- Delta index and compaction ---
+# New vectors go to a small exact delta index (IndexIDMap2 over IndexFlatIP, keyed by FAISS ID)
+# on top of the large immutable base index, so they are searchable immediately whatever codec
+# the base uses. Searches query both and merge. Compaction rebuilds the base in the background
+# from the raw vector store, folding in the delta and dropping tombstoned vectors.
+FAISS_DELTA_FILENAME = "clip_index.delta.faiss"
+# Compact once the delta holds this many vectors...
+FAISS_DELTA_MAX_VECTORS = int(os.getenv("FAISS_DELTA_MAX_VECTORS", "20000"))
+# ...or once this fraction of all ids are tombstones still present in the base
+FAISS_COMPACT_DELETED_RATIO = float(os.getenv("FAISS_COMPACT_DELETED_RATIO", "0.2"))
+
+# --- Query coalescing ---
+# Concurrent searches arriving within this window are run as one batched index.search
+# (see search_batcher.py); 0 disables coalescing.
+FAISS_BATCH_WINDOW_MS = float(os.getenv("FAISS_BATCH_WINDOW_MS", "0.5"))
+FAISS_BATCH_MAX_QUERIES = int(os.getenv("FAISS_BATCH_MAX_QUERIES", "256"))
+
+# --- Index service ---
+# When set, this process owns no index: the public functions below forward to the index
+# service listening on this Unix socket (python -m app.utils.index_service). All API workers
+# then share one copy of the index, and an add is visible to every worker immediately.
+FAISS_SERVICE_SOCKET = os.getenv("FAISS_SERVICE_SOCKET")
+# Shared secret for index service connections. Requests and results are pickled, so whoever
+# can connect with the key can run code in the service (and the service in its clients):
+# required for TCP nodes, whose ports must only be reachable on a private network. Without a
+# key, a Unix socket is only open to the service's own user.
+FAISS_SERVICE_AUTHKEY = os.getenv("FAISS_SERVICE_AUTHKEY", "").encode() or None
+# Comma-separated index nodes ("/path/to.sock" or "host:port") for an index sharded by event.
+# Takes precedence over FAISS_SERVICE_SOCKET; see index_router.py.
+FAISS_SERVICE_NODES = os.getenv("FAISS_SERVICE_NODES")
+# Seconds to wait for a node before answering with the other nodes' results
+FAISS_SERVICE_TIMEOUT = float(os.getenv("FAISS_SERVICE_TIMEOUT", "2.0"))
+
 # Global variable to hold the loaded FAISS index
 # This will be loaded on demand or at startup
-_faiss_index: Optional[faiss.Index] = None
+_faiss_index: Optional[faiss.Index] = None # The base index
+_delta_index: Optional[faiss.Index] = None # Vectors added since the base was built
+# Next FAISS ID to hand out; ids below it live in the base, the delta, or are tombstones
+_index_size = 0
+# Base object last written to disk; saves skip rewriting the base while it is unchanged
+_saved_base: Optional[faiss.Index] = None
+# Tombstone count when the current base was built (those vectors are no longer in it)
+_compacted_deleted = 0
+_raw_vector_store: Optional[RawVectorStore] = None
+_search_batcher: Optional[SearchBatcher] = None
+# Per-vector photo/event/visibility/time columns used for filtered search and hit aggregation.
+# Replaced at startup with the saved table, or one rebuilt from the DB (see load_vector_metadata).
+_vector_metadata: VectorMetadata = VectorMetadata()
+
+
+class _ReadWriteLock:
+    """
+    Read-mostly lock guarding the FAISS index.
+    Any number of searches may hold the read side at once; adds and index swaps take the
+    write side exclusively. Waiting writers block new readers so ingest cannot be starved
+    by a steady stream of searches.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_locked(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_locked(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+_index_lock = _ReadWriteLock()
+# Serializes loaders so two threads don't both read the file and race on the swap
+_load_lock = threading.Lock()
+# Taken while holding the index write lock, so it must never be held while waiting on that lock
+_raw_store_lock = threading.Lock()
+# Held for the whole of a compaction so only one runs at a time
+_compaction_lock = threading.Lock()
+
+
+def parse_service_address(address: str):
+    """'/tmp/index.sock' -> Unix socket path, 'host:port' -> (host, port) TCP address."""
+    address = address.strip()
+    if "/" in address or ":" not in address:
+        return address
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+class IndexServiceClient:
+    """
+    Thin client for one index service node. Connections are pooled because a connection
+    carries one request at a time; concurrent callers each borrow their own.
+    """
+
+    def __init__(self, address, authkey: Optional[bytes], pool_size: int = 16, timeout: Optional[float] = None):
+        self.address = parse_service_address(address) if isinstance(address, str) else address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        family = "AF_UNIX" if isinstance(self.address, str) else "AF_INET"
+        return Client(self.address, family=family, authkey=self.authkey)
+
+    def _roundtrip(self, request: Dict):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            conn.send(request)
+            if self.timeout is not None and not conn.poll(self.timeout):
+                raise TimeoutError(f"No answer from index service {self.address} within {self.timeout}s")
+            response = conn.recv()
+        except Exception:
+            conn.close() # Don't return a broken (or still busy) connection to the pool
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        if not response.get("ok"):
+            raise RuntimeError(f"Index service error in '{request.get('op')}': {response.get('error')}")
+        return response["result"]
+
+    def call(self, op: str, **kwargs):
+        return self._roundtrip({"op": op, "kwargs": kwargs})
+
+    def call_batch(self, requests: List[Tuple[str, Dict]]) -> List:
+        """Runs several operations in one round trip; results come back in order."""
+        return self._roundtrip({"op": "batch", "kwargs": {"requests": [{"op": op, "kwargs": kw} for op, kw in requests]}})
+
+
+_index_router: Optional[IndexRouter] = None
+_index_router_config: Optional[Tuple] = None
+
+def _use_index_service() -> bool:
+    return bool(FAISS_SERVICE_NODES or FAISS_SERVICE_SOCKET)
+
+def get_index_router() -> IndexRouter:
+    """Router over the configured index node(s); a single FAISS_SERVICE_SOCKET is a one-node router."""
+    global _index_router, _index_router_config
+    addresses = [a for a in (FAISS_SERVICE_NODES or FAISS_SERVICE_SOCKET or "").split(",") if a.strip()]
+    config = (tuple(addresses), FAISS_SERVICE_TIMEOUT)
+    if _index_router is None or _index_router_config != config:
+        nodes = [IndexServiceClient(a, FAISS_SERVICE_AUTHKEY, timeout=FAISS_SERVICE_TIMEOUT) for a in addresses]
+        _index_router = IndexRouter(nodes, timeout=FAISS_SERVICE_TIMEOUT)
+        _index_router_config = config
+    return _index_router
+
+def _service_call(op: str, default, **kwargs):
+    """Forwards a call to the index service node(s), logging and returning `default` if it fails."""
+    try:
+        return get_index_router().call(op, **kwargs)
+    except Exception as e:
+        logger.error(f"Index service call '{op}' failed: {e}")
+        return default
 
 def _initialize_faiss_directory():
     """Ensures the directory for FAISS index exists."""
@@ -30,60 +242,543 @@ def _initialize_faiss_directory():
             logger.error(f"Failed to create FAISS data directory {FAISS_DATA_DIR}: {e}")
             raise
 
-def get_faiss_index(force_reload: bool = False) -> Optional[faiss.Index]:
+def open_data_dir(data_dir: str) -> None:
     """
-    Loads the FAISS index from disk if it exists, otherwise creates a new one.
-    The loaded/created index is stored in a global variable for reuse.
+    Points this process at the index files in `data_dir`, dropping the index, raw vector
+    store and metadata loaded from the previous directory. For offline tools that work
+    through several nodes' files in turn (check_faiss_index.py --reshard).
+    """
+    global FAISS_DATA_DIR, FAISS_INDEX_PATH, _faiss_index, _delta_index, _index_size, _saved_base
+    global _compacted_deleted, _raw_vector_store, _vector_metadata
+    with _load_lock:
+        with _index_lock.write_locked():
+            with _raw_store_lock:
+                FAISS_DATA_DIR = data_dir
+                FAISS_INDEX_PATH = os.path.join(data_dir, FAISS_INDEX_FILENAME)
+                _faiss_index = _delta_index = _saved_base = _raw_vector_store = None
+                _index_size = _compacted_deleted = 0
+                _vector_metadata = VectorMetadata()
+
+def get_raw_vector_store() -> Optional[RawVectorStore]:
+    """
+    Returns the memory-mapped store of exact vectors, opening it on first use.
+
+    Returns:
+        Optional[RawVectorStore]: The store, or None if the file exists but is unreadable.
+    """
+    global _raw_vector_store
+    if _raw_vector_store is None:
+        _initialize_faiss_directory()
+        with _raw_store_lock:
+            if _raw_vector_store is None:
+                try:
+                    _raw_vector_store = RawVectorStore(os.path.join(FAISS_DATA_DIR, RAW_VECTORS_FILENAME), EMBEDDING_DIM)
+                except Exception as e:
+                    logger.error(f"Failed to open raw vector store in {FAISS_DATA_DIR}: {e}")
+                    return None
+    return _raw_vector_store
+
+def _sync_raw_vector_store(store: RawVectorStore) -> None:
+    """
+    Lines the raw store up with the index before an add (caller holds the write lock).
+    Rows the index never got (crash before save) are dropped; vectors the index has but the
+    store lacks (indexes built before the store existed) are backfilled from the index.
+    """
+    if len(store) > _index_size:
+        logger.warning(f"Raw vector store has {len(store)} rows but the index has {_index_size}. Truncating the store.")
+        store.truncate(_index_size)
+    elif len(store) < _index_size:
+        logger.warning(f"Backfilling {_index_size - len(store)} vectors into the raw vector store from the index.")
+        store.append(_reconstruct_range(len(store), _index_size), len(store))
+
+def _reconstruct_range(start: int, end: int) -> np.ndarray:
+    """
+    Decodes the vectors for FAISS IDs start..end-1 from the base and delta indexes (caller
+    holds the index lock). Ids neither can reconstruct (tombstones dropped by compaction,
+    IVF bases without a direct map) come back as zero vectors.
+    """
+    vectors = np.zeros((max(end - start, 0), EMBEDDING_DIM), dtype=np.float32)
+    base, delta = _faiss_index, _delta_index
+    positional_end = start
+    if base is not None and not isinstance(base, faiss.IndexIDMap) and start < base.ntotal:
+        positional_end = min(end, base.ntotal)
+        try:
+            vectors[:positional_end - start] = base.reconstruct_n(start, positional_end - start)
+        except RuntimeError as e:
+            logger.warning(f"Could not reconstruct vectors from the base index: {e}")
+    for faiss_id in range(positional_end, end):
+        for index in (delta, base):
+            if index is None or not isinstance(index, faiss.IndexIDMap):
+                continue
+            try:
+                vectors[faiss_id - start] = index.reconstruct(faiss_id)
+                break
+            except RuntimeError:
+                continue # Not in this index
+    return vectors
+
+def reconstruct_vectors(start: int, end: int) -> np.ndarray:
+    """Vectors for FAISS IDs start..end-1 as stored in the index (decoded, for compressed codecs)."""
+    get_faiss_index()
+    with _index_lock.read_locked():
+        return _reconstruct_range(start, end)
+
+def get_vectors(faiss_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fetches stored vectors by FAISS ID, e.g. to query with a detection that is already
+    indexed instead of re-encoding its crop. Exact vectors come from the raw vector store;
+    ids it doesn't cover are decoded from the index.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (found_ids, vectors) for the ids that exist and aren't
+        deleted, in request order; unknown, deleted or undecodable ids are left out.
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+    if _use_index_service():
+        return _service_call("get_vectors", empty, faiss_ids=list(faiss_ids))
+    get_faiss_index()
+    store = get_raw_vector_store()
+    ids = np.asarray(faiss_ids, dtype=np.int64).ravel()
+    with _index_lock.read_locked():
+        ids = ids[(ids >= 0) & (ids < _index_size)]
+        deleted = _vector_metadata.column("deleted")
+        tombstoned = np.zeros(len(ids), dtype=bool)
+        covered = ids < len(deleted) # Rows past the table have no tombstone
+        tombstoned[covered] = deleted[ids[covered]]
+        ids = ids[~tombstoned]
+        if not len(ids):
+            return empty
+        if store is not None and len(store) >= _index_size:
+            vectors = store.get(ids)
+        else:
+            vectors = np.vstack([_reconstruct_range(int(i), int(i) + 1) for i in ids])
+    decoded = np.any(vectors != 0, axis=1)
+    return ids[decoded], np.ascontiguousarray(vectors[decoded], dtype=np.float32)
+
+def get_index_size() -> int:
+    """Number of FAISS IDs handed out so far (base + delta, including tombstones)."""
+    if _use_index_service():
+        return int(get_index_stats().get("ntotal", 0))
+    get_faiss_index()
+    return _index_size
+
+def get_vector_metadata() -> VectorMetadata:
+    return _vector_metadata
+
+def _vector_metadata_path() -> str:
+    return os.path.join(FAISS_DATA_DIR, VECTOR_METADATA_FILENAME)
+
+def load_saved_vector_metadata() -> Optional[VectorMetadata]:
+    """
+    Loads the metadata table saved with the index.
+
+    Returns:
+        Optional[VectorMetadata]: None if there is no saved table or it doesn't cover the index
+        (e.g. the process died between an add and the next save), in which case the caller
+        should rebuild it from the DB.
+    """
+    path = _vector_metadata_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        metadata = VectorMetadata.load(path)
+    except Exception as e:
+        logger.error(f"Failed to load vector metadata from {path}: {e}")
+        return None
+    size = get_index_size()
+    # Trailing rows are fine if tombstoned: compaction may have dropped the highest ids
+    if len(metadata) < size or not metadata.column("deleted")[size:].all():
+        logger.warning(f"Saved vector metadata has {len(metadata)} rows but the index has {size} vectors. Ignoring it.")
+        return None
+    return metadata
+
+def save_vector_metadata() -> bool:
+    """Saves only the metadata table (cheap; used after deletes and visibility changes)."""
+    if _use_index_service():
+        return _service_call("save_metadata", False)
+    _initialize_faiss_directory()
+    try:
+        with _index_lock.read_locked():
+            _vector_metadata.save(_vector_metadata_path())
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save vector metadata: {e}")
+        return False
+
+def delete_vectors(faiss_ids: Sequence[int]) -> None:
+    """
+    Removes vectors from search results. FAISS IDs are positional, so the vectors stay in the
+    index as tombstones until the next rebuild; the IDs are never handed out again.
+    """
+    if _use_index_service():
+        _service_call("delete", None, faiss_ids=list(faiss_ids))
+        return
+    with _index_lock.write_locked():
+        _vector_metadata.delete(faiss_ids)
+    _maybe_schedule_compaction()
+
+def aggregate_hits_to_photos(distances: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Turns search hits into (photo_ids, scores) sorted by best score, using the in-memory
+    metadata table instead of a person_embeddings lookup.
+    """
+    if _use_index_service():
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        return _service_call("aggregate", empty, distances=distances, indices=indices)
+    with _index_lock.read_locked():
+        return _vector_metadata.aggregate_to_photos(distances, indices)
+
+def get_index_stats() -> Dict[str, object]:
+    """Sizes of the index and its side tables (for health checks and startup logging)."""
+    if _use_index_service():
+        return _service_call("stats", {})
+    index = get_faiss_index()
+    store = get_raw_vector_store()
+    with _index_lock.read_locked():
+        return {
+            "ntotal": _index_size,
+            "index_type": type(_base_codec(index)).__name__ if index is not None else None,
+            "base_vectors": index.ntotal if index is not None else 0,
+            "delta_vectors": _delta_index.ntotal if _delta_index is not None else 0,
+            "raw_vectors": len(store) if store is not None else 0,
+            "metadata_rows": len(_vector_metadata),
+            "deleted": _vector_metadata.num_deleted(),
+        }
+
+def set_vector_metadata(metadata: VectorMetadata) -> None:
+    """Publishes a freshly loaded metadata table."""
+    global _vector_metadata, _compacted_deleted
+    with _index_lock.write_locked():
+        _vector_metadata = metadata
+        # A compacted base no longer holds the vectors tombstoned before it was saved
+        if isinstance(_faiss_index, faiss.IndexIDMap):
+            _compacted_deleted = metadata.num_deleted()
+
+def update_vector_metadata(faiss_ids: Sequence[int], **columns: Sequence) -> None:
+    """
+    Updates metadata columns for existing vectors, e.g. when a photo is made private.
+    Takes the write lock so no search sees a half-applied change.
+    """
+    if _use_index_service():
+        _service_call("update_metadata", None, faiss_ids=list(faiss_ids), columns=columns)
+        return
+    with _index_lock.write_locked():
+        _vector_metadata.set_rows(faiss_ids, **columns)
+
+def move_vectors(faiss_ids: Sequence[int], metadata: Dict[str, Sequence]) -> Optional[List[int]]:
+    """
+    Rewrites all metadata columns of existing vectors, e.g. for a photo moved to another
+    event. With several index nodes, vectors whose event moves to another node get new ids
+    there (see IndexRouter.move_vectors). Returns the ids after the move, or None on failure.
+    """
+    if _use_index_service():
+        return _service_call("move_vectors", None, faiss_ids=list(faiss_ids), metadata=metadata)
+    update_vector_metadata(faiss_ids, **metadata)
+    return [int(i) for i in faiss_ids]
+
+def set_event_active(event_id: int, is_active: bool) -> None:
+    """Marks an event as (de)activated for the active_events_only filter."""
+    if _use_index_service():
+        _service_call("set_event_active", None, event_id=event_id, is_active=is_active)
+        return
+    with _index_lock.write_locked():
+        _vector_metadata.set_event_active(event_id, is_active)
+
+def _search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """Search parameters carrying an ID selector; IVF indexes need their own subclass and nprobe."""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return faiss.SearchParameters(sel=selector)
+    return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+
+def _base_codec(index: faiss.Index) -> faiss.Index:
+    """The index doing the encoding, unwrapped from a compacted base's IndexIDMap2."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def _is_exact_index(index: faiss.Index) -> bool:
+    return isinstance(_base_codec(index), faiss.IndexFlat)
+
+def _index_id_end(index: faiss.Index) -> int:
+    """One past the highest FAISS ID stored in `index`."""
+    if not isinstance(index, faiss.IndexIDMap):
+        return index.ntotal # Positional: row i is FAISS ID i
+    ids = faiss.vector_to_array(index.id_map)
+    return int(ids.max()) + 1 if ids.size else 0
+
+def _new_delta_index() -> faiss.Index:
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(EMBEDDING_DIM))
+
+def _delta_index_path() -> str:
+    return os.path.join(FAISS_DATA_DIR, FAISS_DELTA_FILENAME)
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """Rule of thumb for IVF: ~4*sqrt(n) lists, while keeping >= 39 training points per list."""
+    nlist = int(4 * np.sqrt(max(num_vectors, 1)))
+    return max(1, min(nlist, num_vectors // 39 if num_vectors >= 39 else 1))
+
+def _configure_search_params(index: faiss.Index) -> None:
+    """Applies query-time knobs (e.g. nprobe) that are not stored in the index file."""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(FAISS_NPROBE, ivf.nlist)
+    except RuntimeError:
+        pass # Not an IVF index
+
+def create_faiss_index(index_type: Optional[str] = None, num_vectors: int = 0) -> faiss.Index:
+    """
+    Creates an empty FAISS index for the given codec.
 
     Args:
-        force_reload (bool): If True, forces reloading the index from disk even if already loaded.
+        index_type (Optional[str]): One of FAISS_INDEX_FACTORY_STRINGS; defaults to FAISS_INDEX_TYPE.
+        num_vectors (int): Expected corpus size, used to size IVF indexes.
 
     Returns:
-        Optional[faiss.Index]: The loaded or newly created FAISS index, or None on failure.
+        faiss.Index: An untrained (if the codec needs training) inner-product index.
     """
-    global _faiss_index
-    _initialize_faiss_directory() # Ensure directory exists first
+    index_type = (index_type or FAISS_INDEX_TYPE).lower()
+    if index_type not in FAISS_INDEX_FACTORY_STRINGS:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {sorted(FAISS_INDEX_FACTORY_STRINGS)}.")
+    factory_string = FAISS_INDEX_FACTORY_STRINGS[index_type].format(nlist=_ivf_nlist(num_vectors))
+    index = faiss.index_factory(EMBEDDING_DIM, factory_string, faiss.METRIC_INNER_PRODUCT)
+    _configure_search_params(index)
+    return index
 
-    if not force_reload and _faiss_index is not None:
-        logger.debug("Returning already loaded FAISS index.")
-        return _faiss_index
+def build_faiss_index(vectors: np.ndarray, index_type: Optional[str] = None,
+                      faiss_ids: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    Trains (if needed) and fills a new index of the given type with `vectors`.
+    Without `faiss_ids`, vectors are added in order, so the FAISS ID of row i is still i and
+    existing PersonEmbedding.faiss_id values stay valid. With them, the index is an
+    IndexIDMap2 holding row i under faiss_ids[i] (a compacted base without tombstones).
 
+    Args:
+        vectors (np.ndarray): Array of shape (n, EMBEDDING_DIM), already L2-normalized.
+        index_type (Optional[str]): Codec to build; defaults to FAISS_INDEX_TYPE.
+        faiss_ids (Optional[np.ndarray]): FAISS ID of each row.
+
+    Returns:
+        faiss.Index: The populated index.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = create_faiss_index(index_type, num_vectors=vectors.shape[0])
+    if not index.is_trained:
+        logger.info(f"Training {index_type or FAISS_INDEX_TYPE} index on {vectors.shape[0]} vectors...")
+        index.train(vectors)
+    if faiss_ids is None:
+        index.add(vectors)
+        return index
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(vectors, np.asarray(faiss_ids, dtype=np.int64))
+    return index
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Size of the serialized index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
+
+def evaluate_index(index: faiss.Index, vectors: np.ndarray, num_queries: int = 200, k: int = 10,
+                   faiss_ids: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """
+    Measures recall@k of `index` against exact search over `vectors`, plus its memory cost.
+
+    Queries are a random sample of the stored vectors, which matches how person search
+    behaves (a query is another crop of someone already in the index). Pass the `faiss_ids`
+    the index was built with if row i isn't stored under ID i.
+
+    Returns:
+        Dict[str, float]: recall_at_k, bytes_per_vector, total_bytes and ms_per_query.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n = vectors.shape[0]
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(n, size=min(num_queries, n), replace=False)]
+
+    exact = faiss.IndexFlatIP(EMBEDDING_DIM)
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+    if faiss_ids is not None:
+        ground_truth = np.asarray(faiss_ids, dtype=np.int64)[ground_truth]
+
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = time.perf_counter() - started
+
+    hits = sum(len(set(gt_row) & set(found_row)) for gt_row, found_row in zip(ground_truth, found))
+    total_bytes = index_memory_bytes(index)
+    return {
+        "recall_at_k": hits / float(len(queries) * k),
+        "k": k,
+        "bytes_per_vector": total_bytes / float(max(index.ntotal, 1)),
+        "total_bytes": total_bytes,
+        "ms_per_query": 1000.0 * elapsed / len(queries),
+    }
+
+def _load_or_create_index() -> Optional[Tuple[faiss.Index, faiss.Index]]:
+    """
+    Reads the base and delta indexes from disk, or creates new empty ones if there is no
+    usable file. Always returns fresh objects; they are never shared with other threads
+    until they are published.
+
+    Returns:
+        Optional[Tuple[faiss.Index, faiss.Index]]: (base, delta), or None on failure.
+    """
+    index = None
     if os.path.exists(FAISS_INDEX_PATH):
         try:
             logger.info(f"Loading FAISS index from {FAISS_INDEX_PATH}...")
-            _faiss_index = faiss.read_index(FAISS_INDEX_PATH)
-            logger.info(f"FAISS index loaded successfully. Index has {_faiss_index.ntotal} vectors.")
+            index = faiss.read_index(FAISS_INDEX_PATH)
+            logger.info(f"FAISS index loaded successfully. Index has {index.ntotal} vectors.")
             # Check if the loaded index has the correct dimensionality if it's not empty
-            if _faiss_index.ntotal > 0 and _faiss_index.d != EMBEDDING_DIM:
-                logger.error(f"Loaded FAISS index has dimension {_faiss_index.d}, but expected {EMBEDDING_DIM}. Discarding.")
-                _faiss_index = None # Invalidate incorrect index
+            if index.ntotal > 0 and index.d != EMBEDDING_DIM:
+                logger.error(f"Loaded FAISS index has dimension {index.d}, but expected {EMBEDDING_DIM}. Discarding.")
+                index = None # Invalidate incorrect index
                 # Potentially, here you might want to backup the old one and create a new one
         except Exception as e:
             logger.error(f"Failed to load FAISS index from {FAISS_INDEX_PATH}: {e}. A new index will be created.")
-            _faiss_index = None # Ensure it's None so a new one is created
-    
-    if _faiss_index is None: # If not loaded or loading failed or dim mismatch
+            index = None # Ensure it's None so a new one is created
+
+    if index is None: # If not loaded or loading failed or dim mismatch
         try:
-            logger.info(f"Creating a new FAISS index (IndexFlatIP) with dimension {EMBEDDING_DIM}.")
-            # IndexFlatIP is for inner product (cosine similarity when vectors are normalized)
-            _faiss_index = faiss.IndexFlatIP(EMBEDDING_DIM)
-            logger.info("New FAISS index created successfully.")
-            # Optionally, save the empty index immediately
-            # save_faiss_index() 
+            index = create_faiss_index()
+            if not index.is_trained:
+                # Trained codecs need a corpus; the first compaction trains one from the delta
+                logger.warning(f"FAISS index type '{FAISS_INDEX_TYPE}' needs training; starting with an empty flat base until the first compaction.")
+                index = create_faiss_index("flat")
+            logger.info(f"Created a new FAISS index ({type(index).__name__}) with dimension {EMBEDDING_DIM}.")
         except Exception as e:
             logger.error(f"Failed to create new FAISS index: {e}")
-            _faiss_index = None
             return None
-            
-    return _faiss_index
+    else:
+        _configure_search_params(index)
+
+    delta = None
+    delta_path = _delta_index_path()
+    if os.path.exists(delta_path):
+        try:
+            delta = faiss.read_index(delta_path)
+            # A crash between writing a compacted base and its delta leaves ids in both
+            base_end = _index_id_end(index)
+            if delta.ntotal and base_end:
+                delta.remove_ids(faiss.IDSelectorRange(0, base_end))
+            logger.info(f"FAISS delta index loaded with {delta.ntotal} vectors.")
+        except Exception as e:
+            logger.error(f"Failed to load FAISS delta index from {delta_path}: {e}. Its vectors are missing until a rebuild.")
+            delta = None
+    if delta is None:
+        delta = _new_delta_index()
+
+    return index, delta
+
+def get_faiss_index(force_reload: bool = False) -> Optional[faiss.Index]:
+    """
+    Loads the FAISS index from disk if it exists, otherwise creates a new one.
+    The loaded/created index is stored in a global variable for reuse.
+
+    Reloads are copy-on-write: the new index is read into a separate object and then
+    swapped in under the write lock, so searches already running against the old object
+    finish undisturbed and adds never land on an index that is about to be discarded.
+
+    Args:
+        force_reload (bool): If True, forces reloading the index from disk even if already loaded.
+
+    Returns:
+        Optional[faiss.Index]: The loaded or newly created FAISS index, or None on failure.
+    """
+    global _faiss_index, _delta_index, _index_size, _saved_base, _compacted_deleted
+    _initialize_faiss_directory() # Ensure directory exists first
+
+    if not force_reload and _faiss_index is not None:
+        logger.debug("Returning already loaded FAISS index.")
+        return _faiss_index
+
+    with _load_lock:
+        # Another thread may have finished loading while we waited
+        if not force_reload and _faiss_index is not None:
+            return _faiss_index
+
+        loaded = _load_or_create_index()
+        if loaded is None:
+            return None
+        new_index, new_delta = loaded
+
+        with _index_lock.write_locked():
+            _faiss_index, _delta_index = new_index, new_delta
+            _index_size = max(_index_id_end(new_index), _index_id_end(new_delta))
+            _saved_base = new_index
+            _compacted_deleted = 0
+
+    return new_index
+
+def replace_faiss_index(new_index: faiss.Index) -> None:
+    """
+    Publishes a fully built index (e.g. after a rebuild with a different codec) as the new
+    base, covering every live FAISS ID; the delta starts empty. A compacted (IndexIDMap)
+    base may leave tombstoned IDs out, which are never handed out again. Same copy-on-write
+    swap as a reload: in-flight searches finish on the old objects.
+    """
+    global _faiss_index, _delta_index, _index_size, _compacted_deleted
+    if new_index.d != EMBEDDING_DIM:
+        raise ValueError(f"Index has dimension {new_index.d}, expected {EMBEDDING_DIM}.")
+    _configure_search_params(new_index)
+    with _load_lock:
+        with _index_lock.write_locked():
+            _faiss_index, _delta_index = new_index, _new_delta_index()
+            _index_size = max(_index_size, _index_id_end(new_index))
+            _compacted_deleted = _vector_metadata.num_deleted() if isinstance(new_index, faiss.IndexIDMap) else 0
+
+def rebuild_faiss_index(vectors: np.ndarray, metadata: VectorMetadata, index_type: Optional[str] = None) -> bool:
+    """
+    Replaces the index, raw vector store and metadata table with ones built from `vectors`
+    (row i = FAISS ID i) and saves them. Used by check_faiss_index.py to repair drift.
 
-def add_embeddings_to_index(embeddings: np.ndarray) -> Tuple[bool, Optional[List[int]]]:
+    Returns:
+        bool: True if the rebuilt index was published and saved.
+    """
+    global _faiss_index, _delta_index, _index_size, _raw_vector_store, _vector_metadata
+    if _use_index_service():
+        logger.error("Rebuild the index on the index service host; this process doesn't own it.")
+        return False
+    if len(metadata) != vectors.shape[0]:
+        logger.error(f"Metadata has {len(metadata)} rows for {vectors.shape[0]} vectors. Not rebuilding.")
+        return False
+    _initialize_faiss_directory()
+    try:
+        index = build_faiss_index(vectors, index_type)
+        _configure_search_params(index)
+        store_path = os.path.join(FAISS_DATA_DIR, RAW_VECTORS_FILENAME)
+        tmp_store_path = f"{store_path}.rebuild"
+        if os.path.exists(tmp_store_path):
+            os.unlink(tmp_store_path)
+        RawVectorStore(tmp_store_path, EMBEDDING_DIM).append(vectors, 0)
+    except Exception as e:
+        logger.error(f"Failed to rebuild FAISS index: {e}")
+        return False
+
+    with _load_lock:
+        with _index_lock.write_locked():
+            with _raw_store_lock:
+                os.replace(tmp_store_path, store_path)
+                _raw_vector_store = RawVectorStore(store_path, EMBEDDING_DIM)
+            _faiss_index, _delta_index = index, _new_delta_index()
+            _index_size = index.ntotal
+            _vector_metadata = metadata
+    logger.info(f"Rebuilt FAISS index with {index.ntotal} vectors ({metadata.num_deleted()} tombstoned).")
+    return save_faiss_index()
+
+def add_embeddings_to_index(embeddings: np.ndarray, metadata: Optional[Dict[str, Sequence]] = None) -> Tuple[bool, Optional[List[int]]]:
     """
     Adds a batch of embeddings to the FAISS index.
     Assumes embeddings are already normalized if using IndexFlatIP for cosine similarity.
+    They go to the delta index and are searchable as soon as this returns.
 
     Args:
         embeddings (np.ndarray): A 2D numpy array of shape (num_embeddings, EMBEDDING_DIM).
+        metadata (Optional[Dict[str, Sequence]]): Per-row values for the filter columns
+            (see VectorMetadata.COLUMNS), e.g. {"event_id": [...], "is_public": [...]}.
+            Rows added without metadata are excluded by every search filter.
 
     Returns:
         Tuple[bool, Optional[List[int]]]: 
@@ -91,6 +786,10 @@ def add_embeddings_to_index(embeddings: np.ndarray) -> Tuple[bool, Optional[List
             - Second element is a list of FAISS IDs (indices) for the added embeddings if successful, 
               otherwise None. These IDs are sequential based on the current ntotal of the index.
     """
+    global _index_size
+    if _use_index_service():
+        return _service_call("add", (False, None), embeddings=embeddings, metadata=metadata)
+
     index = get_faiss_index() # Ensure index is loaded/initialized
     if index is None:
         logger.error("FAISS index is not available. Cannot add embeddings.")
@@ -106,9 +805,23 @@ def add_embeddings_to_index(embeddings: np.ndarray) -> Tuple[bool, Optional[List
 
     try:
         num_added = embeddings.shape[0]
-        starting_id = index.ntotal
-        index.add(embeddings)
-        logger.info(f"Successfully added {num_added} embeddings to FAISS index. Index now has {index.ntotal} total vectors.")
+        with _index_lock.write_locked():
+            # Re-read the globals under the lock: a reload may have swapped them since we looked
+            starting_id = _index_size
+            store = get_raw_vector_store()
+            if store is not None:
+                try:
+                    _sync_raw_vector_store(store)
+                except Exception as e:
+                    logger.error(f"Could not sync raw vector store with the index: {e}")
+                    store = None
+            _delta_index.add_with_ids(embeddings, np.arange(starting_id, starting_id + num_added, dtype=np.int64))
+            _index_size = total = starting_id + num_added
+            if store is not None and not store.append(embeddings, starting_id):
+                logger.warning("Failed to append embeddings to the raw vector store. Re-ranking will fall back to index scores for them.")
+            _vector_metadata.append(starting_id, num_added, **(metadata or {}))
+        logger.info(f"Successfully added {num_added} embeddings to FAISS index. Index now has {total} total vectors.")
+        _maybe_schedule_compaction()
         # The IDs in FAISS are their 0-based indices. So the new IDs range from starting_id to starting_id + num_added - 1
         new_faiss_ids = list(range(starting_id, starting_id + num_added))
         return True, new_faiss_ids
@@ -118,11 +831,16 @@ def add_embeddings_to_index(embeddings: np.ndarray) -> Tuple[bool, Optional[List
 
 def save_faiss_index() -> bool:
     """
-    Saves the current FAISS index to disk.
+    Saves the current FAISS index to disk: the delta and metadata every time, the (large)
+    base only when it changed since the last save.
 
     Returns:
         bool: True if successful, False otherwise.
     """
+    global _saved_base
+    if _use_index_service():
+        return _service_call("save", False)
+
     index = get_faiss_index()
     if index is None:
         logger.error("FAISS index is not available. Cannot save.")
@@ -131,15 +849,31 @@ def save_faiss_index() -> bool:
     _initialize_faiss_directory() # Ensure directory exists
 
     try:
-        logger.info(f"Saving FAISS index with {index.ntotal} vectors to {FAISS_INDEX_PATH}...")
-        faiss.write_index(index, FAISS_INDEX_PATH)
+        # Writing only reads the index, so searches may continue; adds wait so the file is a
+        # consistent snapshot. Write to a temp file and rename so a crash never leaves a torn file.
+        tmp_path = f"{FAISS_INDEX_PATH}.tmp"
+        delta_path = _delta_index_path()
+        with _index_lock.read_locked():
+            index = _faiss_index if _faiss_index is not None else index
+            write_base = index is not _saved_base
+            if write_base:
+                logger.info(f"Saving FAISS base index with {index.ntotal} vectors to {FAISS_INDEX_PATH}...")
+                faiss.write_index(index, tmp_path)
+            faiss.write_index(_delta_index, f"{delta_path}.tmp")
+            _vector_metadata.save(_vector_metadata_path())
+        # Base first: a crash before the delta is replaced leaves overlapping ids, which loading drops
+        if write_base:
+            os.replace(tmp_path, FAISS_INDEX_PATH)
+            _saved_base = index
+        os.replace(f"{delta_path}.tmp", delta_path)
         logger.info("FAISS index saved successfully.")
         return True
     except Exception as e:
         logger.error(f"Failed to save FAISS index to {FAISS_INDEX_PATH}: {e}")
         return False
 
-def search_faiss_index(query_vectors: np.ndarray, k: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+def search_faiss_index(query_vectors: np.ndarray, k: int, rerank: Optional[bool] = None,
+                       search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
     """
     Searches the FAISS index for the top k similar embeddings to the query_vector(s).
     Assumes query_vector is already normalized if using IndexFlatIP for cosine similarity.
@@ -149,6 +883,12 @@ def search_faiss_index(query_vectors: np.ndarray, k: int) -> Optional[Tuple[np.n
                                      If 1D, shape is (EMBEDDING_DIM,).
                                      If 2D, shape is (num_queries, EMBEDDING_DIM).
         k (int): The number of nearest neighbors to retrieve.
+        rerank (Optional[bool]): Fetch k * FAISS_RERANK_FACTOR candidates and re-score them exactly
+                                 against the raw vector store. Defaults to True for compressed/ANN
+                                 indexes and False for the exact flat index.
+        search_filter (Optional[SearchFilter]): Restricts results by event, photographer, visibility
+                                 and event activity. Compiled into a FAISS ID selector so ineligible
+                                 vectors are skipped during the scan rather than filtered afterwards.
 
     Returns:
         Optional[Tuple[np.ndarray, np.ndarray]]: 
@@ -156,8 +896,11 @@ def search_faiss_index(query_vectors: np.ndarray, k: int) -> Optional[Tuple[np.n
             - Indices (I): np.ndarray of shape (num_queries, k) containing FAISS IDs of neighbors.
             Returns None if search fails or index is not available.
     """
+    if _use_index_service():
+        return _service_call("search", None, query_vectors=query_vectors, k=k, rerank=rerank, search_filter=search_filter)
+
     index = get_faiss_index()
-    if index is None or index.ntotal == 0:
+    if index is None or _index_size == 0:
         logger.warning("FAISS index is not available or is empty. Cannot search.")
         return None
 
@@ -184,12 +927,183 @@ def search_faiss_index(query_vectors: np.ndarray, k: int) -> Optional[Tuple[np.n
 
     try:
         logger.info(f"Searching FAISS index for {k} nearest neighbors for {query_vectors.shape[0]} queries.")
-        distances, indices = index.search(query_vectors, k)
+        with _index_lock.read_locked():
+            index = _faiss_index if _faiss_index is not None else index
+            delta = _delta_index
+            if rerank is None:
+                rerank = not _is_exact_index(index)
+            selector = None
+            if search_filter is None:
+                search_filter = SearchFilter(public_only=False, active_events_only=False)
+            # Tombstoned vectors must be skipped even when the caller doesn't filter
+            if not search_filter.is_noop() or _vector_metadata.num_deleted():
+                selector = build_id_selector(_vector_metadata.mask(search_filter, _index_size))
+                if selector is None:
+                    logger.info("No vectors match the search filter.")
+                    num_queries = query_vectors.shape[0]
+                    return np.full((num_queries, k), -np.inf, dtype=np.float32), np.full((num_queries, k), -1, dtype=np.int64)
+            store = get_raw_vector_store() if rerank else None
+            if store is not None and len(store) == 0:
+                store = None
+            num_candidates = k * max(FAISS_RERANK_FACTOR, 1) if store is not None else k
+
+            # Both indexes use global FAISS IDs (the base positionally or through its id map),
+            # so one selector serves both and their hits can be merged directly
+            results = []
+            if index.ntotal:
+                params = _search_params(index, selector) if selector is not None else None
+                results.append(index.search(query_vectors, num_candidates, params=params))
+            if delta.ntotal:
+                params = faiss.SearchParameters(sel=selector) if selector is not None else None
+                results.append(delta.search(query_vectors, num_candidates, params=params))
+            candidate_scores = np.hstack([r[0] for r in results])
+            candidate_ids = np.hstack([r[1] for r in results])
+            if store is not None:
+                distances, indices = store.rerank(query_vectors, candidate_ids, candidate_scores, k)
+            else:
+                distances, indices = _top_k(candidate_scores, candidate_ids, k)
         return distances, indices
     except Exception as e:
         logger.error(f"Error during FAISS search: {e}")
         return None
 
+def get_search_batcher() -> SearchBatcher:
+    global _search_batcher
+    if _search_batcher is None:
+        _search_batcher = SearchBatcher(search_faiss_index, window=FAISS_BATCH_WINDOW_MS / 1000.0,
+                                        max_queries=FAISS_BATCH_MAX_QUERIES)
+    return _search_batcher
+
+def search_batched(query_vectors: np.ndarray, k: int, rerank: Optional[bool] = None,
+                   search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Same as search_faiss_index, but coalesced with concurrent searches into one index call.
+    Request handlers should search through this; with an index service the coalescing
+    happens in the service, across all API workers.
+    """
+    if _use_index_service():
+        return _service_call("search", None, query_vectors=query_vectors, k=k, rerank=rerank, search_filter=search_filter)
+    return get_search_batcher().search(query_vectors, k, rerank=rerank, search_filter=search_filter)
+
+def search_faiss_index_multi(query_vectors: np.ndarray, ks: Sequence[int], rerank: Optional[bool] = None,
+                             search_filter: Optional[SearchFilter] = None) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Searches several query vectors at once (e.g. a few selfies, or a group of friends),
+    each with its own k, in a single batched index call.
+
+    Args:
+        query_vectors (np.ndarray): Array of shape (num_queries, EMBEDDING_DIM).
+        ks (Sequence[int]): Number of neighbors wanted for each query.
+
+    Returns:
+        Optional[List[Tuple[np.ndarray, np.ndarray]]]: Per query, (distances, indices) of length ks[i].
+    """
+    query_vectors = np.atleast_2d(query_vectors)
+    if len(ks) != query_vectors.shape[0]:
+        logger.error(f"Got {len(ks)} k values for {query_vectors.shape[0]} queries.")
+        return None
+    if _use_index_service():
+        return _service_call("search_multi", None, query_vectors=query_vectors, ks=list(ks), rerank=rerank,
+                             search_filter=search_filter)
+    result = search_batched(query_vectors, max(ks), rerank=rerank, search_filter=search_filter)
+    if result is None:
+        return None
+    distances, indices = result
+    return [(distances[i, :k], indices[i, :k]) for i, k in enumerate(ks)]
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps the k best (score, id) columns per row; -1 padding sorts last."""
+    if scores.shape[1] == k:
+        return scores, ids
+    scores = np.where(ids >= 0, scores, -np.inf).astype(np.float32)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def _build_base_index(vectors: np.ndarray, faiss_ids: np.ndarray) -> faiss.Index:
+    """
+    Builds a base index holding `vectors` under their FAISS IDs, with the FAISS_INDEX_TYPE codec.
+    Falls back to a flat codec while there are too few vectors to train the configured one.
+    """
+    try:
+        codec = create_faiss_index(FAISS_INDEX_TYPE, num_vectors=vectors.shape[0])
+        if not codec.is_trained:
+            logger.info(f"Training {FAISS_INDEX_TYPE} base index on {vectors.shape[0]} vectors...")
+            codec.train(vectors)
+    except Exception as e:
+        logger.warning(f"Could not train a '{FAISS_INDEX_TYPE}' base index on {vectors.shape[0]} vectors ({e}). Using a flat base.")
+        codec = create_faiss_index("flat")
+    base = faiss.IndexIDMap2(codec)
+    base.add_with_ids(vectors, faiss_ids)
+    return base
+
+def compact_index() -> bool:
+    """
+    Folds the delta index and tombstones into a new base index.
+
+    The new base is built from the raw vector store (exact vectors, so no codec error
+    compounds) with only live vectors, while searches and adds carry on against the current
+    indexes. The swap itself takes the write lock briefly; vectors added during the build move
+    to the new, otherwise empty, delta.
+
+    Returns:
+        bool: True if a new base was published and saved.
+    """
+    global _faiss_index, _delta_index, _compacted_deleted
+    if _use_index_service():
+        return _service_call("compact", False)
+    if get_faiss_index() is None:
+        return False
+    if not _compaction_lock.acquire(blocking=False):
+        logger.info("FAISS compaction already running.")
+        return False
+    try:
+        with _index_lock.read_locked():
+            delta = _delta_index
+            delta_count = delta.ntotal
+            end = _index_size
+            deleted = np.zeros(end, dtype=bool)
+            known = min(end, len(_vector_metadata))
+            deleted[:known] = _vector_metadata.column("deleted")[:known]
+            deleted_count = _vector_metadata.num_deleted()
+
+        store = get_raw_vector_store()
+        if store is None or len(store) < end:
+            logger.error("Raw vector store doesn't cover the index; cannot compact. Run check_faiss_index.py --rebuild raw.")
+            return False
+        started = time.perf_counter()
+        live_ids = np.flatnonzero(~deleted).astype(np.int64)
+        base = _build_base_index(store.get(live_ids), live_ids)
+        _configure_search_params(base)
+
+        with _load_lock:
+            with _index_lock.write_locked():
+                if _delta_index is not delta:
+                    logger.warning("FAISS index was replaced during compaction; discarding the compacted base.")
+                    return False
+                new_delta = _new_delta_index()
+                if delta.ntotal > delta_count:
+                    # Added while the base was being built; ids follow insertion order in the id map
+                    late_ids = faiss.vector_to_array(delta.id_map)[delta_count:]
+                    late_vectors = faiss.downcast_index(delta.index).reconstruct_n(delta_count, delta.ntotal - delta_count)
+                    new_delta.add_with_ids(late_vectors, late_ids)
+                _faiss_index, _delta_index = base, new_delta
+                _compacted_deleted = deleted_count
+        logger.info(f"Compacted FAISS index: base has {base.ntotal} live vectors, delta {new_delta.ntotal}, "
+                    f"{end - live_ids.size} tombstones dropped ({time.perf_counter() - started:.1f}s).")
+    finally:
+        _compaction_lock.release()
+    return save_faiss_index()
+
+def _maybe_schedule_compaction() -> None:
+    """Starts a background compaction when the delta or the pending tombstones grow too large."""
+    delta = _delta_index
+    if delta is None or _compaction_lock.locked():
+        return
+    pending_deleted = _vector_metadata.num_deleted() - _compacted_deleted
+    if delta.ntotal < FAISS_DELTA_MAX_VECTORS and pending_deleted <= FAISS_COMPACT_DELETED_RATIO * max(_index_size, 1):
+        return
+    threading.Thread(target=compact_index, name="faiss-compaction", daemon=True).start()
+
 # Example usage (can be run directly for testing)
 if __name__ == '__main__':
     logger.info("Running FAISS utils example...")
@@ -197,7 +1111,7 @@ if __name__ == '__main__':
     # 1. Get (load or create) index
     idx = get_faiss_index()
     if idx:
-        logger.info(f"Initial index size: {idx.ntotal}")
+        logger.info(f"Initial index size: {get_index_size()}")
 
         # 2. Add some dummy embeddings
         num_dummy_embeddings = 10
@@ -208,7 +1122,7 @@ if __name__ == '__main__':
         success, new_ids = add_embeddings_to_index(dummy_embeddings)
         if success:
             logger.info(f"Added {len(new_ids)} dummy embeddings. New FAISS IDs: {new_ids}")
-            logger.info(f"Index size after adding: {idx.ntotal}")
+            logger.info(f"Index size after adding: {get_index_size()}")
 
             # 3. Add more embeddings to test sequential IDs
             more_dummy_embeddings = np.random.rand(5, EMBEDDING_DIM).astype(np.float32)
@@ -216,7 +1130,7 @@ if __name__ == '__main__':
             success_more, new_ids_more = add_embeddings_to_index(more_dummy_embeddings)
             if success_more:
                 logger.info(f"Added {len(new_ids_more)} more dummy embeddings. New FAISS IDs: {new_ids_more}")
-                logger.info(f"Index size after adding more: {idx.ntotal}")
+                logger.info(f"Index size after adding more: {get_index_size()}")
 
             # 4. Save the index
             if save_faiss_index():
@@ -224,13 +1138,14 @@ if __name__ == '__main__':
 
                 # 5. Test loading by forcing reload
                 logger.info("Forcing reload of index...")
+                size_before_reload = get_index_size()
                 idx_reloaded = get_faiss_index(force_reload=True)
                 if idx_reloaded:
-                    logger.info(f"Reloaded index size: {idx_reloaded.ntotal}")
-                    assert idx_reloaded.ntotal == idx.ntotal, "Reloaded index size mismatch!"
+                    logger.info(f"Reloaded index size: {get_index_size()}")
+                    assert get_index_size() == size_before_reload, "Reloaded index size mismatch!"
 
                     # 6. Search the index
-                    if idx_reloaded.ntotal > 0:
+                    if get_index_size() > 0:
                         query_vector = dummy_embeddings[0].reshape(1, -1) # Search for the first embedding we added
                         # query_vector already normalized
                         
@@ -263,4 +1178,4 @@ if __name__ == '__main__':
     #     logger.warning(f"Removing existing FAISS index at {FAISS_INDEX_PATH} for fresh test run.")
     #     os.remove(FAISS_INDEX_PATH)
     # _faiss_index = None # Clear global var
-    # logger.info("Cleared FAISS index for next run (if any).") 
\ No newline at end of file
+    # logger.info("Cleared FAISS index for next run (if any).") 
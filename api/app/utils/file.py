@@ -1,6 +1,7 @@
 import os
 import shutil
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from fastapi import UploadFile
 from PIL import Image
 import uuid
@@ -67,6 +68,31 @@ def create_thumbnail(file_path: str, event_id: int) -> str:
     return thumbnail_path
 
 
+# EXIF tags: DateTimeOriginal/SubsecTimeOriginal live in the Exif IFD, DateTime in IFD0
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_SUBSEC_TIME_ORIGINAL = 37521
+EXIF_DATETIME = 306
+
+
+def read_capture_time(file_path: str) -> Optional[datetime]:
+    """When the photo was taken, from its EXIF data; None if the file has no usable date."""
+    try:
+        with Image.open(file_path) as img:
+            exif = img.getexif()
+            exif_ifd = exif.get_ifd(EXIF_IFD)
+            value = exif_ifd.get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+            if not value:
+                return None
+            captured = datetime.strptime(str(value).strip(), "%Y:%m:%d %H:%M:%S")
+            subsec = str(exif_ifd.get(EXIF_SUBSEC_TIME_ORIGINAL) or "").strip()
+            if subsec.isdigit():
+                captured = captured.replace(microsecond=int(subsec[:6].ljust(6, "0")))
+            return captured
+    except Exception:
+        return None
+
+
 def delete_file(file_path: str) -> bool:
     """Delete a file from the filesystem."""
     if os.path.exists(file_path):
@@ -0,0 +1,50 @@
+"""
+Group search: photos of several people at once (a group of friends, or a few selfies of
+one runner) from one query vector per face.
+
+Every face is searched in one batched index call (VectorStore.search_multi), each with its
+own k, so a face expected in many photos can ask for more hits than the others. A photo
+scores the sum of each face's best match in it divided by the number of faces, so photos
+showing more of the group rank first.
+"""
+
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.vector_metadata import SearchFilter
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+def rank_group(query_vectors: np.ndarray, ks: Sequence[int],
+               search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Ranks photos for a group query.
+
+    Args:
+        query_vectors (np.ndarray): One L2-normalized embedding per face, shape (faces, dim).
+        ks (Sequence[int]): Person hits fetched for each face.
+        search_filter (Optional[SearchFilter]): Restricts every face's search, e.g. to an event.
+
+    Returns:
+        Optional[Tuple[np.ndarray, np.ndarray]]: (photo_ids, scores) best first, or None if
+        the vector search failed.
+    """
+    store = get_vector_store()
+    results = store.search_multi(query_vectors, ks, search_filter=search_filter)
+    if results is None:
+        return None
+    totals: Dict[int, float] = {}
+    for distances, indices in results:
+        photo_ids, scores = store.aggregate_to_photos(distances.reshape(1, -1), indices.reshape(1, -1))
+        for photo_id, score in zip(photo_ids.tolist(), scores.tolist()):
+            totals[photo_id] = totals.get(photo_id, 0.0) + score
+    if not totals:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    photo_ids = np.fromiter(totals.keys(), dtype=np.int64, count=len(totals))
+    scores = np.fromiter(totals.values(), dtype=np.float32, count=len(totals)) / len(results)
+    order = np.argsort(-scores, kind="stable")
+    return photo_ids[order], scores[order]
@@ -0,0 +1,430 @@
+"""
+Online clustering of person detections into per-event identities.
+
+A background pass assigns each new PersonEmbedding to the nearest identity cluster of its
+event (cosine similarity to the cluster centroid) or starts a new cluster, using the
+vectors already in the vector store. A slower periodic pass merges clusters whose
+centroids have converged. Searches that resolve to a cluster add its members (one indexed
+lookup on person_embeddings.cluster_id) to their kNN results, which still cover the
+detections no pass has clustered yet.
+
+Run the background passes in one process only (IDENTITY_CLUSTERING=1 on a single API
+worker, or cluster_identities.py); concurrent writers would cluster the same detections
+twice. The API leaves them off unless IDENTITY_CLUSTERING=1 is set.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.utils.result_cache import TTLCache, bump_ingest_watermark
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Cosine similarity to a centroid needed to join a cluster rather than start a new one
+IDENTITY_ASSIGN_THRESHOLD = float(os.getenv("IDENTITY_ASSIGN_THRESHOLD", "0.88"))
+# Centroid similarity at which two clusters are merged
+IDENTITY_MERGE_THRESHOLD = float(os.getenv("IDENTITY_MERGE_THRESHOLD", "0.92"))
+IDENTITY_CLUSTER_BATCH = int(os.getenv("IDENTITY_CLUSTER_BATCH", "500")) # Detections per pass
+IDENTITY_CLUSTER_INTERVAL_SECONDS = float(os.getenv("IDENTITY_CLUSTER_INTERVAL_SECONDS", "30"))
+IDENTITY_MERGE_INTERVAL_SECONDS = float(os.getenv("IDENTITY_MERGE_INTERVAL_SECONDS", "600"))
+# How long searches reuse an event's centroids before re-reading them
+IDENTITY_CENTROID_TTL_SECONDS = float(os.getenv("IDENTITY_CENTROID_TTL_SECONDS", "60"))
+# Clusters compared at once when looking for merges, to bound the similarity block's size
+_MERGE_BLOCK = 1024
+
+# event_id -> (cluster ids, centroids) for resolving searches
+_centroids = TTLCache(max_entries=256, ttl=IDENTITY_CENTROID_TTL_SECONDS)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _EventClusters:
+    """An event's clusters as parallel arrays, with room to grow during an assignment pass."""
+
+    def __init__(self, ids: List[int], sums: np.ndarray, sizes: List[int], spare: int = 0):
+        count, dim = len(ids), sums.shape[1] if sums.ndim == 2 else 0
+        self.ids: List[Optional[int]] = list(ids) # None for clusters not flushed yet
+        self.count = count
+        self.sums = np.zeros((count + spare, dim), dtype=np.float32)
+        self.sums[:count] = sums
+        self.centroids = np.zeros_like(self.sums)
+        self.centroids[:count] = _normalize(sums) if count else sums
+        self.sizes = np.zeros(count + spare, dtype=np.int64)
+        self.sizes[:count] = sizes
+
+    def add(self, index: int, vector: np.ndarray) -> None:
+        self.sums[index] += vector
+        self.sizes[index] += 1
+        self.centroids[index] = _normalize(self.sums[index])
+
+    def new(self, vector: np.ndarray) -> int:
+        index = self.count
+        self.ids.append(None)
+        self.count += 1
+        self.sums[index] = vector
+        self.sizes[index] = 1
+        self.centroids[index] = _normalize(vector)
+        return index
+
+
+def _load_event_clusters(db: Session, event_id: int, dim: int, spare: int = 0) -> _EventClusters:
+    from app.models.identity_cluster import IdentityCluster
+
+    rows = (
+        db.query(IdentityCluster.id, IdentityCluster.vector_sum, IdentityCluster.size)
+        .filter(IdentityCluster.event_id == event_id)
+        .order_by(IdentityCluster.id)
+        .all()
+    )
+    sums = np.zeros((len(rows), dim), dtype=np.float32)
+    for i, row in enumerate(rows):
+        sums[i] = np.frombuffer(row.vector_sum, dtype=np.float32)
+    return _EventClusters([row.id for row in rows], sums, [row.size for row in rows], spare)
+
+
+def assign_pending(db: Session, batch_size: int = IDENTITY_CLUSTER_BATCH, skip: Optional[Set[int]] = None) -> int:
+    """
+    Clusters up to `batch_size` detections that have no cluster yet, oldest first, and
+    commits. Two people detected in the same photo never share a cluster. Detections whose
+    vector is gone from the store are left unclustered and their ids added to `skip`, which
+    later passes leave out.
+
+    Returns:
+        int: Detections looked at.
+    """
+    from app.models.embedding import PersonEmbedding
+    from app.models.identity_cluster import IdentityCluster
+
+    query = db.query(PersonEmbedding).filter(
+        PersonEmbedding.cluster_id.is_(None),
+        PersonEmbedding.event_id.isnot(None),
+    )
+    if skip:
+        query = query.filter(PersonEmbedding.id.notin_(list(skip)))
+    pending = query.order_by(PersonEmbedding.id).limit(batch_size).all()
+    if not pending:
+        return 0
+
+    store = get_vector_store()
+    found_ids, vectors = store.get_vectors([row.faiss_id for row in pending])
+    vector_by_faiss_id = {int(faiss_id): vectors[i] for i, faiss_id in enumerate(found_ids)}
+    by_event = defaultdict(list)
+    for row in pending:
+        if row.faiss_id in vector_by_faiss_id:
+            by_event[row.event_id].append(row)
+        else:
+            logger.warning(f"No vector for person embedding {row.id} (faiss_id {row.faiss_id}); not clustered.")
+            if skip is not None:
+                skip.add(row.id)
+    if not vector_by_faiss_id:
+        return len(pending)
+    dim = vectors.shape[1]
+
+    assigned = 0
+    for event_id, rows in by_event.items():
+        clusters = _load_event_clusters(db, event_id, dim, spare=len(rows))
+        # Clusters already present in each photo, including detections clustered earlier
+        taken = defaultdict(set)
+        index_of = {cluster_id: i for i, cluster_id in enumerate(clusters.ids)}
+        for photo_id, cluster_id in db.query(PersonEmbedding.photo_id, PersonEmbedding.cluster_id).filter(
+            PersonEmbedding.photo_id.in_({row.photo_id for row in rows}),
+            PersonEmbedding.cluster_id.isnot(None),
+        ):
+            if cluster_id in index_of:
+                taken[photo_id].add(index_of[cluster_id])
+
+        members = defaultdict(list) # cluster index -> pending rows joining it
+        for row in rows:
+            vector = vector_by_faiss_id[row.faiss_id]
+            best = -1
+            if clusters.count:
+                similarities = clusters.centroids[:clusters.count] @ vector
+                for index in taken[row.photo_id]:
+                    similarities[index] = -np.inf
+                candidate = int(np.argmax(similarities))
+                if similarities[candidate] >= IDENTITY_ASSIGN_THRESHOLD:
+                    best = candidate
+            if best >= 0:
+                clusters.add(best, vector)
+            else:
+                best = clusters.new(vector)
+            taken[row.photo_id].add(best)
+            members[best].append(row)
+
+        # Existing clusters get this pass's members added to their current row, not to the
+        # copy loaded above: photos deleted meanwhile may have taken members out
+        existing = {
+            cluster.id: cluster for cluster in db.query(IdentityCluster).filter(
+                IdentityCluster.id.in_([clusters.ids[index] for index in members if clusters.ids[index] is not None])
+            ).with_for_update()
+        }
+        for index, rows_in_cluster in members.items():
+            added = np.sum([vector_by_faiss_id[row.faiss_id] for row in rows_in_cluster], axis=0, dtype=np.float32)
+            cluster = existing.get(clusters.ids[index])
+            if cluster is None:
+                cluster = IdentityCluster(event_id=event_id, vector_sum=added.tobytes(), size=len(rows_in_cluster))
+                db.add(cluster)
+            else:
+                cluster.vector_sum = (np.frombuffer(cluster.vector_sum, dtype=np.float32) + added).tobytes()
+                cluster.size += len(rows_in_cluster)
+            db.flush()
+            for row in rows_in_cluster:
+                row.cluster_id = cluster.id
+        assigned += len(rows)
+
+    db.commit()
+    for event_id in by_event:
+        bump_ingest_watermark(event_id)
+        _centroids.pop(event_id)
+    logger.info(f"Clustered {assigned} person detections in {len(by_event)} event(s).")
+    return len(pending)
+
+
+def release_detections(db: Session, photo_ids: Sequence[int]) -> None:
+    """
+    Takes the photos' detections out of their clusters, subtracting their vectors from the
+    cluster sums, before the photos are deleted or moved to another event, so centroids
+    don't drift toward people who are gone. Clusters left empty are deleted. Call while the
+    vectors are still in the store; the caller commits.
+    """
+    from app.models.embedding import PersonEmbedding
+    from app.models.identity_cluster import IdentityCluster
+
+    rows = db.query(PersonEmbedding.id, PersonEmbedding.faiss_id, PersonEmbedding.cluster_id).filter(
+        PersonEmbedding.photo_id.in_(list(photo_ids)), PersonEmbedding.cluster_id.isnot(None)
+    ).all()
+    if not rows:
+        return
+    found_ids, vectors = get_vector_store().get_vectors([row.faiss_id for row in rows])
+    vector_by_faiss_id = {int(faiss_id): vectors[i] for i, faiss_id in enumerate(found_ids)}
+    members = defaultdict(list)
+    for row in rows:
+        members[row.cluster_id].append(row)
+
+    db.query(PersonEmbedding).filter(PersonEmbedding.id.in_([row.id for row in rows])).update(
+        {PersonEmbedding.cluster_id: None}, synchronize_session=False
+    )
+    for cluster in db.query(IdentityCluster).filter(IdentityCluster.id.in_(list(members))).with_for_update():
+        leaving = members[cluster.id]
+        cluster.size -= len(leaving)
+        if cluster.size <= 0:
+            db.delete(cluster)
+        else:
+            vector_sum = np.frombuffer(cluster.vector_sum, dtype=np.float32).copy()
+            for row in leaving:
+                if row.faiss_id in vector_by_faiss_id:
+                    vector_sum -= vector_by_faiss_id[row.faiss_id]
+                else:
+                    logger.warning(f"No vector for person embedding {row.id}; cluster {cluster.id}'s centroid keeps it.")
+            cluster.vector_sum = vector_sum.tobytes()
+        _centroids.pop(cluster.event_id)
+
+
+def merge_event_clusters(db: Session, event_id: int) -> int:
+    """
+    Merges clusters of an event whose centroids are at least IDENTITY_MERGE_THRESHOLD
+    similar, most similar pairs first, unless they share a photo (then they are two
+    different people standing together). Commits.
+
+    Returns:
+        int: Number of clusters merged away.
+    """
+    from app.models.embedding import PersonEmbedding
+    from app.models.identity_cluster import IdentityCluster
+
+    sample = db.query(IdentityCluster.vector_sum).filter(IdentityCluster.event_id == event_id).first()
+    if sample is None:
+        return 0
+    clusters = _load_event_clusters(db, event_id, len(sample.vector_sum) // 4)
+    if clusters.count < 2:
+        return 0
+
+    pairs = []
+    centroids = clusters.centroids[:clusters.count]
+    for start in range(0, clusters.count, _MERGE_BLOCK):
+        block = centroids[start:start + _MERGE_BLOCK] @ centroids.T
+        rows, cols = np.nonzero(block >= IDENTITY_MERGE_THRESHOLD)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if start + row < col:
+                pairs.append((float(block[row, col]), start + row, col))
+    if not pairs:
+        return 0
+    pairs.sort(reverse=True)
+
+    index_of = {cluster_id: i for i, cluster_id in enumerate(clusters.ids)}
+    photos = defaultdict(set)
+    for photo_id, cluster_id in db.query(PersonEmbedding.photo_id, PersonEmbedding.cluster_id).filter(
+        PersonEmbedding.event_id == event_id, PersonEmbedding.cluster_id.isnot(None)
+    ):
+        if cluster_id in index_of:
+            photos[index_of[cluster_id]].add(photo_id)
+
+    parent = list(range(clusters.count))
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for _, a, b in pairs:
+        a, b = find(a), find(b)
+        if a == b or photos[a] & photos[b]:
+            continue
+        # Similarities were computed before earlier merges moved the centroids
+        if float(clusters.centroids[a] @ clusters.centroids[b]) < IDENTITY_MERGE_THRESHOLD:
+            continue
+        if clusters.sizes[a] < clusters.sizes[b]:
+            a, b = b, a
+        parent[b] = a
+        clusters.sums[a] += clusters.sums[b]
+        clusters.sizes[a] += clusters.sizes[b]
+        clusters.centroids[a] = _normalize(clusters.sums[a])
+        photos[a] |= photos.pop(b)
+
+    merged_into = defaultdict(list)
+    for index in range(clusters.count):
+        root = find(index)
+        if root != index:
+            merged_into[root].append(index)
+    if not merged_into:
+        return 0
+
+    # Totals come from the current rows, which photo deletes may have changed since loading
+    involved = [clusters.ids[index] for root, absorbed in merged_into.items() for index in [root] + absorbed]
+    current = {
+        cluster.id: cluster
+        for cluster in db.query(IdentityCluster).filter(IdentityCluster.id.in_(involved)).with_for_update()
+    }
+    removed = 0
+    for root, absorbed in merged_into.items():
+        root_cluster = current.get(clusters.ids[root])
+        if root_cluster is None:
+            continue
+        absorbed_clusters = [current[clusters.ids[index]] for index in absorbed if clusters.ids[index] in current]
+        vector_sum = np.frombuffer(root_cluster.vector_sum, dtype=np.float32).copy()
+        for cluster in absorbed_clusters:
+            vector_sum += np.frombuffer(cluster.vector_sum, dtype=np.float32)
+            root_cluster.size += cluster.size
+        root_cluster.vector_sum = vector_sum.tobytes()
+        absorbed_ids = [cluster.id for cluster in absorbed_clusters]
+        db.query(PersonEmbedding).filter(PersonEmbedding.cluster_id.in_(absorbed_ids)).update(
+            {PersonEmbedding.cluster_id: root_cluster.id}, synchronize_session=False
+        )
+        for cluster in absorbed_clusters:
+            db.delete(cluster)
+        removed += len(absorbed_clusters)
+    db.commit()
+    bump_ingest_watermark(event_id)
+    _centroids.pop(event_id)
+    logger.info(f"Merged {removed} identity clusters in event {event_id}.")
+    return removed
+
+
+def merge_all_events(db: Session) -> int:
+    from app.models.identity_cluster import IdentityCluster
+
+    event_ids = [row.event_id for row in db.query(IdentityCluster.event_id).distinct() if row.event_id is not None]
+    return sum(merge_event_clusters(db, event_id) for event_id in event_ids)
+
+
+def resolve_cluster(db: Session, event_id: int, query_vector: np.ndarray) -> Optional[Tuple[int, float]]:
+    """
+    The event cluster whose centroid best matches `query_vector`, as (cluster_id, similarity),
+    or None if no centroid reaches IDENTITY_ASSIGN_THRESHOLD.
+    """
+    cached = _centroids.get(event_id)
+    if cached is None:
+        clusters = _load_event_clusters(db, event_id, int(np.asarray(query_vector).shape[-1]))
+        cached = (clusters.ids, clusters.centroids[:clusters.count].copy())
+        _centroids.put(event_id, cached)
+    cluster_ids, centroids = cached
+    if not cluster_ids:
+        return None
+    similarities = centroids @ np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    best = int(np.argmax(similarities))
+    if similarities[best] < IDENTITY_ASSIGN_THRESHOLD:
+        return None
+    return cluster_ids[best], float(similarities[best])
+
+
+def cluster_photo_ids(db: Session, cluster_id: int, exclude_photo_ids: Sequence[int] = ()) -> List[int]:
+    """Public photos of active events showing a cluster's members, in photo id order."""
+    from app.models.embedding import PersonEmbedding
+    from app.models.event import Event
+    from app.models.photo import Photo
+
+    query = (
+        db.query(PersonEmbedding.photo_id)
+        .join(Photo, Photo.id == PersonEmbedding.photo_id)
+        .join(Event, Event.id == Photo.event_id)
+        .filter(PersonEmbedding.cluster_id == cluster_id, Photo.is_public == True, Event.is_active == True)
+    )
+    if exclude_photo_ids:
+        query = query.filter(PersonEmbedding.photo_id.notin_(list(exclude_photo_ids)))
+    return [row.photo_id for row in query.distinct().order_by(PersonEmbedding.photo_id)]
+
+
+def merge_cluster_ranking(db: Session, cluster_id: int, cluster_score: float, photo_ids: np.ndarray,
+                          scores: np.ndarray, exclude_photo_ids: Sequence[int] = ()) -> Tuple[np.ndarray, np.ndarray, List[Optional[str]]]:
+    """
+    Adds a cluster's photos to a vector search ranking. Members score at least
+    `cluster_score` and are marked "identity" (ties keep their vector score order); photos
+    only the vector search found keep their own score, so detections not clustered yet
+    (e.g. uploads since the last pass) are still returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, List[Optional[str]]]: (photo_ids, scores, match_types), best first.
+    """
+    members = set(cluster_photo_ids(db, cluster_id, exclude_photo_ids))
+    vector_scores = dict(zip(np.asarray(photo_ids).tolist(), np.asarray(scores, dtype=np.float32).tolist()))
+    ranked = [
+        (max(score, cluster_score) if photo_id in members else score, score, photo_id)
+        for photo_id, score in vector_scores.items()
+    ]
+    ranked += [(cluster_score, -np.inf, photo_id) for photo_id in sorted(members - vector_scores.keys())]
+    ranked.sort(key=lambda item: (-item[0], -item[1]))
+    return (
+        np.asarray([photo_id for _, _, photo_id in ranked], dtype=np.int64),
+        np.asarray([score for score, _, _ in ranked], dtype=np.float32),
+        ["identity" if photo_id in members else None for _, _, photo_id in ranked],
+    )
+
+
+def run_clustering(session_factory, stop: Optional[threading.Event] = None,
+                   interval: float = IDENTITY_CLUSTER_INTERVAL_SECONDS,
+                   merge_interval: float = IDENTITY_MERGE_INTERVAL_SECONDS) -> None:
+    """
+    Assigns new detections every `interval` seconds and merges every `merge_interval`, until
+    `stop` is set. Detections without a vector are only retried after a restart.
+    """
+    stop = stop or threading.Event()
+    last_merge = time.monotonic()
+    skip: Set[int] = set()
+    while not stop.is_set():
+        db = session_factory()
+        try:
+            # Drain the backlog in batches before sleeping
+            while not stop.is_set():
+                seen = assign_pending(db, skip=skip)
+                if seen < IDENTITY_CLUSTER_BATCH:
+                    break
+            if time.monotonic() - last_merge >= merge_interval:
+                merge_all_events(db)
+                last_merge = time.monotonic()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Identity clustering pass failed: {e}")
+        finally:
+            db.close()
+        stop.wait(interval)
@@ -0,0 +1,276 @@
+"""
+Scatter-gather router over several index service nodes.
+
+Vectors are sharded by event (event_id % number of nodes), so an event-scoped search touches
+one node while cross-event searches fan out to every node in parallel and are merged.
+Each node numbers its vectors 0..n-1; the router exposes global FAISS IDs with the node
+number in the high bits, so ids stay unique across nodes and a single node keeps plain ids.
+
+Turning sharding on or changing the node count moves events between nodes: split the
+existing index with check_faiss_index.py --reshard N first. A node refuses to start while it
+holds vectors of events another node owns.
+"""
+
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.vector_metadata import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+NODE_ID_SHIFT = 40 # Up to 2^40 vectors per node, 2^23 nodes within a signed 64-bit id
+LOCAL_ID_MASK = (1 << NODE_ID_SHIFT) - 1
+
+
+def to_global_ids(local_ids: np.ndarray, node: int) -> np.ndarray:
+    local_ids = np.asarray(local_ids, dtype=np.int64)
+    return np.where(local_ids >= 0, (np.int64(node) << NODE_ID_SHIFT) | local_ids, -1)
+
+
+def node_id_range(node: int) -> Tuple[int, int]:
+    """[start, end) of the global FAISS ids stored on `node`."""
+    return node << NODE_ID_SHIFT, (node + 1) << NODE_ID_SHIFT
+
+
+def event_nodes(event_ids: Sequence[int], num_nodes: int) -> np.ndarray:
+    """Node owning each event (event_id % num_nodes); vectors without an event live on node 0."""
+    event_ids = np.asarray(event_ids, dtype=np.int64)
+    return np.where(event_ids >= 0, event_ids % max(num_nodes, 1), 0)
+
+
+def split_global_ids(global_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (node, local_id) arrays for global FAISS IDs."""
+    global_ids = np.asarray(global_ids, dtype=np.int64)
+    return global_ids >> NODE_ID_SHIFT, global_ids & LOCAL_ID_MASK
+
+
+class IndexRouter:
+    """
+    Client-side router for one or more index nodes. `nodes` are IndexServiceClient-like
+    objects exposing call(op, **kwargs). Method names match the index service operations,
+    so faiss_utils can forward any call with call(op, **kwargs).
+    """
+
+    def __init__(self, nodes: List, timeout: float = 2.0):
+        self.nodes = nodes
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(nodes)), thread_name_prefix="index-router")
+
+    def call(self, op: str, **kwargs):
+        handler = getattr(self, op, None)
+        if handler is None or op.startswith("_"):
+            raise ValueError(f"Unknown index operation '{op}'")
+        return handler(**kwargs)
+
+    def node_for_event(self, event_id: Optional[int]) -> int:
+        return int(event_nodes([-1 if event_id is None else event_id], len(self.nodes))[0])
+
+    def _nodes_for_filter(self, search_filter: Optional[SearchFilter]) -> List[int]:
+        if search_filter is None or search_filter.event_ids is None:
+            return list(range(len(self.nodes)))
+        return sorted({self.node_for_event(e) for e in search_filter.event_ids})
+
+    def _fan_out(self, node_requests: Dict[int, Tuple[str, Dict]], timeout: Optional[float]) -> Dict[int, object]:
+        """
+        Runs one request per node in parallel. Nodes that fail or miss the deadline are logged
+        and left out of the result, so callers get whatever the healthy nodes returned.
+        """
+        if len(node_requests) == 1:
+            node, (op, kwargs) = next(iter(node_requests.items()))
+            try:
+                return {node: self.nodes[node].call(op, **kwargs)}
+            except Exception as e:
+                logger.warning(f"Index node {node} failed '{op}': {e}")
+                return {}
+
+        futures = {
+            self._executor.submit(self.nodes[node].call, op, **kwargs): node
+            for node, (op, kwargs) in node_requests.items()
+        }
+        done, not_done = wait(futures, timeout=timeout)
+        results = {}
+        for future in done:
+            node = futures[future]
+            try:
+                results[node] = future.result()
+            except Exception as e:
+                logger.warning(f"Index node {node} failed: {e}")
+        for future in not_done:
+            future.cancel()
+            logger.warning(f"Index node {futures[future]} did not answer within {timeout}s; returning partial results.")
+        return results
+
+    def _broadcast(self, op: str, **kwargs) -> Dict[int, object]:
+        return self._fan_out({node: (op, kwargs) for node in range(len(self.nodes))}, self.timeout)
+
+    def search(self, query_vectors: np.ndarray, k: int, rerank: Optional[bool] = None,
+               search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        kwargs = {"query_vectors": query_vectors, "k": k, "rerank": rerank, "search_filter": search_filter}
+        targets = self._nodes_for_filter(search_filter)
+        results = self._fan_out({node: ("search", kwargs) for node in targets}, self.timeout)
+        results = {node: result for node, result in results.items() if result is not None}
+        if not results:
+            return None
+        if len(results) == 1:
+            node, (distances, indices) = next(iter(results.items()))
+            return distances, to_global_ids(indices, node)
+
+        # Merge each query's per-node top-k lists (each sorted by score desc) with a heap
+        num_queries = query_vectors.shape[0]
+        merged_d = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        merged_i = np.full((num_queries, k), -1, dtype=np.int64)
+        per_node = [(distances, to_global_ids(indices, node)) for node, (distances, indices) in results.items()]
+        for q in range(num_queries):
+            streams = [zip(-d[q][i[q] >= 0], i[q][i[q] >= 0]) for d, i in per_node]
+            for rank, (neg_score, global_id) in enumerate(heapq.merge(*streams)):
+                if rank >= k:
+                    break
+                merged_d[q, rank] = -neg_score
+                merged_i[q, rank] = global_id
+        return merged_d, merged_i
+
+    def search_multi(self, query_vectors: np.ndarray, ks: Sequence[int], rerank: Optional[bool] = None,
+                     search_filter: Optional[SearchFilter] = None) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """One scatter-gather search at the largest k, cut to each query's own k."""
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if len(ks) != query_vectors.shape[0]:
+            logger.error(f"Got {len(ks)} k values for {query_vectors.shape[0]} queries.")
+            return None
+        result = self.search(query_vectors, max(ks), rerank=rerank, search_filter=search_filter)
+        if result is None:
+            return None
+        distances, indices = result
+        return [(distances[i, :k], indices[i, :k]) for i, k in enumerate(ks)]
+
+    def add(self, embeddings: np.ndarray, metadata: Optional[Dict[str, Sequence]] = None) -> Tuple[bool, Optional[List[int]]]:
+        """Routes rows to the node owning their event. All-or-nothing from the caller's view."""
+        metadata = metadata or {}
+        event_ids = np.asarray(metadata.get("event_id", [-1] * len(embeddings)), dtype=np.int64)
+        nodes = np.array([self.node_for_event(e) for e in event_ids], dtype=np.int64)
+
+        global_ids = np.full(len(embeddings), -1, dtype=np.int64)
+        for node in np.unique(nodes):
+            rows = np.flatnonzero(nodes == node)
+            node_metadata = {name: np.asarray(values)[rows] for name, values in metadata.items()}
+            try:
+                ok, local_ids = self.nodes[node].call("add", embeddings=embeddings[rows], metadata=node_metadata)
+            except Exception as e:
+                logger.error(f"Index node {node} failed to add embeddings: {e}")
+                ok, local_ids = False, None
+            if not ok:
+                # Earlier nodes may have accepted their rows; tombstone them so nothing half-added is searchable
+                added = global_ids[global_ids >= 0]
+                if added.size:
+                    self.delete(added.tolist())
+                return False, None
+            global_ids[rows] = to_global_ids(local_ids, int(node))
+        return True, global_ids.tolist()
+
+    def _group_by_node(self, faiss_ids: Sequence[int]) -> Tuple[Dict[int, np.ndarray], np.ndarray]:
+        """Returns ({node: row positions}, local ids) for a list of global ids."""
+        nodes, local_ids = split_global_ids(faiss_ids)
+        return {int(node): np.flatnonzero(nodes == node) for node in np.unique(nodes)}, local_ids
+
+    def delete(self, faiss_ids: Sequence[int]) -> None:
+        groups, local_ids = self._group_by_node(faiss_ids)
+        for node, rows in groups.items():
+            self.nodes[node].call("delete", faiss_ids=local_ids[rows].tolist())
+
+    def update_metadata(self, faiss_ids: Sequence[int], columns: Dict[str, Sequence]) -> None:
+        groups, local_ids = self._group_by_node(faiss_ids)
+        for node, rows in groups.items():
+            node_columns = {name: np.asarray(values)[rows] for name, values in columns.items()}
+            self.nodes[node].call("update_metadata", faiss_ids=local_ids[rows].tolist(), columns=node_columns)
+
+    def move_vectors(self, faiss_ids: Sequence[int], metadata: Dict[str, Sequence]) -> Optional[List[int]]:
+        """
+        Rewrites the metadata of existing vectors, e.g. for a photo moved to another event.
+        Rows whose new event lives on another node are re-added there and tombstoned on
+        their old node, so event-scoped searches find them. Returns the vectors' global ids
+        after the move (changed for moved rows), or None if they couldn't be moved.
+        """
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        metadata = {name: np.asarray(values) for name, values in metadata.items()}
+        current_nodes, _ = split_global_ids(faiss_ids)
+        target_nodes = np.array([self.node_for_event(e) for e in metadata["event_id"]], dtype=np.int64)
+        staying = np.flatnonzero(current_nodes == target_nodes)
+        moving = np.flatnonzero(current_nodes != target_nodes)
+
+        new_ids = faiss_ids.copy()
+        if moving.size:
+            found_ids, vectors = self.get_vectors(faiss_ids[moving].tolist())
+            if len(found_ids) != moving.size:
+                logger.error(f"Could not read {moving.size - len(found_ids)} of {moving.size} vectors to move between index nodes.")
+                return None
+            ok, added_ids = self.add(vectors, {name: values[moving] for name, values in metadata.items()})
+            if not ok:
+                return None
+            self.delete(faiss_ids[moving].tolist())
+            new_ids[moving] = added_ids
+        if staying.size:
+            self.update_metadata(faiss_ids[staying].tolist(), {name: values[staying] for name, values in metadata.items()})
+        return new_ids.tolist()
+
+    def aggregate(self, distances: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.asarray(indices, dtype=np.int64).ravel()
+        scores = np.asarray(distances, dtype=np.float32).ravel()
+        valid = ids >= 0
+        groups, local_ids = self._group_by_node(ids[valid])
+        scores = scores[valid]
+        requests = {
+            node: ("aggregate", {"distances": scores[rows], "indices": local_ids[rows]})
+            for node, rows in groups.items()
+        }
+        # A photo's vectors all live on its event's node, so per-node photo lists are disjoint
+        results = self._fan_out(requests, self.timeout)
+        if not results:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        photo_ids = np.concatenate([r[0] for r in results.values()])
+        photo_scores = np.concatenate([r[1] for r in results.values()])
+        order = np.argsort(-photo_scores, kind="stable")
+        return photo_ids[order], photo_scores[order]
+
+    def get_vectors(self, faiss_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        from app.utils.faiss_utils import EMBEDDING_DIM # faiss_utils imports this module
+
+        groups, local_ids = self._group_by_node(faiss_ids)
+        requests = {node: ("get_vectors", {"faiss_ids": local_ids[rows].tolist()}) for node, rows in groups.items()}
+        results = self._fan_out(requests, self.timeout)
+        found = {}
+        for node, (ids, vectors) in results.items():
+            found.update(zip(to_global_ids(ids, node).tolist(), vectors))
+        # Back in request order, like a single node
+        ordered = [int(i) for i in faiss_ids if int(i) in found]
+        if not ordered:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        return np.asarray(ordered, dtype=np.int64), np.vstack([found[i] for i in ordered])
+
+    def set_event_active(self, event_id: int, is_active: bool) -> None:
+        self.nodes[self.node_for_event(event_id)].call("set_event_active", event_id=event_id, is_active=is_active)
+
+    def save(self) -> bool:
+        results = self._broadcast("save")
+        return len(results) == len(self.nodes) and all(results.values())
+
+    def compact(self) -> bool:
+        results = self._broadcast("compact")
+        return len(results) == len(self.nodes) and all(results.values())
+
+    def save_metadata(self) -> bool:
+        results = self._broadcast("save_metadata")
+        return len(results) == len(self.nodes) and all(results.values())
+
+    def stats(self) -> Dict[str, object]:
+        results = self._broadcast("stats")
+        totals = {"nodes": len(self.nodes), "nodes_up": len(results)}
+        for node_stats in results.values():
+            for key, value in node_stats.items():
+                if isinstance(value, (int, float)):
+                    totals[key] = totals.get(key, 0) + value
+        totals["per_node"] = {node: results.get(node) for node in range(len(self.nodes))}
+        return totals
@@ -0,0 +1,181 @@
+"""
+Standalone vector index service.
+
+Owns the FAISS index, raw vector store and vector metadata for every API worker, so the
+index lives in memory once no matter how many uvicorn workers run. Workers reach it through
+faiss_utils when FAISS_SERVICE_SOCKET is set.
+
+Run from the api/ directory:
+    python -m app.utils.index_service --socket /tmp/racephotorunner-index.sock
+
+Requests are pickled, so a connection is as good as code execution in this process. A TCP
+node (--socket host:port) refuses to start without FAISS_SERVICE_AUTHKEY, and its port must
+stay on a private network (bind a private address, firewall it off from the internet).
+"""
+
+import argparse
+import logging
+import os
+import signal
+import threading
+from multiprocessing.connection import Listener
+from typing import Dict, Callable
+
+from app.utils import faiss_utils
+from app.utils.vector_metadata import VectorMetadata, load_vector_metadata
+from app.utils.index_router import event_nodes, node_id_range
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/racephotorunner-index.sock"
+
+
+def _handle_batch(requests):
+    return [_dispatch(request) for request in requests]
+
+
+# op name -> function run against this process's local index
+_OPERATIONS: Dict[str, Callable] = {
+    "search": faiss_utils.search_batched, # coalesced across every worker's requests
+    "search_multi": faiss_utils.search_faiss_index_multi,
+    "add": faiss_utils.add_embeddings_to_index,
+    "save": faiss_utils.save_faiss_index,
+    "save_metadata": faiss_utils.save_vector_metadata,
+    "delete": faiss_utils.delete_vectors,
+    "update_metadata": lambda faiss_ids, columns: faiss_utils.update_vector_metadata(faiss_ids, **columns),
+    "set_event_active": faiss_utils.set_event_active,
+    "aggregate": faiss_utils.aggregate_hits_to_photos,
+    "get_vectors": faiss_utils.get_vectors,
+    "stats": faiss_utils.get_index_stats,
+    "compact": faiss_utils.compact_index,
+    "ping": lambda: "pong",
+    "batch": _handle_batch,
+}
+
+
+def _dispatch(request: Dict):
+    op = request.get("op")
+    handler = _OPERATIONS.get(op)
+    if handler is None:
+        return {"ok": False, "error": f"Unknown operation '{op}'"}
+    try:
+        result = handler(**request.get("kwargs", {}))
+    except Exception as e:
+        logger.error(f"Index service operation '{op}' failed: {e}")
+        return {"ok": False, "error": str(e)}
+    if op == "batch":
+        # Unwrap sub-results so the client gets plain values, failing the batch on the first error
+        for sub in result:
+            if not sub["ok"]:
+                return sub
+        result = [sub["result"] for sub in result]
+    return {"ok": True, "result": result}
+
+
+def _serve_connection(conn) -> None:
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            conn.send(_dispatch(request))
+
+
+def load_index(node: int = 0, num_nodes: int = 1) -> None:
+    """
+    Loads the index and its metadata table, rebuilding the table from the DB if needed.
+    `node` is this process's shard number when the index is split across `num_nodes` nodes.
+    Refuses to load an index holding vectors of events another node owns (sharding turned
+    on, or a changed node count, without check_faiss_index.py --reshard), since searches
+    for those events would go to the other node and find nothing.
+    """
+    index = faiss_utils.get_faiss_index()
+    if index is None:
+        raise RuntimeError("FAISS index could not be loaded or initialized.")
+    metadata = faiss_utils.load_saved_vector_metadata()
+    if metadata is None and faiss_utils.get_index_size() == 0:
+        metadata = VectorMetadata() # Fresh node, nothing to look up
+    elif metadata is None:
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            metadata = load_vector_metadata(db, id_range=node_id_range(node))
+        finally:
+            db.close()
+    live = ~metadata.column("deleted")
+    misplaced = int((live & (event_nodes(metadata.column("event_id"), num_nodes) != node)).sum())
+    if misplaced:
+        raise RuntimeError(
+            f"{misplaced} vectors in {faiss_utils.FAISS_DATA_DIR} belong to events owned by other nodes "
+            f"of a {num_nodes}-node index. Run check_faiss_index.py --reshard {num_nodes} first."
+        )
+    faiss_utils.set_vector_metadata(metadata)
+    logger.info(f"FAISS index and vector metadata loaded: {faiss_utils.get_index_stats()}")
+
+
+def serve(socket_path: str = DEFAULT_SOCKET_PATH, authkey: bytes = None, ready: threading.Event = None,
+          node: int = 0, num_nodes: int = 1) -> None:
+    """
+    Serves index operations until interrupted, on a Unix socket path or a "host:port" TCP address
+    (for index nodes on other hosts). Each client connection gets its own thread; concurrency
+    between them is handled by the read/write lock in faiss_utils.
+    """
+    authkey = authkey or faiss_utils.FAISS_SERVICE_AUTHKEY
+    address = faiss_utils.parse_service_address(socket_path)
+    if not isinstance(address, str) and not authkey:
+        raise RuntimeError("FAISS_SERVICE_AUTHKEY must be set to serve the index over TCP.")
+
+    # This process is the index owner; never forward to another service
+    faiss_utils.FAISS_SERVICE_SOCKET = None
+    faiss_utils.FAISS_SERVICE_NODES = None
+    load_index(node, num_nodes)
+
+    if isinstance(address, str):
+        if os.path.exists(address):
+            os.unlink(address)
+        # Created owner-only, so without an authkey only this user's processes can connect
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(old_umask)
+    else:
+        listener = Listener(address, family="AF_INET", authkey=authkey)
+    logger.info(f"Index service listening on {socket_path}")
+    if ready is not None:
+        ready.set()
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                logger.warning(f"Rejected index service connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+    finally:
+        listener.close()
+        logger.info("Saving index before shutdown...")
+        faiss_utils.save_faiss_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run the RacePhotoRunner vector index service.")
+    parser.add_argument("--socket", default=os.getenv("FAISS_SERVICE_SOCKET") or DEFAULT_SOCKET_PATH,
+                        help="Unix socket path, or host:port to listen on TCP")
+    parser.add_argument("--data-dir", default=faiss_utils.FAISS_DATA_DIR, help="Directory holding the index files")
+    parser.add_argument("--node", type=int, default=0, help="Position of this node in FAISS_SERVICE_NODES")
+    parser.add_argument("--nodes", type=int,
+                        default=len([a for a in (faiss_utils.FAISS_SERVICE_NODES or "").split(",") if a.strip()]) or 1,
+                        help="Number of index nodes (defaults to the length of FAISS_SERVICE_NODES)")
+    args = parser.parse_args()
+
+    faiss_utils.FAISS_DATA_DIR = args.data_dir
+    faiss_utils.FAISS_INDEX_PATH = os.path.join(args.data_dir, faiss_utils.FAISS_INDEX_FILENAME)
+    # Turn SIGTERM into KeyboardInterrupt so the index is saved on shutdown
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        serve(args.socket, node=args.node, num_nodes=args.nodes)
+    except KeyboardInterrupt:
+        pass
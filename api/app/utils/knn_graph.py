@@ -0,0 +1,283 @@
+"""
+Precomputed approximate kNN graph per event, for "more photos like this".
+
+For every person detection of an event, the top KNN_GRAPH_K most similar detections of the
+same event are found with batched vector store searches and written to one file per event:
+neighbors as int32 row numbers into the event's own detection list, so a 200k-detection
+event with K=20 takes about 16 MB. Photo pages then read neighbors from the loaded graph
+instead of running a vector search.
+
+Graphs are extended incrementally: detections newer than a graph's watermark are searched,
+appended, and offered to their neighbors' lists in place of their weakest neighbor.
+Run the refresh in one process only (KNN_GRAPH_REFRESH=1 on a single API worker, or
+build_knn_graphs.py; the API leaves it off otherwise); API workers pick up rewritten files
+by their modification time.
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.utils import faiss_utils
+from app.utils.vector_metadata import SearchFilter
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+KNN_GRAPH_DIR = os.getenv("KNN_GRAPH_DIR", os.path.join(faiss_utils.FAISS_DATA_DIR, "knn_graphs"))
+KNN_GRAPH_K = int(os.getenv("KNN_GRAPH_K", "20"))
+KNN_GRAPH_SEARCH_BATCH = int(os.getenv("KNN_GRAPH_SEARCH_BATCH", "1024")) # Query vectors per search call
+KNN_GRAPH_INTERVAL_SECONDS = float(os.getenv("KNN_GRAPH_INTERVAL_SECONDS", "60"))
+
+
+def graph_path(event_id: int) -> str:
+    return os.path.join(KNN_GRAPH_DIR, f"event_{event_id}.npz")
+
+
+class EventKnnGraph:
+    """
+    Row i is one detection: faiss_ids[i], photo_ids[i], and its neighbors as row numbers
+    (-1 for empty slots) with their cosine similarities, best first. `watermark` is the
+    highest PersonEmbedding id the graph has seen.
+    """
+
+    def __init__(self, faiss_ids: np.ndarray, photo_ids: np.ndarray, neighbors: np.ndarray,
+                 scores: np.ndarray, watermark: int):
+        self.faiss_ids = faiss_ids.astype(np.int64, copy=False)
+        self.photo_ids = photo_ids.astype(np.int32, copy=False)
+        self.neighbors = neighbors.astype(np.int32, copy=False)
+        self.scores = scores.astype(np.float16, copy=False)
+        self.watermark = int(watermark)
+        self._rows_by_photo = None
+
+    @classmethod
+    def empty(cls, k: int) -> "EventKnnGraph":
+        return cls(np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros((0, k), np.int32),
+                   np.zeros((0, k), np.float16), 0)
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.faiss_ids)
+
+    @classmethod
+    def load(cls, path: str) -> "EventKnnGraph":
+        with np.load(path) as data:
+            return cls(data["faiss_ids"], data["photo_ids"], data["neighbors"], data["scores"], int(data["watermark"]))
+
+    def save(self, path: str) -> None:
+        """Writes to a temporary file and renames it, so readers never see a partial graph."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, faiss_ids=self.faiss_ids, photo_ids=self.photo_ids, neighbors=self.neighbors,
+                 scores=self.scores, watermark=np.int64(self.watermark))
+        os.replace(tmp_path, path)
+
+    def similar_photos(self, photo_id: int, limit: int) -> List[Tuple[int, float]]:
+        """
+        Photos whose people neighbor the people of `photo_id`, each scored by its best
+        neighbor similarity, best first. The photo itself is left out.
+        """
+        if self._rows_by_photo is None:
+            order = np.argsort(self.photo_ids, kind="stable")
+            self._rows_by_photo = (order, self.photo_ids[order])
+        order, sorted_photo_ids = self._rows_by_photo
+        start, end = np.searchsorted(sorted_photo_ids, [photo_id, photo_id + 1])
+        rows = order[start:end]
+        if not len(rows):
+            return []
+        neighbors = self.neighbors[rows].ravel()
+        scores = self.scores[rows].ravel().astype(np.float32)
+        keep = neighbors >= 0
+        neighbor_photos = self.photo_ids[neighbors[keep]]
+        scores = scores[keep]
+        keep = neighbor_photos != photo_id
+        best: Dict[int, float] = {}
+        for other, score in zip(neighbor_photos[keep].tolist(), scores[keep].tolist()):
+            if score > best.get(other, -1.0):
+                best[other] = score
+        return sorted(best.items(), key=lambda item: -item[1])[:limit]
+
+
+def _search_neighbors(store, vectors: np.ndarray, k: int, search_filter: SearchFilter) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-k hits for every row of `vectors`, searched KNN_GRAPH_SEARCH_BATCH rows at a time."""
+    distances = np.full((len(vectors), k), -np.inf, dtype=np.float32)
+    indices = np.full((len(vectors), k), -1, dtype=np.int64)
+    for start in range(0, len(vectors), KNN_GRAPH_SEARCH_BATCH):
+        result = store.search(vectors[start:start + KNN_GRAPH_SEARCH_BATCH], k, search_filter=search_filter)
+        if result is None:
+            raise RuntimeError("vector search failed")
+        batch_distances, batch_indices = result
+        width = min(k, batch_indices.shape[1])
+        distances[start:start + len(batch_indices), :width] = batch_distances[:, :width]
+        indices[start:start + len(batch_indices), :width] = batch_indices[:, :width]
+    return distances, indices
+
+
+def extend_graph(graph: EventKnnGraph, faiss_ids: np.ndarray, photo_ids: np.ndarray,
+                 hit_distances: np.ndarray, hit_faiss_ids: np.ndarray, watermark: int) -> EventKnnGraph:
+    """
+    Appends new detections with their search hits (faiss ids, as returned by the vector
+    store) and offers each new detection to its old neighbors' lists. Returns a new graph.
+    """
+    k, old_count = graph.k, len(graph)
+    all_faiss_ids = np.concatenate([graph.faiss_ids, faiss_ids.astype(np.int64)])
+    order = np.argsort(all_faiss_ids, kind="stable")
+    sorted_ids = all_faiss_ids[order]
+
+    # Hits -> row numbers; hits outside the graph (and self hits) are dropped
+    positions = np.clip(np.searchsorted(sorted_ids, hit_faiss_ids), 0, len(sorted_ids) - 1)
+    in_graph = (hit_faiss_ids >= 0) & (sorted_ids[positions] == hit_faiss_ids)
+    hit_rows = np.where(in_graph, order[positions], -1)
+    new_rows = np.arange(old_count, old_count + len(faiss_ids))
+    hit_rows[hit_rows == new_rows[:, None]] = -1
+
+    new_neighbors = np.full((len(faiss_ids), k), -1, dtype=np.int32)
+    new_scores = np.zeros((len(faiss_ids), k), dtype=np.float16)
+    for i in range(len(faiss_ids)):
+        valid = hit_rows[i] >= 0
+        rows, scores = hit_rows[i][valid][:k], hit_distances[i][valid][:k]
+        new_neighbors[i, :len(rows)] = rows
+        new_scores[i, :len(rows)] = scores
+
+    neighbors = np.concatenate([graph.neighbors, new_neighbors])
+    scores = np.concatenate([graph.scores, new_scores])
+    # Reverse edges: a new detection replaces an old detection's weakest neighbor if closer
+    for i, new_row in enumerate(new_rows.tolist()):
+        for old_row, score in zip(new_neighbors[i].tolist(), new_scores[i].astype(np.float32).tolist()):
+            if old_row < 0 or old_row >= old_count or new_row in neighbors[old_row]:
+                continue
+            slots = neighbors[old_row]
+            weakest = int(np.argmin(np.where(slots < 0, -np.inf, scores[old_row].astype(np.float32))))
+            if slots[weakest] >= 0 and scores[old_row, weakest] >= score:
+                continue
+            slots[weakest] = new_row
+            scores[old_row, weakest] = score
+            by_score = np.argsort(-np.where(slots < 0, -np.inf, scores[old_row].astype(np.float32)), kind="stable")
+            neighbors[old_row] = slots[by_score]
+            scores[old_row] = scores[old_row][by_score]
+
+    return EventKnnGraph(
+        all_faiss_ids, np.concatenate([graph.photo_ids, photo_ids.astype(np.int32)]), neighbors, scores, watermark
+    )
+
+
+def update_event_graph(db: Session, event_id: int, k: int = KNN_GRAPH_K, rebuild: bool = False) -> int:
+    """
+    Adds an event's detections newer than its graph (all of them if there is no graph or
+    `rebuild`) and saves the graph.
+
+    Returns:
+        int: Number of detections added.
+    """
+    from app.models.embedding import PersonEmbedding
+
+    path = graph_path(event_id)
+    graph = None
+    if not rebuild and os.path.exists(path):
+        try:
+            graph = EventKnnGraph.load(path)
+        except Exception as e:
+            logger.warning(f"Could not read kNN graph for event {event_id}, rebuilding: {e}")
+    if graph is None or graph.k != k:
+        graph = EventKnnGraph.empty(k)
+
+    rows = (
+        db.query(PersonEmbedding.id, PersonEmbedding.faiss_id, PersonEmbedding.photo_id)
+        .filter(PersonEmbedding.event_id == event_id, PersonEmbedding.id > graph.watermark)
+        .order_by(PersonEmbedding.id)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    store = get_vector_store()
+    found_ids, vectors = store.get_vectors([row.faiss_id for row in rows])
+    photo_by_faiss_id = {row.faiss_id: row.photo_id for row in rows}
+    if len(found_ids):
+        # Hidden photos stay in the graph (they may be made public again); readers filter them
+        search_filter = SearchFilter.for_event(event_id, public_only=False, active_events_only=False)
+        distances, indices = _search_neighbors(store, vectors, k + 1, search_filter)
+        photo_ids = np.asarray([photo_by_faiss_id[int(faiss_id)] for faiss_id in found_ids])
+        graph = extend_graph(graph, np.asarray(found_ids), photo_ids, distances, indices, rows[-1].id)
+    else:
+        graph.watermark = rows[-1].id
+    graph.save(path)
+    logger.info(f"kNN graph for event {event_id}: added {len(found_ids)} detections ({len(graph)} total).")
+    return len(found_ids)
+
+
+def update_all_graphs(db: Session, k: int = KNN_GRAPH_K) -> int:
+    """Extends the graph of every event that has new detections."""
+    from sqlalchemy import func
+    from app.models.embedding import PersonEmbedding
+
+    added = 0
+    for event_id, max_id in db.query(PersonEmbedding.event_id, func.max(PersonEmbedding.id)).filter(
+        PersonEmbedding.event_id.isnot(None)
+    ).group_by(PersonEmbedding.event_id):
+        graph = _load_current(event_id)
+        if graph is None or graph.watermark < max_id:
+            added += update_event_graph(db, event_id, k=k)
+    return added
+
+
+def delete_event_graph(event_id: int) -> None:
+    try:
+        os.remove(graph_path(event_id))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not delete kNN graph for event {event_id}: {e}")
+
+
+# Loaded graphs by event, with the file modification time they were read at
+_graphs: Dict[int, EventKnnGraph] = {}
+_graph_mtimes: Dict[int, float] = {}
+_graphs_lock = threading.Lock()
+
+
+def _load_current(event_id: int) -> Optional[EventKnnGraph]:
+    path = graph_path(event_id)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    with _graphs_lock:
+        if _graph_mtimes.get(event_id) == mtime:
+            return _graphs[event_id]
+    try:
+        graph = EventKnnGraph.load(path)
+    except Exception as e:
+        logger.error(f"Could not load kNN graph for event {event_id}: {e}")
+        return None
+    with _graphs_lock:
+        _graphs[event_id] = graph
+        _graph_mtimes[event_id] = mtime
+    return graph
+
+
+def get_event_graph(event_id: int) -> Optional[EventKnnGraph]:
+    """The event's graph, reloaded if the file was rewritten since it was read; None if not built yet."""
+    return _load_current(event_id)
+
+
+def run_graph_refresh(session_factory, stop: Optional[threading.Event] = None,
+                      interval: float = KNN_GRAPH_INTERVAL_SECONDS) -> None:
+    """Extends event graphs with new detections every `interval` seconds, until `stop` is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        db = session_factory()
+        try:
+            update_all_graphs(db)
+        except Exception as e:
+            logger.error(f"kNN graph refresh failed: {e}")
+        finally:
+            db.close()
+        stop.wait(interval)
@@ -5,12 +5,14 @@ from ultralytics import YOLO
 import clip # from openai-clip
 import os
 import logging
-from typing import Optional, List, Dict # Added List, Dict
+from typing import Optional, List, Dict, Union # Added List, Dict
 
 from sqlalchemy.orm import Session # Added
 from app.models.embedding import PersonEmbedding # Added
 from app.models.photo import Photo as PhotoModel # Added, aliased to avoid clash if Photo type hint used elsewhere
-from app.utils import faiss_utils # Added
+from app.utils.vector_store import get_vector_store
+from app.utils.vector_metadata import to_epoch_seconds
+from app.utils.result_cache import TTLCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -41,15 +43,16 @@ except Exception as e:
     clip_preprocess = None
 
 # --- Person Detection ---
-def detect_persons(image_path: str) -> List[Dict]: # Return type more specific
+def detect_persons(image_path: Union[str, Image.Image]) -> List[Dict]: # Return type more specific
     """
     Detects persons in an image using YOLO.
+    Accepts a file path or an already decoded PIL image (e.g. an uploaded selfie).
     Returns: List of dicts, each with 'bbox_xywhn' (normalized) & 'confidence'.
     """
     if not yolo_model:
         logger.error("YOLO model is not loaded. Cannot detect persons.")
         return []
-    if not os.path.exists(image_path):
+    if isinstance(image_path, str) and not os.path.exists(image_path):
         logger.error(f"Image path does not exist: {image_path}")
         return []
     try:
@@ -89,6 +92,108 @@ def get_clip_embedding_for_crop(image_crop: Image.Image) -> Optional[np.ndarray]
         logger.error(f"Error generating CLIP embedding for crop: {e}")
         return None
 
+def crop_person(image: Image.Image, bbox_xywhn: List[float]) -> Optional[Image.Image]:
+    """
+    Crops a person from an image given a normalized YOLO xywh bbox, clamped to the image.
+    Returns: The crop, or None if the bbox is empty after clamping or cropping fails.
+    """
+    img_w, img_h = image.size
+    cx_n, cy_n, w_n, h_n = bbox_xywhn
+    abs_cx, abs_cy, abs_w, abs_h = cx_n * img_w, cy_n * img_h, w_n * img_w, h_n * img_h
+    x1, y1, x2, y2 = abs_cx - abs_w / 2, abs_cy - abs_h / 2, abs_cx + abs_w / 2, abs_cy + abs_h / 2
+    x1, y1, x2, y2 = max(0, x1), max(0, y1), min(img_w, x2), min(img_h, y2)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    try:
+        person_crop = image.crop((x1, y1, x2, y2))
+    except Exception as e:
+        logger.error(f"Failed to crop image with bbox {[x1,y1,x2,y2]}: {e}")
+        return None
+    if person_crop.width == 0 or person_crop.height == 0:
+        return None
+    return person_crop
+
+def embed_largest_person(image: Image.Image) -> Optional[np.ndarray]:
+    """
+    Embeds the largest detected person in a query image, such as a runner's selfie.
+    Falls back to the whole image when no person is detected (tight selfies often crop
+    out most of the body).
+    Returns: Normalized CLIP embedding, or None if embedding fails.
+    """
+    persons = detect_persons(image)
+    person_crop = None
+    if persons:
+        largest = max(persons, key=lambda p: p["bbox_xywhn"][2] * p["bbox_xywhn"][3])
+        person_crop = crop_person(image, largest["bbox_xywhn"])
+    if person_crop is None:
+        logger.info("No usable person detected in query image; embedding the whole image.")
+        person_crop = image
+    return get_clip_embedding_for_crop(person_crop)
+
+# --- Text Query Embeddings ---
+# Outfit queries ("red shirt, blue shorts") repeat heavily, so encoded text is cached and
+# encode_text only runs on a miss. Keys are the normalized query text.
+TEXT_EMBEDDING_CACHE_SIZE = int(os.getenv("TEXT_EMBEDDING_CACHE_SIZE", "4096"))
+TEXT_EMBEDDING_TTL_SECONDS = float(os.getenv("TEXT_EMBEDDING_TTL_SECONDS", str(24 * 3600)))
+# Person crops are matched against a caption rather than the bare query, which CLIP scores better
+TEXT_QUERY_TEMPLATE = "a photo of a runner wearing {}"
+OUTFIT_COLORS = ["black", "white", "grey", "red", "orange", "yellow", "green", "blue", "navy", "purple", "pink", "brown"]
+OUTFIT_GARMENTS = ["shirt", "t-shirt", "tank top", "jacket", "shorts", "leggings", "tights", "skirt", "cap", "shoes"]
+
+_text_embedding_cache = TTLCache(TEXT_EMBEDDING_CACHE_SIZE, TEXT_EMBEDDING_TTL_SECONDS)
+
+def normalize_text_query(text: str) -> str:
+    """Lowercases and collapses whitespace so equivalent queries share a cache entry."""
+    return " ".join(text.lower().split())
+
+def get_clip_embeddings_for_texts(texts: List[str]) -> Optional[np.ndarray]:
+    """
+    Generates CLIP text embeddings for outfit queries, encoding only the ones not cached.
+    Returns: Array of normalized embeddings (one row per text), or None.
+    """
+    keys = [normalize_text_query(text) for text in texts]
+    embeddings = [_text_embedding_cache.get(key) for key in keys]
+    missing = sorted({key for key, embedding in zip(keys, embeddings) if embedding is None})
+    if missing:
+        if not clip_model:
+            logger.error("CLIP model not loaded.")
+            return None
+        try:
+            tokens = clip.tokenize([TEXT_QUERY_TEMPLATE.format(key) for key in missing], truncate=True).to(DEVICE)
+            with torch.no_grad():
+                encoded = clip_model.encode_text(tokens)
+            encoded /= encoded.norm(dim=-1, keepdim=True)
+            encoded = encoded.cpu().numpy().astype(np.float32)
+        except Exception as e:
+            logger.error(f"Error generating CLIP embeddings for {len(missing)} text queries: {e}")
+            return None
+        new_embeddings = dict(zip(missing, encoded))
+        for key, embedding in new_embeddings.items():
+            embedding.setflags(write=False) # Shared by every later cache hit
+            _text_embedding_cache.put(key, embedding)
+        embeddings = [new_embeddings[key] if embedding is None else embedding
+                      for key, embedding in zip(keys, embeddings)]
+    return np.vstack(embeddings)
+
+def get_clip_embedding_for_text(text: str) -> Optional[np.ndarray]:
+    """
+    Generates the CLIP embedding for one outfit query, e.g. "red shirt, blue shorts".
+    Returns: Normalized CLIP embedding vector or None.
+    """
+    embeddings = get_clip_embeddings_for_texts([text])
+    return embeddings[0] if embeddings is not None else None
+
+def warm_text_embedding_cache() -> int:
+    """
+    Precomputes embeddings for common color/garment queries ("red shirt", "blue shorts", ...).
+    Returns: Number of vocabulary entries cached.
+    """
+    vocabulary = [f"{color} {garment}" for color in OUTFIT_COLORS for garment in OUTFIT_GARMENTS]
+    if get_clip_embeddings_for_texts(vocabulary) is None:
+        return 0
+    logger.info(f"Warmed text embedding cache with {len(vocabulary)} outfit queries.")
+    return len(vocabulary)
+
 # --- Orchestrator: Process image, generate embeddings, prepare for DB --- 
 # Renamed and signature changed
 def generate_and_prepare_person_embeddings(
@@ -127,24 +232,10 @@ def generate_and_prepare_person_embeddings(
         logger.info(f"No persons detected in {image_path}")
         return 0
 
-    img_w, img_h = original_image.size
-
     for person_info in detected_persons_yolo:
-        cx_n, cy_n, w_n, h_n = person_info['bbox_xywhn']
-        abs_cx, abs_cy, abs_w, abs_h = cx_n * img_w, cy_n * img_h, w_n * img_w, h_n * img_h
-        x1, y1, x2, y2 = abs_cx - abs_w / 2, abs_cy - abs_h / 2, abs_cx + abs_w / 2, abs_cy + abs_h / 2
-        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(img_w, x2), min(img_h, y2)
-
-        if x2 <= x1 or y2 <= y1:
-            logger.warning(f"Skipping invalid/tiny bbox after boundary clamp: {[x1,y1,x2,y2]} for {image_path}")
-            continue
-        try:
-            person_crop = original_image.crop((x1, y1, x2, y2))
-        except Exception as e:
-            logger.error(f"Failed to crop image {image_path} with bbox {[x1,y1,x2,y2]}: {e}")
-            continue
-        if person_crop.width == 0 or person_crop.height == 0:
-            logger.warning(f"Skipping zero-size crop for {image_path} with bbox {[x1,y1,x2,y2]}")
+        person_crop = crop_person(original_image, person_info['bbox_xywhn'])
+        if person_crop is None:
+            logger.warning(f"Skipping unusable person bbox {person_info['bbox_xywhn']} for {image_path}")
             continue
             
         embedding_vector = get_clip_embedding_for_crop(person_crop)
@@ -170,11 +261,21 @@ def generate_and_prepare_person_embeddings(
         all_embeddings_np = all_embeddings_np.astype(np.float32)
         
     # Normalize L2 for IndexFlatIP (cosine similarity)
-    # faiss_utils.add_embeddings_to_index expects pre-normalized vectors if using IndexFlatIP for cosine.
+    # The vector store expects pre-normalized vectors if using IndexFlatIP for cosine.
     # CLIP embeddings from get_clip_embedding_for_crop are already normalized.
     # If they weren't, we would normalize here: faiss.normalize_L2(all_embeddings_np)
 
-    success_faiss, faiss_ids = faiss_utils.add_embeddings_to_index(all_embeddings_np)
+    num_persons = len(processed_persons_data)
+    vector_metadata = {
+        "photo_id": [photo.id] * num_persons,
+        "event_id": [photo.event_id if photo.event_id is not None else -1] * num_persons,
+        "photographer_id": [photo.photographer_id if photo.photographer_id is not None else -1] * num_persons,
+        "is_public": [photo.is_public is not False] * num_persons,
+        "timestamp": [to_epoch_seconds(photo.timestamp or photo.created_at)] * num_persons,
+        "bbox": [p_data["bbox_xywhn"] for p_data in processed_persons_data],
+    }
+    # SQL-backed stores add into `db`, so the vectors commit with the PersonEmbedding rows below
+    success_faiss, faiss_ids = get_vector_store().add(all_embeddings_np, metadata=vector_metadata, db=db)
 
     if not success_faiss or faiss_ids is None or len(faiss_ids) != len(processed_persons_data):
         logger.error(f"Failed to add embeddings to FAISS or FAISS ID count mismatch for {image_path}. FAISS success: {success_faiss}, Expected: {len(processed_persons_data)}, Got: {len(faiss_ids) if faiss_ids else 'None'}")
@@ -0,0 +1,130 @@
+import os
+import struct
+import threading
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fixed-size .npy header (magic + dict), so appending rows only rewrites the shape in place.
+# 128 bytes leaves room for a 20-digit row count.
+_HEADER_LEN = 128
+
+
+class RawVectorStore:
+    """
+    Append-only float32 vector file, memory-mapped for reads.
+
+    Row i holds the exact (uncompressed) embedding whose FAISS ID is i, independently of
+    whatever codec the FAISS index uses. It is a plain .npy file, so `np.load(path, mmap_mode="r")`
+    works on it too.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._mmap: Optional[np.ndarray] = None
+        self._count = self._read_count() if os.path.exists(path) else 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _encode_header(self, count: int) -> bytes:
+        header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (count, self.dim)
+        magic = np.lib.format.magic(1, 0)
+        body_len = _HEADER_LEN - len(magic) - 2
+        return magic + struct.pack("<H", body_len) + (header.ljust(body_len - 1) + "\n").encode("latin1")
+
+    def _read_count(self) -> int:
+        with open(self.path, "rb") as f:
+            np.lib.format.read_magic(f)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            if f.tell() != _HEADER_LEN or dtype != np.float32 or shape[1:] != (self.dim,):
+                raise ValueError(f"{self.path} is not a raw vector store with dimension {self.dim}.")
+        return shape[0]
+
+    def _vectors(self) -> np.ndarray:
+        """Current memmap view; rebuilt lazily after appends."""
+        mmap = self._mmap
+        if mmap is None or mmap.shape[0] != self._count:
+            if self._count == 0:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            mmap = np.load(self.path, mmap_mode="r")
+            self._mmap = mmap
+        return mmap
+
+    def append(self, vectors: np.ndarray, start_id: int) -> bool:
+        """
+        Appends rows for FAISS IDs start_id .. start_id + len(vectors) - 1.
+
+        Returns:
+            bool: False if start_id does not continue the store (the caller must resync first).
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if start_id != self._count:
+                logger.error(f"Raw vector store has {self._count} rows, cannot append at id {start_id}.")
+                return False
+            new_count = self._count + vectors.shape[0]
+            mode = "r+b" if os.path.exists(self.path) else "w+b"
+            with open(self.path, mode) as f:
+                if mode == "w+b":
+                    f.write(self._encode_header(0))
+                f.seek(_HEADER_LEN + self._count * self.dim * 4)
+                f.write(vectors.tobytes())
+                f.flush()
+                # Rows first, then the header, so a crash in between only hides the new rows
+                f.seek(0)
+                f.write(self._encode_header(new_count))
+            self._count = new_count
+            return True
+
+    def truncate(self, count: int) -> None:
+        """Drops rows >= count, e.g. rows whose index add was lost in a crash."""
+        with self._lock:
+            if count >= self._count:
+                return
+            with open(self.path, "r+b") as f:
+                f.write(self._encode_header(count))
+                f.truncate(_HEADER_LEN + count * self.dim * 4)
+            self._count = count
+            self._mmap = None
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Returns the vectors for the given FAISS IDs (all must be < len(self))."""
+        return np.asarray(self._vectors()[np.asarray(ids, dtype=np.int64)])
+
+    def read_all(self) -> np.ndarray:
+        return np.asarray(self._vectors())
+
+    def rerank(self, query_vectors: np.ndarray, candidate_ids: np.ndarray,
+               approx_scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exactly re-scores ANN candidates by inner product and keeps the top k per query.
+
+        Candidates are gathered once (sorted, so the memmap is read sequentially) and scored
+        with a single matrix product. Candidates not covered by the store keep their
+        approximate score; -1 padding from FAISS stays at the bottom.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (scores, ids), both of shape (num_queries, k).
+        """
+        candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+        stored = (candidate_ids >= 0) & (candidate_ids < self._count)
+        unique_ids = np.unique(candidate_ids[stored])
+
+        scores = np.where(candidate_ids >= 0, approx_scores, -np.inf).astype(np.float32)
+        if unique_ids.size:
+            exact = query_vectors @ self.get(unique_ids).T  # (num_queries, num_unique)
+            positions = np.searchsorted(unique_ids, np.where(stored, candidate_ids, unique_ids[0]))
+            exact_per_candidate = np.take_along_axis(exact, positions, axis=1)
+            scores = np.where(stored, exact_per_candidate, scores)
+
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        top_ids = np.take_along_axis(candidate_ids, order, axis=1)
+        top_ids[~np.isfinite(top_scores)] = -1
+        return top_scores, top_ids
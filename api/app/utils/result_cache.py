@@ -0,0 +1,190 @@
+import base64
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULT_TTL_SECONDS = float(os.getenv("SEARCH_RESULT_TTL_SECONDS", "600"))
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1000"))
+
+
+class TTLCache:
+    """
+    Thread-safe LRU map whose entries also expire `ttl` seconds after they were stored.
+    Counts hits and misses for metrics.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the value for `key`, or None if it is missing, expired or was evicted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Drops the entry for `key`, if any (to invalidate it)."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class IngestWatermarks:
+    """
+    Per-event counters bumped whenever an event's searchable content changes (photos
+    ingested, retagged, hidden or deleted; the event (de)activated). Searches across all
+    events follow a global counter bumped by every change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[int, int] = {}
+        self._global = 0
+
+    def bump(self, event_id: Optional[int]) -> None:
+        with self._lock:
+            if event_id is not None:
+                self._events[event_id] = self._events.get(event_id, 0) + 1
+            self._global += 1
+
+    def current(self, event_id: Optional[int]) -> int:
+        with self._lock:
+            return self._events.get(event_id, 0) if event_id is not None else self._global
+
+
+class ResultCache:
+    """
+    Ranked photo lists from searches, so later pages are served by slicing instead of
+    re-running the search.
+
+    Lists are stored under random tokens that cursors point at; a token keeps serving the
+    same snapshot until it expires, so pagination stays stable while photos are ingested.
+    Searches are also looked up by key (kind, normalized query, event_id, filters); a keyed
+    entry is only reused while its event's ingest watermark hasn't moved. Entries are
+    LRU-evicted past `max_entries` and expire `ttl` seconds after they were stored.
+
+    Watermarks live in this process, so with several API workers another worker's ingest
+    only reaches this cache through the TTL.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_RESULT_CACHE_SIZE, ttl: float = SEARCH_RESULT_TTL_SECONDS):
+        self._entries = TTLCache(max_entries, ttl)
+        self._keys = TTLCache(max_entries, ttl) # search key -> (token, watermark)
+        self.watermarks = IngestWatermarks()
+        self._stats_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0, "pages": 0, "expired": 0}
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def put(self, photo_ids: np.ndarray, scores: np.ndarray, match_types: Optional[Sequence[str]] = None) -> str:
+        """Stores a ranked result list and returns the token that identifies it."""
+        token = secrets.token_urlsafe(12)
+        self._entries.put(token, (photo_ids, scores, match_types))
+        return token
+
+    def get(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray, Optional[Sequence[str]]]]:
+        """Returns (photo_ids, scores, match_types) for a token, or None if it expired or was evicted."""
+        entry = self._entries.get(token)
+        self._count("pages" if entry is not None else "expired")
+        return entry
+
+    def get_or_compute(self, key: Hashable, event_id: Optional[int],
+                       compute: Callable[[], Tuple]) -> str:
+        """
+        Returns the token of the cached result list for a search key, running `compute`
+        (which returns put()'s arguments) on a miss or when the event's watermark moved.
+        """
+        cached = self._keys.get(key)
+        if cached is not None:
+            token, watermark = cached
+            if watermark == self.watermarks.current(event_id) and self._entries.get(token) is not None:
+                self._count("hits")
+                return token
+            self._count("invalidations")
+        self._count("misses")
+        # Read before computing: an ingest during the search must invalidate its result
+        watermark = self.watermarks.current(event_id)
+        token = self.put(*compute())
+        self._keys.put(key, (token, watermark))
+        return token
+
+    def bump_watermark(self, event_id: Optional[int]) -> None:
+        self.watermarks.bump(event_id)
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Counters for monitoring: search lookups (hits, misses, and invalidations, which are
+        misses caused by a moved watermark), pages served, expired cursors, and sizes.
+        """
+        with self._stats_lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self._entries)
+        stats["keys"] = len(self._keys)
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def encode_cursor(token: str, offset: int) -> str:
+    """Opaque cursor pointing at `offset` in the cached result list `token`."""
+    return base64.urlsafe_b64encode(f"{token}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    """Returns (token, offset), or None for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        token, offset = base64.urlsafe_b64decode(padded.encode()).decode().rsplit(":", 1)
+        offset = int(offset)
+    except Exception:
+        return None
+    if offset < 0:
+        return None
+    return token, offset
+
+
+_search_results = ResultCache()
+
+
+def get_search_result_cache() -> ResultCache:
+    return _search_results
+
+
+def bump_ingest_watermark(event_id: Optional[int]) -> None:
+    """Invalidates cached searches over an event after its photos changed."""
+    _search_results.bump_watermark(event_id)
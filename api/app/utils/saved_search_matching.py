@@ -0,0 +1,143 @@
+"""
+Incremental matching of newly ingested photos against saved searches.
+
+Instead of runners re-running their search on every refresh, each ingest matches only the
+new photos: their people's vectors against all of the event's saved query vectors in one
+matrix product, and their bib rows against saved bibs. Hits are appended to the owners'
+inboxes (saved_search_matches).
+"""
+
+import logging
+import os
+from collections import defaultdict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.utils.result_cache import TTLCache
+from app.utils.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Similarity a photo's best person needs to a saved query vector to land in the inbox
+SAVED_SEARCH_MIN_SCORE = float(os.getenv("SAVED_SEARCH_MIN_SCORE", "0.8"))
+MAX_SAVED_SEARCHES_PER_USER = int(os.getenv("MAX_SAVED_SEARCHES_PER_USER", "20"))
+# How long an API worker reuses an event's saved searches before re-reading them; searches
+# saved on another worker start matching after at most this long
+SAVED_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SAVED_SEARCH_CACHE_TTL_SECONDS", "30"))
+
+
+class _EventSavedSearches:
+    def __init__(self, rows: Sequence):
+        self.bibs = defaultdict(list) # bib -> [(search id, clerk user id)]
+        self.vector_searches: List[Tuple[int, str]] = []
+        vectors = []
+        for row in rows:
+            if row.bib:
+                self.bibs[row.bib].append((row.id, row.clerk_user_id))
+            if row.query_vector is not None:
+                self.vector_searches.append((row.id, row.clerk_user_id))
+                vectors.append(np.frombuffer(row.query_vector, dtype=np.float32))
+        self.query_vectors = np.vstack(vectors) if vectors else None
+
+    def __bool__(self) -> bool:
+        return bool(self.bibs) or self.query_vectors is not None
+
+
+_event_searches = TTLCache(max_entries=1024, ttl=SAVED_SEARCH_CACHE_TTL_SECONDS)
+
+
+def _load_event_searches(db: Session, event_id: int) -> _EventSavedSearches:
+    from app.models.saved_search import SavedSearch
+
+    searches = _event_searches.get(event_id)
+    if searches is None:
+        rows = db.query(
+            SavedSearch.id, SavedSearch.clerk_user_id, SavedSearch.bib, SavedSearch.query_vector
+        ).filter(SavedSearch.event_id == event_id).all()
+        searches = _EventSavedSearches(rows)
+        _event_searches.put(event_id, searches)
+    return searches
+
+
+def invalidate_event_searches(event_id: int) -> None:
+    """Call after saving or deleting a search so this worker matches with the current set."""
+    _event_searches.pop(event_id)
+
+
+def match_new_photos(db: Session, event_id: Optional[int], photo_ids: Sequence[int]) -> int:
+    """
+    Matches photos just ingested into (or retagged in) an event against the event's saved
+    searches and commits the new inbox entries. Hidden photos never match, and a photo is
+    added to a search's inbox at most once.
+
+    Returns:
+        int: Number of inbox entries added.
+    """
+    from app.models.embedding import PersonEmbedding
+    from app.models.photo import Photo
+    from app.models.photo_bib import PhotoBib
+    from app.models.saved_search import SavedSearchMatch
+
+    if event_id is None or not photo_ids:
+        return 0
+    searches = _load_event_searches(db, event_id)
+    if not searches:
+        return 0
+    photo_ids = [
+        row.id for row in db.query(Photo.id).filter(
+            Photo.id.in_(list(photo_ids)), Photo.event_id == event_id, Photo.is_public == True
+        )
+    ]
+    if not photo_ids:
+        return 0
+
+    hits = {} # (search id, photo id) -> (clerk user id, score, match type)
+    if searches.bibs:
+        for photo_id, bib in db.query(PhotoBib.photo_id, PhotoBib.bib).filter(PhotoBib.photo_id.in_(photo_ids)):
+            for search_id, clerk_user_id in searches.bibs.get(bib, ()):
+                hits[(search_id, photo_id)] = (clerk_user_id, 1.0, "bib")
+
+    if searches.query_vectors is not None:
+        rows = db.query(PersonEmbedding.faiss_id, PersonEmbedding.photo_id).filter(
+            PersonEmbedding.photo_id.in_(photo_ids)
+        ).all()
+        photo_by_faiss_id = {row.faiss_id: row.photo_id for row in rows}
+        found_ids, vectors = get_vector_store().get_vectors(list(photo_by_faiss_id)) if rows else ([], None)
+        if len(found_ids):
+            # Every new person against every saved query at once, then each photo's best person
+            similarities = vectors @ searches.query_vectors.T
+            photo_rows = {photo_id: i for i, photo_id in enumerate(photo_ids)}
+            best = np.full((len(photo_ids), len(searches.vector_searches)), -np.inf, dtype=np.float32)
+            np.maximum.at(best, [photo_rows[photo_by_faiss_id[int(faiss_id)]] for faiss_id in found_ids], similarities)
+            for photo_row, search_row in zip(*np.nonzero(best >= SAVED_SEARCH_MIN_SCORE)):
+                search_id, clerk_user_id = searches.vector_searches[search_row]
+                key = (search_id, photo_ids[photo_row])
+                if key not in hits: # A bib match outranks a visual one
+                    hits[key] = (clerk_user_id, float(best[photo_row, search_row]), "visual")
+
+    if not hits:
+        return 0
+    existing = set(db.query(SavedSearchMatch.saved_search_id, SavedSearchMatch.photo_id).filter(
+        SavedSearchMatch.photo_id.in_(photo_ids),
+        SavedSearchMatch.saved_search_id.in_({search_id for search_id, _ in hits}),
+    ).all())
+    new_matches = [
+        SavedSearchMatch(saved_search_id=search_id, photo_id=photo_id, clerk_user_id=clerk_user_id,
+                         score=score, match_type=match_type, seen=False)
+        for (search_id, photo_id), (clerk_user_id, score, match_type) in hits.items()
+        if (search_id, photo_id) not in existing
+    ]
+    if not new_matches:
+        return 0
+    try:
+        db.add_all(new_matches)
+        db.commit()
+    except Exception as e:
+        # Most likely a concurrent ingest of the same photo already added the entry
+        db.rollback()
+        logger.warning(f"Could not add saved search matches for event {event_id}: {e}")
+        return 0
+    logger.info(f"Added {len(new_matches)} saved search matches for {len(photo_ids)} new photo(s) in event {event_id}.")
+    return len(new_matches)
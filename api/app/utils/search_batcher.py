@@ -0,0 +1,99 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.vector_metadata import SearchFilter
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingSearch:
+    def __init__(self, query_vectors: np.ndarray, k: int):
+        self.query_vectors = query_vectors
+        self.k = k
+        self.result: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    def __init__(self):
+        self.requests: List[_PendingSearch] = []
+        self.num_queries = 0
+        self.full = threading.Event()
+
+
+class SearchBatcher:
+    """
+    Coalesces concurrent searches into one index.search call.
+
+    The first request for a given (rerank, filter) key becomes the batch leader: it waits up
+    to `window` seconds (or until `max_queries` rows are queued), then runs every queued query
+    in one call with the largest k and hands each caller its own rows, trimmed to its k. Other
+    callers just wait for their rows. Requests with different filters can't share a call, since
+    the filter is compiled into the ID selector, so they form separate batches.
+    """
+
+    def __init__(self, search_fn: Callable, window: float = 0.0005, max_queries: int = 256):
+        self.search_fn = search_fn
+        self.window = window
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+        self._open: Dict[Tuple, _Batch] = {}
+        self.calls = 0 # index searches actually run, for metrics and tests
+        self.queries = 0
+
+    def search(self, query_vectors: np.ndarray, k: int, rerank: Optional[bool] = None,
+               search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Same contract as faiss_utils.search_faiss_index."""
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if self.window <= 0:
+            return self.search_fn(query_vectors, k, rerank=rerank, search_filter=search_filter)
+
+        key = (rerank, search_filter)
+        request = _PendingSearch(query_vectors, k)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.requests.append(request)
+            batch.num_queries += query_vectors.shape[0]
+            if batch.num_queries >= self.max_queries:
+                # Full: close it so later requests start a new batch, and wake the leader
+                del self._open[key]
+                batch.full.set()
+
+        if not leader:
+            request.done.wait()
+            return request.result
+
+        batch.full.wait(self.window)
+        with self._lock:
+            if self._open.get(key) is batch:
+                del self._open[key]
+        self._run(batch, rerank, search_filter)
+        return request.result
+
+    def _run(self, batch: _Batch, rerank: Optional[bool], search_filter: Optional[SearchFilter]) -> None:
+        try:
+            queries = np.vstack([r.query_vectors for r in batch.requests])
+            k = max(r.k for r in batch.requests)
+            result = self.search_fn(queries, k, rerank=rerank, search_filter=search_filter)
+            with self._lock:
+                self.calls += 1
+                self.queries += queries.shape[0]
+            if result is not None:
+                distances, indices = result
+                row = 0
+                for r in batch.requests:
+                    rows = slice(row, row + r.query_vectors.shape[0])
+                    # Rows are sorted best-first, so a smaller k is a prefix
+                    r.result = (distances[rows, :r.k], indices[rows, :r.k])
+                    row = rows.stop
+        except Exception as e:
+            logger.error(f"Batched search of {len(batch.requests)} requests failed: {e}")
+        finally:
+            for r in batch.requests:
+                r.done.set()
@@ -0,0 +1,163 @@
+"""
+In-memory temporal index for "photos near this moment".
+
+Per event, public photos with a capture time are kept in one sorted int64 array keyed by
+(photographer_id, capture time in ms), so the frames a photographer shot within ±N seconds
+of a photo are one binary search away. Used to expand search hits to the runner's burst and
+neighboring frames, which catches shots where the bib or face is hidden. Events are loaded
+from the photos table on first use, kept current by the photo endpoints and reloaded after
+a TTL, like the bib index (see event_index.py).
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.utils.event_index import EventIndexes
+
+logger = logging.getLogger(__name__)
+
+# Frames this close in time (same photographer) count as neighbors of a hit
+TEMPORAL_WINDOW_SECONDS = float(os.getenv("TEMPORAL_WINDOW_SECONDS", "5"))
+# Neighbor scores are the hit's score times this, fading to zero at the window's edge
+TEMPORAL_WEIGHT = 0.8
+# Search hits whose neighbors are looked up
+TEMPORAL_MAX_SEEDS = int(os.getenv("TEMPORAL_MAX_SEEDS", "50"))
+# Seconds a loaded event is served before it is reloaded from the photos table
+TEMPORAL_INDEX_TTL_SECONDS = float(os.getenv("TEMPORAL_INDEX_TTL_SECONDS", "60"))
+
+_TIME_BITS = 42 # ms since the epoch fit in 42 bits until 2109
+
+
+def _key(photographer_id: int, timestamp_ms: int) -> int:
+    return (int(photographer_id) << _TIME_BITS) | int(timestamp_ms)
+
+
+def _to_ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+class EventTemporalIndex:
+    """One event's photos sorted by (photographer, time). Not thread-safe on its own."""
+
+    def __init__(self, rows: Iterable[Tuple[int, int, datetime]] = ()):
+        entries = sorted((_key(photographer_id, _to_ms(timestamp)), photo_id) for photo_id, photographer_id, timestamp in rows)
+        self.keys = np.asarray([key for key, _ in entries], dtype=np.int64)
+        self.photo_ids = np.asarray([photo_id for _, photo_id in entries], dtype=np.int64)
+        self.key_by_photo: Dict[int, int] = {photo_id: key for key, photo_id in entries}
+
+    def add(self, photo_id: int, photographer_id: int, timestamp: datetime) -> None:
+        key = _key(photographer_id, _to_ms(timestamp))
+        position = int(np.searchsorted(self.keys, key, side="right"))
+        self.keys = np.insert(self.keys, position, key)
+        self.photo_ids = np.insert(self.photo_ids, position, photo_id)
+        self.key_by_photo[photo_id] = key
+
+    def remove(self, photo_id: int) -> None:
+        key = self.key_by_photo.pop(photo_id, None)
+        if key is None:
+            return
+        start, end = np.searchsorted(self.keys, [key, key + 1])
+        position = start + int(np.flatnonzero(self.photo_ids[start:end] == photo_id)[0])
+        self.keys = np.delete(self.keys, position)
+        self.photo_ids = np.delete(self.photo_ids, position)
+
+    def nearby(self, photo_id: int, window_ms: int) -> List[Tuple[int, int]]:
+        """(photo_id, ms apart) of the same photographer's frames within window_ms, nearest first."""
+        key = self.key_by_photo.get(photo_id)
+        if key is None:
+            return []
+        # The photographer id sits in the high bits, so the range never crosses photographers
+        low = key - min(window_ms, key & ((1 << _TIME_BITS) - 1))
+        start, end = np.searchsorted(self.keys, [low, key + window_ms + 1])
+        found = [
+            (other, abs(other_key - key))
+            for other, other_key in zip(self.photo_ids[start:end].tolist(), self.keys[start:end].tolist())
+            if other != photo_id
+        ]
+        return sorted(found, key=lambda item: (item[1], item[0]))
+
+
+class TemporalIndex(EventIndexes[EventTemporalIndex]):
+    """
+    Per-event EventTemporalIndexes, loaded lazily, kept current by this worker's photo writes
+    and reloaded every TEMPORAL_INDEX_TTL_SECONDS to pick up other workers' writes.
+    """
+
+    name = "temporal index"
+
+    def __init__(self, ttl: float = TEMPORAL_INDEX_TTL_SECONDS):
+        super().__init__(ttl)
+
+    def _load_entries(self, db: Session, event_id: int) -> Dict[int, Tuple[int, datetime]]:
+        return {photo_id: (photographer_id, timestamp) for photo_id, photographer_id, timestamp in _load_event_rows(db, event_id)}
+
+    def _build(self, entries: Dict[int, Tuple[int, datetime]]) -> EventTemporalIndex:
+        return EventTemporalIndex(
+            (photo_id, photographer_id, timestamp) for photo_id, (photographer_id, timestamp) in entries.items()
+        )
+
+    def _add(self, index: EventTemporalIndex, photo_id: int, entry: Tuple[int, datetime]) -> None:
+        index.add(photo_id, *entry)
+
+    def _remove(self, index: EventTemporalIndex, photo_id: int, entry: Tuple[int, datetime]) -> None:
+        index.remove(photo_id)
+
+    def update_photo(self, photo_id: int, event_id: Optional[int], photographer_id: Optional[int],
+                     timestamp: Optional[datetime], is_public: bool = True) -> None:
+        """Records a photo's committed event, photographer and capture time. Hidden or undated photos are dropped."""
+        indexed = is_public and photographer_id is not None and timestamp is not None
+        self._update(photo_id, event_id, (photographer_id, timestamp) if indexed else None)
+
+    def remove_photo(self, photo_id: int) -> None:
+        self.update_photo(photo_id, None, None, None)
+
+    def nearby(self, db: Session, event_id: int, photo_id: int,
+               seconds: float = TEMPORAL_WINDOW_SECONDS) -> List[Tuple[int, float]]:
+        """(photo_id, seconds apart) of frames the same photographer took within ±`seconds` of the photo."""
+        index = self._event(db, event_id)
+        with self._lock:
+            found = index.nearby(photo_id, int(seconds * 1000))
+        return [(other, ms / 1000.0) for other, ms in found]
+
+    def expand(self, db: Session, event_id: int, hits: Sequence[Tuple[int, float]],
+               seconds: float = TEMPORAL_WINDOW_SECONDS) -> List[Tuple[int, float]]:
+        """
+        Frames around the best TEMPORAL_MAX_SEEDS hits (photo_id, score) that aren't hits
+        themselves, as (photo_id, score): the hit's score times TEMPORAL_WEIGHT, fading
+        linearly to zero at the window's edge. Best first.
+        """
+        index = self._event(db, event_id)
+        hit_ids = {photo_id for photo_id, _ in hits}
+        window_ms = int(seconds * 1000)
+        best: Dict[int, float] = {}
+        with self._lock:
+            for photo_id, score in sorted(hits, key=lambda hit: -hit[1])[:TEMPORAL_MAX_SEEDS]:
+                for other, ms in index.nearby(photo_id, window_ms):
+                    if other in hit_ids:
+                        continue
+                    neighbor_score = score * TEMPORAL_WEIGHT * (1.0 - ms / (window_ms + 1))
+                    if neighbor_score > best.get(other, 0.0):
+                        best[other] = neighbor_score
+        return sorted(best.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _load_event_rows(db: Session, event_id: int) -> List[Tuple[int, int, datetime]]:
+    from app.models.photo import Photo
+
+    return (
+        db.query(Photo.id, Photo.photographer_id, Photo.timestamp)
+        .filter(Photo.event_id == event_id, Photo.is_public == True, Photo.timestamp.isnot(None))
+        .all()
+    )
+
+
+_temporal_index = TemporalIndex()
+
+
+def get_temporal_index() -> TemporalIndex:
+    return _temporal_index
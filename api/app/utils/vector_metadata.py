@@ -0,0 +1,307 @@
+import os
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple, Dict, Sequence, Set
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# IDSelectorBatch (hash set of ids) is used when fewer than 1/BATCH_SELECTOR_RATIO of the
+# vectors pass the filter; otherwise an IDSelectorBitmap (1 bit per vector) is cheaper to probe.
+BATCH_SELECTOR_RATIO = 64
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Restrictions applied inside the FAISS scan. None means "don't filter on this column".
+    Frozen (hashable) so it can be part of cache and batching keys.
+    """
+    event_ids: Optional[Tuple[int, ...]] = None
+    photographer_ids: Optional[Tuple[int, ...]] = None
+    photo_ids: Optional[Tuple[int, ...]] = None # Only these photos' people, e.g. bib candidates
+    public_only: bool = True
+    active_events_only: bool = True
+
+    @classmethod
+    def for_event(cls, event_id: Optional[int], **kwargs) -> "SearchFilter":
+        return cls(event_ids=(event_id,) if event_id is not None else None, **kwargs)
+
+    def is_noop(self) -> bool:
+        return (self.event_ids is None and self.photographer_ids is None and self.photo_ids is None
+                and not self.public_only and not self.active_events_only)
+
+
+class VectorMetadata:
+    """
+    Compact per-vector table indexed by FAISS ID: which photo/event/photographer a vector
+    belongs to, the photo's visibility and time, and the person's bbox. Used to compile
+    SearchFilters into FAISS ID selectors and to turn hits into photo ids without a DB trip.
+
+    Rows for IDs with unknown metadata have event_id -1 and are not public, so any active
+    filter excludes them. Deleted vectors are tombstoned (FAISS IDs are positions and can't
+    be reused) and are excluded from every search.
+
+    Not thread-safe on its own: faiss_utils mutates it under the index write lock and
+    reads it under the read lock.
+    """
+
+    COLUMNS = {
+        "photo_id": (np.int64, ()),
+        "event_id": (np.int32, ()),
+        "photographer_id": (np.int32, ()),
+        "is_public": (np.bool_, ()),
+        "timestamp": (np.int64, ()), # Photo capture time (falls back to upload time), epoch seconds
+        "bbox": (np.float16, (4,)),  # Normalized YOLO xywh
+        "deleted": (np.bool_, ()),
+    }
+    UNKNOWN = {"photo_id": -1, "event_id": -1, "photographer_id": -1, "is_public": False,
+               "timestamp": -1, "bbox": 0, "deleted": False}
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._columns: Dict[str, np.ndarray] = {
+            name: np.full((capacity,) + shape, self.UNKNOWN[name], dtype=dtype)
+            for name, (dtype, shape) in self.COLUMNS.items()
+        }
+        self.inactive_event_ids: Set[int] = set()
+        self._num_deleted = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only view of a column, trimmed to the number of rows."""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _ensure_capacity(self, size: int) -> None:
+        capacity = len(self._columns["event_id"])
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        for name, old in self._columns.items():
+            grown = np.full((new_capacity,) + old.shape[1:], self.UNKNOWN[name], dtype=old.dtype)
+            grown[:capacity] = old
+            self._columns[name] = grown
+
+    def set_rows(self, faiss_ids: Sequence[int], **columns: Sequence) -> None:
+        """
+        Writes column values for the given FAISS IDs, growing the table if needed.
+        Columns not passed keep their current (or unknown) value.
+        """
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        if faiss_ids.size == 0:
+            return
+        self._ensure_capacity(int(faiss_ids.max()) + 1)
+        for name, values in columns.items():
+            if name not in self._columns:
+                raise KeyError(f"Unknown vector metadata column '{name}'")
+            self._columns[name][faiss_ids] = np.asarray(values, dtype=self._columns[name].dtype)
+        self._size = max(self._size, int(faiss_ids.max()) + 1)
+
+    def append(self, start_id: int, count: int, **columns: Sequence) -> None:
+        """Writes rows for newly added vectors. Ids above the index size may be tombstones
+        left by compaction, so the deleted flag is cleared."""
+        faiss_ids = np.arange(start_id, start_id + count)
+        reused = faiss_ids[faiss_ids < self._size]
+        self._num_deleted -= int(self._columns["deleted"][reused].sum())
+        self.set_rows(faiss_ids, deleted=np.zeros(count, dtype=bool), **columns)
+
+    def delete(self, faiss_ids: Sequence[int]) -> None:
+        """Tombstones vectors, e.g. those of a deleted photo."""
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        faiss_ids = np.unique(faiss_ids[(faiss_ids >= 0) & (faiss_ids < self._size)])
+        self._num_deleted += int((~self._columns["deleted"][faiss_ids]).sum())
+        self._columns["deleted"][faiss_ids] = True
+
+    def num_deleted(self) -> int:
+        return self._num_deleted
+
+    def ids_for_photos(self, photo_ids: Sequence[int]) -> np.ndarray:
+        """Live FAISS IDs belonging to the given photos."""
+        photo_column = self._columns["photo_id"][:self._size]
+        live = ~self._columns["deleted"][:self._size]
+        return np.flatnonzero(np.isin(photo_column, np.asarray(photo_ids, dtype=np.int64)) & live)
+
+    def set_event_active(self, event_id: int, is_active: bool) -> None:
+        if is_active:
+            self.inactive_event_ids.discard(event_id)
+        else:
+            self.inactive_event_ids.add(event_id)
+
+    def mask(self, search_filter: SearchFilter, ntotal: int) -> np.ndarray:
+        """
+        Boolean array of length ntotal, True where the vector passes the filter.
+        Tombstoned vectors never pass; vectors without metadata pass only a no-op filter.
+        """
+        mask = np.full(ntotal, search_filter.is_noop(), dtype=bool)
+        n = min(ntotal, self._size)
+        keep = ~self._columns["deleted"][:n]
+        event_ids = self._columns["event_id"][:n]
+        if search_filter.event_ids is not None:
+            keep &= np.isin(event_ids, search_filter.event_ids)
+        if search_filter.photographer_ids is not None:
+            keep &= np.isin(self._columns["photographer_id"][:n], search_filter.photographer_ids)
+        if search_filter.photo_ids is not None:
+            in_photos = np.zeros(n, dtype=bool)
+            photo_vector_ids = self.ids_for_photos(search_filter.photo_ids)
+            in_photos[photo_vector_ids[photo_vector_ids < n]] = True
+            keep &= in_photos
+        if search_filter.public_only:
+            keep &= self._columns["is_public"][:n]
+        if search_filter.active_events_only:
+            keep &= event_ids >= 0
+            if self.inactive_event_ids:
+                keep &= ~np.isin(event_ids, list(self.inactive_event_ids))
+        mask[:n] = keep
+        return mask
+
+    def aggregate_to_photos(self, distances: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Collapses person-level hits (from one or more queries) into photos, scoring each
+        photo by its best hit.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (photo_ids, scores), sorted by score descending.
+        """
+        ids = np.asarray(indices, dtype=np.int64).ravel()
+        scores = np.asarray(distances, dtype=np.float32).ravel()
+        valid = (ids >= 0) & (ids < self._size)
+        ids, scores = ids[valid], scores[valid]
+        photo_ids = self._columns["photo_id"][ids]
+        known = (photo_ids >= 0) & ~self._columns["deleted"][ids]
+        return best_score_per_photo(photo_ids[known], scores[known])
+
+    def save(self, path: str) -> None:
+        """Writes the table next to the FAISS index (temp file + rename)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                size=np.int64(self._size),
+                inactive_event_ids=np.array(sorted(self.inactive_event_ids), dtype=np.int64),
+                **{name: column[:self._size] for name, column in self._columns.items()},
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorMetadata":
+        with np.load(path) as data:
+            size = int(data["size"])
+            metadata = cls(capacity=max(size, 1024))
+            for name in cls.COLUMNS:
+                if name in data:
+                    metadata._columns[name][:size] = data[name]
+            metadata._size = size
+            metadata._num_deleted = int(metadata._columns["deleted"][:size].sum())
+            metadata.inactive_event_ids = set(int(e) for e in data["inactive_event_ids"])
+        return metadata
+
+
+def best_score_per_photo(photo_ids: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps each photo's best score. Returns (photo_ids, scores) sorted by score descending."""
+    photo_ids = np.asarray(photo_ids, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float32)
+    if photo_ids.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    # Sort by (photo, score desc) and keep the first row of each photo
+    order = np.lexsort((-scores, photo_ids))
+    photo_ids, scores = photo_ids[order], scores[order]
+    first = np.ones(photo_ids.size, dtype=bool)
+    first[1:] = photo_ids[1:] != photo_ids[:-1]
+    photo_ids, scores = photo_ids[first], scores[first]
+
+    by_score = np.argsort(-scores, kind="stable")
+    return photo_ids[by_score], scores[by_score]
+
+
+def to_epoch_seconds(value: Optional[datetime]) -> int:
+    return int(value.timestamp()) if value is not None else -1
+
+
+def build_id_selector(mask: np.ndarray) -> Optional[faiss.IDSelector]:
+    """
+    Compiles a boolean mask over FAISS IDs into an ID selector. The numpy buffers backing
+    the selector are attached to it, so they live as long as the selector does.
+
+    Returns:
+        Optional[faiss.IDSelector]: None if no vector passes the mask.
+    """
+    selected = np.flatnonzero(mask).astype(np.int64)
+    if selected.size == 0:
+        return None
+    if selected.size * BATCH_SELECTOR_RATIO < mask.size:
+        selector = faiss.IDSelectorBatch(selected.size, faiss.swig_ptr(selected))
+        selector.referenced_objects = [selected]
+    else:
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(mask.size, faiss.swig_ptr(bitmap))
+        selector.referenced_objects = [bitmap]
+    return selector
+
+
+def load_vector_metadata(db, id_range: Optional[Tuple[int, int]] = None) -> VectorMetadata:
+    """
+    Builds the metadata table from the person_embeddings, photos and events tables.
+    Used when there is no saved table (or it doesn't match the index); afterwards the table
+    is kept up to date by the ingest, update and delete paths and saved with the index.
+
+    Args:
+        db: SQLAlchemy session.
+        id_range (Optional[Tuple[int, int]]): [start, end) of the FAISS ids held by this index
+            node (see index_router.node_id_range); rows are stored at faiss_id - start.
+    """
+    from app.models.embedding import PersonEmbedding
+    from app.models.photo import Photo
+    from app.models.event import Event
+
+    metadata = VectorMetadata()
+    rows = db.query(
+        PersonEmbedding.faiss_id, PersonEmbedding.photo_id, Photo.event_id, Photo.photographer_id,
+        Photo.is_public, Photo.timestamp, Photo.created_at,
+        PersonEmbedding.bbox_x, PersonEmbedding.bbox_y, PersonEmbedding.bbox_w, PersonEmbedding.bbox_h,
+    ).join(Photo, PersonEmbedding.photo_id == Photo.id)
+    start = 0
+    if id_range is not None:
+        start = id_range[0]
+        rows = rows.filter(PersonEmbedding.faiss_id >= id_range[0], PersonEmbedding.faiss_id < id_range[1])
+
+    batch = []
+    for row in rows.yield_per(10000):
+        batch.append(row)
+        if len(batch) >= 10000:
+            _apply_metadata_rows(metadata, batch, start)
+            batch = []
+    _apply_metadata_rows(metadata, batch, start)
+
+    # FAISS ids below the table size with no DB row belong to deleted photos
+    metadata.delete(np.flatnonzero(metadata.column("photo_id") < 0))
+
+    for (event_id,) in db.query(Event.id).filter(Event.is_active == False):
+        metadata.set_event_active(event_id, False)
+
+    logger.info(f"Loaded vector metadata for {len(metadata)} FAISS ids "
+                f"({len(metadata.inactive_event_ids)} inactive events).")
+    return metadata
+
+
+def _apply_metadata_rows(metadata: VectorMetadata, rows, start: int = 0) -> None:
+    if not rows:
+        return
+    (faiss_ids, photo_ids, event_ids, photographer_ids, is_public, timestamps, created_ats,
+     bbox_x, bbox_y, bbox_w, bbox_h) = zip(*rows)
+    metadata.set_rows(
+        np.asarray(faiss_ids, dtype=np.int64) - start,
+        photo_id=photo_ids,
+        event_id=[e if e is not None else -1 for e in event_ids],
+        photographer_id=[p if p is not None else -1 for p in photographer_ids],
+        is_public=[v is not False for v in is_public], # NULL means the column default (public)
+        timestamp=[to_epoch_seconds(t or c) for t, c in zip(timestamps, created_ats)],
+        bbox=np.column_stack([bbox_x, bbox_y, bbox_w, bbox_h]),
+    )
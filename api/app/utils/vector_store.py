@@ -0,0 +1,435 @@
+"""
+Pluggable storage for person vectors.
+
+VectorStore is what ingest and request handlers use: add, delete, metadata updates,
+filtered search, hit-to-photo aggregation, snapshot and stats. Backends:
+
+- FaissVectorStore: the FAISS index managed by faiss_utils (in process, or the index service).
+- SqlVectorStore: vectors in the person_vectors table next to the app data (SQLite or
+  Postgres) with brute-force search. For small deployments; adds can join the caller's
+  transaction so vectors and PersonEmbedding rows commit together.
+
+VECTOR_STORE_BACKEND ("faiss" or "sql") picks the backend returned by get_vector_store().
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple, List, Dict, Sequence
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.utils import faiss_utils
+from app.utils.vector_metadata import SearchFilter, best_score_per_photo
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "faiss").lower()
+
+# Rows per IN (...) clause / fetch batch
+_SQL_CHUNK = 10000
+
+
+class VectorStore(ABC):
+    """
+    Person vector storage. FAISS IDs are handed out by the store and are what
+    PersonEmbedding.faiss_id points at. Search results follow the faiss_utils contract:
+    (distances, indices) of shape (num_queries, k), best first, padded with -inf / -1.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def add(self, embeddings: np.ndarray, metadata: Optional[Dict[str, Sequence]] = None,
+            db: Optional[Session] = None) -> Tuple[bool, Optional[List[int]]]:
+        """
+        Adds L2-normalized embeddings with their VectorMetadata columns.
+        Backends living in the database add to `db` without committing, so the vectors commit
+        with the caller's rows; other backends ignore it.
+        """
+
+    @abstractmethod
+    def delete(self, faiss_ids: Sequence[int]) -> None:
+        """Excludes vectors from every later search."""
+
+    @abstractmethod
+    def update_metadata(self, faiss_ids: Sequence[int], **columns: Sequence) -> None:
+        """Updates filter columns (event_id, is_public, timestamp, ...) for existing vectors."""
+
+    def move_vectors(self, faiss_ids: Sequence[int], metadata: Dict[str, Sequence]) -> Optional[List[int]]:
+        """
+        Rewrites every metadata column of existing vectors, e.g. for a photo moved to another
+        event. Returns their ids afterwards, which backends that place vectors by event may
+        change, or None on failure.
+        """
+        self.update_metadata(faiss_ids, **metadata)
+        return [int(i) for i in faiss_ids]
+
+    @abstractmethod
+    def set_event_active(self, event_id: int, is_active: bool) -> None:
+        """Marks an event as (de)activated for SearchFilter.active_events_only."""
+
+    @abstractmethod
+    def search(self, query_vectors: np.ndarray, k: int,
+               search_filter: Optional[SearchFilter] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Top-k inner-product search restricted to vectors passing `search_filter`."""
+
+    def search_multi(self, query_vectors: np.ndarray, ks: Sequence[int],
+                     search_filter: Optional[SearchFilter] = None) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Searches several queries at once (e.g. the faces of a group), each with its own k.
+        Returns per query (distances, indices) of length ks[i], or None on failure.
+        """
+        query_vectors = np.atleast_2d(query_vectors)
+        if len(ks) != query_vectors.shape[0]:
+            logger.error(f"Got {len(ks)} k values for {query_vectors.shape[0]} queries.")
+            return None
+        result = self.search(query_vectors, max(ks), search_filter=search_filter)
+        if result is None:
+            return None
+        distances, indices = result
+        return [(distances[i, :k], indices[i, :k]) for i, k in enumerate(ks)]
+
+    @abstractmethod
+    def get_vectors(self, faiss_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """(found_ids, vectors) for stored, non-deleted ids in request order; others are left out."""
+
+    @abstractmethod
+    def aggregate_to_photos(self, distances: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Turns hits into (photo_ids, scores), each photo scored by its best hit."""
+
+    @abstractmethod
+    def snapshot(self) -> bool:
+        """Makes everything written so far durable."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, object]:
+        """Sizes for health checks: at least backend, ntotal and deleted."""
+
+
+class FaissVectorStore(VectorStore):
+    """The process-wide FAISS index in faiss_utils (base + delta, or the index service)."""
+
+    name = "faiss"
+
+    def add(self, embeddings, metadata=None, db=None):
+        return faiss_utils.add_embeddings_to_index(embeddings, metadata=metadata)
+
+    def delete(self, faiss_ids):
+        faiss_utils.delete_vectors(faiss_ids)
+
+    def update_metadata(self, faiss_ids, **columns):
+        faiss_utils.update_vector_metadata(faiss_ids, **columns)
+
+    def move_vectors(self, faiss_ids, metadata):
+        return faiss_utils.move_vectors(faiss_ids, metadata)
+
+    def set_event_active(self, event_id, is_active):
+        faiss_utils.set_event_active(event_id, is_active)
+
+    def search(self, query_vectors, k, search_filter=None):
+        return faiss_utils.search_batched(query_vectors, k, search_filter=search_filter)
+
+    def search_multi(self, query_vectors, ks, search_filter=None):
+        return faiss_utils.search_faiss_index_multi(query_vectors, ks, search_filter=search_filter)
+
+    def get_vectors(self, faiss_ids):
+        return faiss_utils.get_vectors(faiss_ids)
+
+    def aggregate_to_photos(self, distances, indices):
+        return faiss_utils.aggregate_hits_to_photos(distances, indices)
+
+    def snapshot(self):
+        return faiss_utils.save_faiss_index()
+
+    def stats(self):
+        stats = dict(faiss_utils.get_index_stats())
+        stats["backend"] = self.name
+        return stats
+
+
+class SqlVectorStore(VectorStore):
+    """
+    Vectors stored as float32 blobs in person_vectors. Filters run in SQL; scoring is one
+    matrix product over the matching rows, so search cost grows linearly with the event
+    (or table) size. Meant for deployments up to a few hundred thousand vectors.
+    """
+
+    name = "sql"
+
+    def __init__(self, session_factory=None, dim: int = faiss_utils.EMBEDDING_DIM):
+        if session_factory is None:
+            from app.database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.dim = dim
+
+    def _rows(self, embeddings: np.ndarray, start_id: int, metadata: Dict[str, Sequence]) -> List:
+        from app.models.vector import PersonVector
+
+        n = embeddings.shape[0]
+        def column(name, cast):
+            values = metadata.get(name)
+            return [None] * n if values is None else [cast(v) for v in values]
+        photo_ids = column("photo_id", int)
+        event_ids = column("event_id", int)
+        photographer_ids = column("photographer_id", int)
+        is_public = column("is_public", bool)
+        timestamps = column("timestamp", int)
+        bboxes = metadata.get("bbox")
+        bboxes = np.asarray(bboxes, dtype=float).reshape(n, 4).tolist() if bboxes is not None else [[None] * 4] * n
+        return [
+            PersonVector(
+                faiss_id=start_id + i,
+                embedding=embeddings[i].tobytes(),
+                photo_id=_known(photo_ids[i]),
+                event_id=_known(event_ids[i]),
+                photographer_id=_known(photographer_ids[i]),
+                is_public=bool(is_public[i]),
+                timestamp=_known(timestamps[i]),
+                bbox_x=bboxes[i][0], bbox_y=bboxes[i][1], bbox_w=bboxes[i][2], bbox_h=bboxes[i][3],
+                deleted=False,
+            )
+            for i in range(n)
+        ]
+
+    def add(self, embeddings, metadata=None, db=None):
+        if not isinstance(embeddings, np.ndarray) or embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            logger.error(f"Embeddings must be a 2D numpy array with shape (*, {self.dim}).")
+            return False, None
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        session = db if db is not None else self.session_factory()
+        try:
+            start_id = _allocate_ids(session, embeddings.shape[0])
+            session.add_all(self._rows(embeddings, start_id, metadata or {}))
+            session.flush()
+            if db is None:
+                session.commit()
+            return True, list(range(start_id, start_id + embeddings.shape[0]))
+        except Exception as e:
+            logger.error(f"Failed to add {embeddings.shape[0]} vectors to the SQL vector store: {e}")
+            if db is None:
+                session.rollback()
+            return False, None
+        finally:
+            if db is None:
+                session.close()
+
+    def delete(self, faiss_ids):
+        from app.models.vector import PersonVector
+
+        faiss_ids = [int(i) for i in faiss_ids]
+        session = self.session_factory()
+        try:
+            for start in range(0, len(faiss_ids), _SQL_CHUNK):
+                chunk = faiss_ids[start:start + _SQL_CHUNK]
+                session.query(PersonVector).filter(PersonVector.faiss_id.in_(chunk)).update(
+                    {PersonVector.deleted: True}, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to delete vectors from the SQL vector store: {e}")
+        finally:
+            session.close()
+
+    def update_metadata(self, faiss_ids, **columns):
+        from app.models.vector import PersonVector
+
+        faiss_ids = [int(i) for i in faiss_ids]
+        updates = [{"faiss_id": faiss_id} for faiss_id in faiss_ids]
+        for name, values in columns.items():
+            if name == "bbox":
+                for update, (x, y, w, h) in zip(updates, np.asarray(values, dtype=float).reshape(-1, 4).tolist()):
+                    update.update(bbox_x=x, bbox_y=y, bbox_w=w, bbox_h=h)
+            elif name in ("is_public", "deleted"):
+                for update, value in zip(updates, values):
+                    update[name] = bool(value)
+            elif name in ("photo_id", "event_id", "photographer_id", "timestamp"):
+                for update, value in zip(updates, values):
+                    update[name] = _known(int(value))
+            else:
+                raise KeyError(f"Unknown vector metadata column '{name}'")
+        session = self.session_factory()
+        try:
+            session.bulk_update_mappings(PersonVector, updates)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to update vector metadata in the SQL vector store: {e}")
+        finally:
+            session.close()
+
+    def set_event_active(self, event_id, is_active):
+        from app.models.vector import InactiveVectorEvent
+
+        session = self.session_factory()
+        try:
+            existing = session.get(InactiveVectorEvent, event_id)
+            if is_active and existing is not None:
+                session.delete(existing)
+            elif not is_active and existing is None:
+                session.add(InactiveVectorEvent(event_id=event_id))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to set event {event_id} active={is_active} in the SQL vector store: {e}")
+        finally:
+            session.close()
+
+    def _filtered_query(self, session: Session, search_filter: SearchFilter):
+        from app.models.vector import PersonVector, InactiveVectorEvent
+
+        query = session.query(PersonVector.faiss_id, PersonVector.embedding).filter(PersonVector.deleted == False)
+        # Same semantics as VectorMetadata.mask: rows with unknown metadata fail any active filter
+        if search_filter.event_ids is not None:
+            query = query.filter(PersonVector.event_id.in_(search_filter.event_ids))
+        if search_filter.photographer_ids is not None:
+            query = query.filter(PersonVector.photographer_id.in_(search_filter.photographer_ids))
+        if search_filter.photo_ids is not None:
+            query = query.filter(PersonVector.photo_id.in_(search_filter.photo_ids))
+        if search_filter.public_only:
+            query = query.filter(PersonVector.is_public == True)
+        if search_filter.active_events_only:
+            query = query.filter(
+                PersonVector.event_id.isnot(None),
+                ~PersonVector.event_id.in_(select(InactiveVectorEvent.event_id)),
+            )
+        return query
+
+    def search(self, query_vectors, k, search_filter=None):
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if query_vectors.ndim != 2 or query_vectors.shape[1] != self.dim:
+            logger.error(f"Query vectors must have dimension {self.dim}.")
+            return None
+        if search_filter is None:
+            search_filter = SearchFilter(public_only=False, active_events_only=False)
+
+        session = self.session_factory()
+        try:
+            ids, blobs = [], []
+            for faiss_id, embedding in self._filtered_query(session, search_filter).yield_per(_SQL_CHUNK):
+                ids.append(faiss_id)
+                blobs.append(embedding)
+        except Exception as e:
+            logger.error(f"Error during SQL vector search: {e}")
+            return None
+        finally:
+            session.close()
+
+        num_queries = query_vectors.shape[0]
+        distances = np.full((num_queries, k), -np.inf, dtype=np.float32)
+        indices = np.full((num_queries, k), -1, dtype=np.int64)
+        if not ids:
+            return distances, indices
+        vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(ids), self.dim)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        scores = query_vectors @ vectors.T
+        top = min(k, len(ids))
+        candidates = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        distances[:, :top] = np.take_along_axis(candidate_scores, order, axis=1)
+        indices[:, :top] = ids[np.take_along_axis(candidates, order, axis=1)]
+        return distances, indices
+
+    def get_vectors(self, faiss_ids):
+        from app.models.vector import PersonVector
+
+        requested = [int(i) for i in faiss_ids]
+        found = {}
+        session = self.session_factory()
+        try:
+            for start in range(0, len(requested), _SQL_CHUNK):
+                rows = session.query(PersonVector.faiss_id, PersonVector.embedding).filter(
+                    PersonVector.faiss_id.in_(requested[start:start + _SQL_CHUNK]),
+                    PersonVector.deleted == False,
+                )
+                found.update(rows)
+        except Exception as e:
+            logger.error(f"Failed to fetch vectors from the SQL vector store: {e}")
+            found = {}
+        finally:
+            session.close()
+        ids = [i for i in requested if i in found]
+        vectors = np.frombuffer(b"".join(found[i] for i in ids), dtype=np.float32).reshape(len(ids), self.dim)
+        return np.asarray(ids, dtype=np.int64), vectors
+
+    def aggregate_to_photos(self, distances, indices):
+        from app.models.vector import PersonVector
+
+        ids = np.asarray(indices, dtype=np.int64).ravel()
+        scores = np.asarray(distances, dtype=np.float32).ravel()
+        valid = ids >= 0
+        ids, scores = ids[valid], scores[valid]
+        unique_ids = np.unique(ids).tolist()
+        photo_by_id = {}
+        session = self.session_factory()
+        try:
+            for start in range(0, len(unique_ids), _SQL_CHUNK):
+                rows = session.query(PersonVector.faiss_id, PersonVector.photo_id).filter(
+                    PersonVector.faiss_id.in_(unique_ids[start:start + _SQL_CHUNK]),
+                    PersonVector.deleted == False,
+                    PersonVector.photo_id.isnot(None),
+                )
+                photo_by_id.update(rows)
+        finally:
+            session.close()
+        photo_ids = np.array([photo_by_id.get(int(i), -1) for i in ids], dtype=np.int64)
+        known = photo_ids >= 0
+        return best_score_per_photo(photo_ids[known], scores[known])
+
+    def snapshot(self):
+        return True # Every write is committed as it happens
+
+    def stats(self):
+        from app.models.vector import PersonVector
+
+        session = self.session_factory()
+        try:
+            ntotal = session.query(func.count(PersonVector.faiss_id)).scalar()
+            deleted = session.query(func.count(PersonVector.faiss_id)).filter(PersonVector.deleted == True).scalar()
+        finally:
+            session.close()
+        return {"backend": self.name, "ntotal": ntotal, "deleted": deleted}
+
+
+def _known(value):
+    """Maps the VectorMetadata 'unknown' marker (-1) to NULL."""
+    return None if value is None or value < 0 else value
+
+
+def _allocate_ids(session: Session, count: int) -> int:
+    """
+    Reserves `count` consecutive FAISS ids in `session`'s transaction and returns the first.
+    The UPDATE locks the counter row (all of SQLite) until that transaction ends, so adds in
+    other workers wait instead of reading the same ids; a rolled-back add frees its ids.
+    """
+    from app.models.vector import PersonVector, PersonVectorIdCounter
+
+    counter = PersonVectorIdCounter
+    updated = session.query(counter).filter(counter.id == 1).update(
+        {counter.next_id: counter.next_id + count}, synchronize_session=False)
+    if not updated:
+        # Tables made without migrations (create_all) start without the counter row
+        last_id = session.query(func.max(PersonVector.faiss_id)).scalar()
+        session.add(counter(id=1, next_id=(last_id + 1 if last_id is not None else 0) + count))
+        session.flush()
+    return session.query(counter.next_id).filter(counter.id == 1).scalar() - count
+
+
+_vector_store: Optional[VectorStore] = None
+
+def get_vector_store() -> VectorStore:
+    """The configured backend (VECTOR_STORE_BACKEND), created on first use."""
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_STORE_BACKEND == "sql":
+            _vector_store = SqlVectorStore()
+        else:
+            if VECTOR_STORE_BACKEND != "faiss":
+                logger.warning(f"Unknown VECTOR_STORE_BACKEND '{VECTOR_STORE_BACKEND}'. Using FAISS.")
+            _vector_store = FaissVectorStore()
+    return _vector_store
@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models.photo import Photo
+from app.models.photo_bib import PhotoBib
+from app.crud.photo import parse_bib_numbers
+
+
+def backfill_batch(db, after_id, batch_size):
+    """
+    Rewrites photo_bibs for the next batch of photos with id > after_id in one transaction.
+    The photo rows are locked (on databases that support it) so a concurrent tag edit can't
+    be overwritten with the bibs read here.
+    Returns (last photo id in the batch or None when done, bib rows written).
+    """
+    photos = (
+        db.query(Photo.id, Photo.event_id, Photo.bib_numbers)
+        .filter(Photo.id > after_id)
+        .order_by(Photo.id)
+        .limit(batch_size)
+        .with_for_update()
+        .all()
+    )
+    if not photos:
+        db.rollback()
+        return None, 0
+    photo_ids = [photo.id for photo in photos]
+    db.query(PhotoBib).filter(PhotoBib.photo_id.in_(photo_ids)).delete(synchronize_session=False)
+    rows = [
+        {"photo_id": photo.id, "bib": bib, "event_id": photo.event_id}
+        for photo in photos
+        for bib in parse_bib_numbers(photo.bib_numbers)
+    ]
+    if rows:
+        db.bulk_insert_mappings(PhotoBib, rows)
+    db.commit()
+    return photo_ids[-1], len(rows)
+
+
+def backfill(batch_size=1000, pause=0.0, start_after=0):
+    """Backfills every photo after `start_after`, one committed batch at a time, so it can be resumed."""
+    db = SessionLocal()
+    try:
+        last_id, total_bibs = start_after, 0
+        while True:
+            batch_last_id, written = backfill_batch(db, last_id, batch_size)
+            if batch_last_id is None:
+                break
+            total_bibs += written
+            print(f"Backfilled photos up to id {batch_last_id} ({total_bibs} bib rows so far)")
+            last_id = batch_last_id
+            if pause:
+                # Leave room for API writes between batches
+                time.sleep(pause)
+        print(f"Done: {total_bibs} bib rows written for photos with id > {start_after}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill photo_bibs from photos.bib_numbers, in small transactions.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Photos per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--start-after", type=int, default=0, help="Resume after this photo id")
+    args = parser.parse_args()
+    backfill(args.batch_size, args.pause, args.start_after)
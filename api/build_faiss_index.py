@@ -0,0 +1,109 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.utils import faiss_utils
+from app.utils.index_router import node_id_range
+from app.utils.vector_metadata import load_vector_metadata
+
+
+def print_report(rows):
+    print(f"{'type':<8} {'recall@k':>9} {'bytes/vec':>10} {'total MB':>9} {'ms/query':>9}")
+    for index_type, report in rows:
+        print(
+            f"{index_type:<8} {report['recall_at_k']:>9.4f} {report['bytes_per_vector']:>10.1f} "
+            f"{report['total_bytes'] / 1e6:>9.2f} {report['ms_per_query']:>9.3f}"
+        )
+
+
+def load_metadata(node):
+    # Saving the rebuilt index also saves the metadata table, so it must be loaded first
+    metadata = faiss_utils.load_saved_vector_metadata()
+    if metadata is None:
+        db = SessionLocal()
+        try:
+            metadata = load_vector_metadata(db, id_range=node_id_range(node))
+        finally:
+            db.close()
+    faiss_utils.set_vector_metadata(metadata)
+    return metadata
+
+
+def build_index(index_type, compare_types, dry_run, k, node):
+    size = faiss_utils.get_index_size()
+    if size == 0:
+        print("FAISS index is missing or empty. Nothing to build.")
+        return
+    metadata = load_metadata(node)
+
+    # Exact vectors come from the raw vector store, so no CLIP re-run is needed. Without a
+    # complete store they are decoded from the current index, which compounds a lossy codec's error.
+    store = faiss_utils.get_raw_vector_store()
+    if store is not None and len(store) == size:
+        vectors = store.read_all()
+        print(f"Loaded {vectors.shape[0]} exact vectors from {store.path}")
+    else:
+        vectors = faiss_utils.reconstruct_vectors(0, size)
+        print(f"Loaded {vectors.shape[0]} vectors from {faiss_utils.FAISS_INDEX_PATH} and its delta")
+
+    # Tombstoned vectors are left out, as compaction does; live ones keep their FAISS IDs
+    deleted = np.zeros(size, dtype=bool)
+    known = min(size, len(metadata))
+    deleted[:known] = metadata.column("deleted")[:known]
+    live_ids = np.flatnonzero(~deleted)
+    if live_ids.size == 0:
+        print("Every vector in the index is tombstoned. Nothing to build.")
+        return
+    vectors = vectors[live_ids]
+    print(f"Building from {live_ids.size} live vectors ({int(deleted.sum())} tombstones dropped)")
+
+    rows = []
+    built = None
+    for candidate in dict.fromkeys(compare_types + [index_type]):
+        try:
+            index = faiss_utils.build_faiss_index(vectors, candidate, faiss_ids=live_ids)
+        except Exception as e:
+            print(f"Could not build '{candidate}' index: {e}")
+            continue
+        rows.append((candidate, faiss_utils.evaluate_index(index, vectors, k=k, faiss_ids=live_ids)))
+        if candidate == index_type:
+            built = index
+
+    print_report(rows)
+
+    if built is None:
+        print(f"'{index_type}' index was not built; the current index is unchanged.")
+        return
+    if dry_run:
+        print("Dry run: the current index is unchanged.")
+        return
+
+    faiss_utils.replace_faiss_index(built)
+    if faiss_utils.save_faiss_index():
+        print(f"Saved '{index_type}' index with {built.ntotal} vectors to {faiss_utils.FAISS_INDEX_PATH}")
+        print(f"Set FAISS_INDEX_TYPE={index_type} so new indexes are created with the same codec.")
+    else:
+        print("Failed to save the rebuilt index.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the person FAISS index with a different codec and report recall vs memory.")
+    parser.add_argument("--type", default=faiss_utils.FAISS_INDEX_TYPE, choices=sorted(faiss_utils.FAISS_INDEX_FACTORY_STRINGS))
+    parser.add_argument("--compare", action="store_true", help="Also build and report every other codec")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the report, do not replace the index")
+    parser.add_argument("-k", type=int, default=10, help="k used for recall@k")
+    parser.add_argument("--node", type=int, default=0, help="Index node to rebuild when the index is sharded")
+    args = parser.parse_args()
+
+    # Work on the index files directly; stop the index service for this node before rebuilding
+    faiss_utils.FAISS_SERVICE_SOCKET = None
+    faiss_utils.FAISS_SERVICE_NODES = None
+
+    compare_types = sorted(faiss_utils.FAISS_INDEX_FACTORY_STRINGS) if args.compare else []
+    build_index(args.type, compare_types, args.dry_run, args.k, args.node)
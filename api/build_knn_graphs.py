@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.utils.knn_graph import update_event_graph, update_all_graphs, KNN_GRAPH_K
+
+
+def build(event_ids=None, k=KNN_GRAPH_K, rebuild=False):
+    """Builds or extends the kNN graphs of the given events (every event with detections by default)."""
+    db = SessionLocal()
+    try:
+        if not event_ids:
+            print(f"Added {update_all_graphs(db, k=k)} detections to event graphs.")
+            return
+        for event_id in event_ids:
+            added = update_event_graph(db, event_id, k=k, rebuild=rebuild)
+            print(f"Event {event_id}: added {added} detections.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute per-event kNN graphs of person detections.")
+    parser.add_argument("--event-id", type=int, action="append", help="Event to build (repeatable); default all")
+    parser.add_argument("--k", type=int, default=KNN_GRAPH_K, help="Neighbors per detection")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild from scratch instead of extending")
+    args = parser.parse_args()
+    build(args.event_id, args.k, args.rebuild)
@@ -0,0 +1,375 @@
+import argparse
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models.embedding import PersonEmbedding
+from app.models.photo import Photo
+from app.utils import faiss_utils
+from app.utils.index_router import event_nodes, node_id_range, split_global_ids, to_global_ids
+from app.utils.vector_metadata import VectorMetadata, load_vector_metadata
+
+BATCH_SIZE = 10000
+MAX_LISTED = 20 # Ids printed per problem category
+
+
+def stream_embedding_rows(db, node):
+    """Yields (local faiss_id, photo_id) batches for this node, ordered by faiss_id."""
+    start, end = node_id_range(node)
+    rows = (
+        db.query(PersonEmbedding.faiss_id, PersonEmbedding.photo_id)
+        .filter(PersonEmbedding.faiss_id >= start, PersonEmbedding.faiss_id < end)
+        .order_by(PersonEmbedding.faiss_id)
+        .yield_per(BATCH_SIZE)
+    )
+    batch = []
+    for faiss_id, photo_id in rows:
+        batch.append((faiss_id - start, photo_id))
+        if len(batch) >= BATCH_SIZE:
+            yield np.array(batch, dtype=np.int64)
+            batch = []
+    if batch:
+        yield np.array(batch, dtype=np.int64)
+
+
+def check_index(db, node):
+    """
+    Cross-checks person_embeddings against the index, raw vector store and metadata table.
+
+    Returns:
+        dict: Problem category -> array of local FAISS ids, plus sizes.
+    """
+    ntotal = faiss_utils.get_index_size()
+    store = faiss_utils.get_raw_vector_store()
+    metadata = faiss_utils.get_vector_metadata()
+    meta_photo_ids = metadata.column("photo_id")
+    meta_deleted = metadata.column("deleted")
+
+    referenced = np.zeros(ntotal, dtype=bool)
+    dangling, duplicates, mismatched, tombstoned = [], [], [], []
+    max_id, num_rows = -1, 0
+    for batch in stream_embedding_rows(db, node):
+        ids, photo_ids = batch[:, 0], batch[:, 1]
+        num_rows += len(ids)
+        max_id = max(max_id, int(ids.max()))
+        dangling.append(ids[ids >= ntotal])
+        in_index = ids < ntotal
+        ids, photo_ids = ids[in_index], photo_ids[in_index]
+        duplicates.append(ids[referenced[ids]])
+        referenced[ids] = True
+
+        has_row = ids < len(metadata)
+        known_ids, known_photos = ids[has_row], photo_ids[has_row]
+        mismatched.append(known_ids[(meta_photo_ids[known_ids] >= 0) & (meta_photo_ids[known_ids] != known_photos)])
+        tombstoned.append(known_ids[meta_deleted[known_ids]])
+
+    live = np.ones(ntotal, dtype=bool)
+    live[:min(ntotal, len(metadata))] = ~meta_deleted[:ntotal]
+    empty = np.zeros(0, dtype=np.int64)
+    return {
+        "db_rows": num_rows,
+        "ntotal": ntotal,
+        "max_db_id": max_id,
+        "raw_vectors": len(store) if store is not None else 0,
+        "metadata_rows": len(metadata),
+        # DB rows whose vector is missing from the index (crash after commit, lost save)
+        "dangling": np.concatenate(dangling) if dangling else empty,
+        # Several DB rows claiming the same vector
+        "duplicates": np.concatenate(duplicates) if duplicates else empty,
+        # Index metadata says the vector belongs to a different photo than the DB row
+        "mismatched": np.concatenate(mismatched) if mismatched else empty,
+        # DB row exists but the vector is tombstoned, so the person can't be found
+        "tombstoned": np.concatenate(tombstoned) if tombstoned else empty,
+        # Live vectors with no DB row (crash before commit); search hits resolve to nothing
+        "orphans": np.flatnonzero(live & ~referenced),
+        # Dead slots: vectors of deleted photos, kept so ids stay positional
+        "gaps": np.flatnonzero(~live & ~referenced),
+    }
+
+
+def print_report(report, node):
+    start, _ = node_id_range(node)
+    print(f"person_embeddings rows: {report['db_rows']} (max faiss_id {report['max_db_id'] + start})")
+    print(f"index vectors:          {report['ntotal']}")
+    print(f"raw vectors:            {report['raw_vectors']}")
+    print(f"metadata rows:          {report['metadata_rows']}")
+    problems = 0
+    for name in ("dangling", "duplicates", "mismatched", "tombstoned", "orphans", "gaps"):
+        ids = report[name]
+        listed = ", ".join(str(int(i) + start) for i in ids[:MAX_LISTED])
+        more = f", ... ({ids.size - MAX_LISTED} more)" if ids.size > MAX_LISTED else ""
+        print(f"{name:<11} {ids.size:>8}  {listed}{more}")
+        if name != "gaps":
+            problems += ids.size
+    if report["raw_vectors"] not in (0, report["ntotal"]):
+        print(f"Raw vector store has {report['raw_vectors']} rows for {report['ntotal']} index vectors.")
+        problems += 1
+    print("OK" if problems == 0 else f"{problems} problem(s) found.")
+    return problems
+
+
+def load_stored_vectors(count, workers):
+    """
+    Reads vectors 0..count-1 from the raw store (or the index for rows the store lacks)
+    in parallel chunks.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (vectors, missing), where missing marks rows neither has.
+    """
+    store = faiss_utils.get_raw_vector_store()
+    stored = len(store) if store is not None else 0
+    ntotal = faiss_utils.get_index_size()
+    vectors = np.zeros((count, faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+
+    def load_chunk(chunk_start):
+        chunk_end = min(chunk_start + BATCH_SIZE, count)
+        from_store = min(chunk_end, stored)
+        if chunk_start < from_store:
+            vectors[chunk_start:from_store] = store.get(np.arange(chunk_start, from_store))
+        from_index_start, from_index_end = max(chunk_start, stored), min(chunk_end, ntotal)
+        if from_index_start < from_index_end:
+            vectors[from_index_start:from_index_end] = faiss_utils.reconstruct_vectors(from_index_start, from_index_end)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(load_chunk, range(0, count, BATCH_SIZE)))
+    missing = np.zeros(count, dtype=bool)
+    missing[max(stored, ntotal):] = True
+    return vectors, missing
+
+
+def reembed_vectors(db, node, local_ids, workers):
+    """
+    Re-runs CLIP on the stored person boxes for the given local FAISS ids, one photo per task.
+    YOLO is not re-run: the crops come from the bboxes saved in person_embeddings.
+
+    Returns:
+        dict: local faiss_id -> embedding, for the rows that could be re-embedded.
+    """
+    from PIL import Image
+    from app.utils.person_clip_utils import get_clip_embedding_for_crop
+
+    start, _ = node_id_range(node)
+    by_photo = defaultdict(list)
+    global_ids = [int(i) + start for i in local_ids]
+    for chunk_start in range(0, len(global_ids), BATCH_SIZE):
+        chunk = global_ids[chunk_start:chunk_start + BATCH_SIZE]
+        rows = (
+            db.query(PersonEmbedding.faiss_id, PersonEmbedding.bbox_x, PersonEmbedding.bbox_y,
+                     PersonEmbedding.bbox_w, PersonEmbedding.bbox_h, Photo.path)
+            .join(Photo, PersonEmbedding.photo_id == Photo.id)
+            .filter(PersonEmbedding.faiss_id.in_(chunk))
+        )
+        for faiss_id, x, y, w, h, path in rows:
+            by_photo[path].append((faiss_id - start, (x, y, w, h)))
+
+    def embed_photo(item):
+        path, boxes = item
+        file_path = os.path.join(os.getcwd(), path.lstrip('/'))
+        try:
+            image = Image.open(file_path).convert("RGB")
+        except Exception as e:
+            print(f"Could not open {file_path}: {e}")
+            return []
+        img_w, img_h = image.size
+        embedded = []
+        for local_id, (cx, cy, w, h) in boxes:
+            x1, y1 = max(0, (cx - w / 2) * img_w), max(0, (cy - h / 2) * img_h)
+            x2, y2 = min(img_w, (cx + w / 2) * img_w), min(img_h, (cy + h / 2) * img_h)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            embedding = get_clip_embedding_for_crop(image.crop((x1, y1, x2, y2)))
+            if embedding is not None:
+                embedded.append((local_id, embedding))
+        return embedded
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for embedded in executor.map(embed_photo, by_photo.items()):
+            results.update(embedded)
+    return results
+
+
+def rebuild(db, node, report, mode, workers, index_type, reembed_missing=False):
+    """
+    Rebuilds the index so that every DB row resolves to its own vector. Ids stay positional:
+    the index grows to cover the highest DB faiss_id, and slots without a DB row are tombstoned.
+    """
+    count = max(report["ntotal"], report["max_db_id"] + 1)
+    if mode == "raw":
+        vectors, missing = load_stored_vectors(count, workers)
+    else:
+        vectors = np.zeros((count, faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+        missing = np.ones(count, dtype=bool)
+
+    referenced = np.zeros(count, dtype=bool)
+    for batch in stream_embedding_rows(db, node):
+        referenced[batch[:, 0]] = True
+    to_embed = np.flatnonzero(referenced & missing)
+    if to_embed.size and (mode == "reembed" or reembed_missing):
+        print(f"Re-embedding {to_embed.size} person crops with {workers} workers...")
+        for local_id, embedding in reembed_vectors(db, node, to_embed, workers).items():
+            vectors[local_id] = embedding
+            missing[local_id] = False
+    unrecovered = np.flatnonzero(referenced & missing)
+    if unrecovered.size:
+        print(f"{unrecovered.size} DB rows have no vector and will stay unsearchable "
+              f"(run with --reembed-missing or --rebuild reembed).")
+
+    metadata = load_vector_metadata(db, id_range=node_id_range(node))
+    dead = np.flatnonzero(~referenced | missing)
+    if len(metadata) < count:
+        # Extend the table to the new index size; the tail has no DB rows
+        metadata.set_rows(np.arange(len(metadata), count), photo_id=np.full(count - len(metadata), -1))
+    metadata.delete(dead)
+    for event_id in faiss_utils.get_vector_metadata().inactive_event_ids:
+        metadata.set_event_active(event_id, False)
+
+    if faiss_utils.rebuild_faiss_index(vectors, metadata, index_type):
+        print(f"Rebuilt index with {count} vectors ({metadata.num_deleted()} tombstoned) in {faiss_utils.FAISS_DATA_DIR}")
+    else:
+        print("Rebuild failed; the index on disk is unchanged.")
+
+
+def reshard(db, source_dirs, out_dir, num_nodes, index_type):
+    """
+    Splits the index held by `source_dirs` (the current nodes' data directories, in node
+    order) into `num_nodes` indexes under out_dir/node<i>, each vector going to the node that
+    owns its event (event_id % num_nodes), and rewrites person_embeddings.faiss_id to the new
+    global ids. Run with every index service stopped, then start node i on out_dir/node<i>.
+
+    Returns:
+        bool: True if the new indexes were saved and the DB ids committed.
+    """
+    target_dirs = [os.path.join(out_dir, f"node{node}") for node in range(num_nodes)]
+    for data_dir in target_dirs:
+        if os.path.exists(data_dir) and os.listdir(data_dir):
+            print(f"{data_dir} is not empty; reshard into a fresh directory.")
+            return False
+
+    rows = (
+        db.query(PersonEmbedding.id, PersonEmbedding.faiss_id, Photo.event_id)
+        .outerjoin(Photo, PersonEmbedding.photo_id == Photo.id)
+        .order_by(PersonEmbedding.faiss_id)
+        .all()
+    )
+    embedding_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    old_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    event_ids = np.array([row[2] if row[2] is not None else -1 for row in rows], dtype=np.int64)
+
+    # Exact vectors from each current node, by the local ids the DB points at
+    vectors = np.zeros((len(rows), faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+    found = np.zeros(len(rows), dtype=bool)
+    old_nodes, old_local_ids = split_global_ids(old_ids)
+    for node, data_dir in enumerate(source_dirs):
+        members = np.flatnonzero(old_nodes == node)
+        if not members.size:
+            continue
+        faiss_utils.open_data_dir(data_dir)
+        faiss_utils.set_vector_metadata(VectorMetadata()) # The DB rows decide what is live
+        found_ids, node_vectors = faiss_utils.get_vectors(old_local_ids[members])
+        position = {int(local_id): i for i, local_id in enumerate(found_ids)}
+        for row in members:
+            i = position.get(int(old_local_ids[row]))
+            if i is not None:
+                vectors[row] = node_vectors[i]
+                found[row] = True
+    unknown = np.flatnonzero(old_nodes >= len(source_dirs))
+    if unknown.size:
+        print(f"{unknown.size} DB rows point at nodes beyond the {len(source_dirs)} directories given.")
+    if not found.all():
+        print(f"{int((~found).sum())} DB rows have no stored vector and stay unsearchable "
+              f"(run --rebuild reembed on the current layout first to recover them).")
+
+    # New ids: each target node numbers its rows 0..n-1 in old id order
+    targets = event_nodes(event_ids, num_nodes)
+    new_ids = np.zeros(len(rows), dtype=np.int64)
+    for node in range(num_nodes):
+        members = np.flatnonzero(targets == node)
+        new_ids[members] = to_global_ids(np.arange(members.size), node)
+
+    try:
+        # faiss_id is unique: move every row out of the way first so no new id collides with an old one
+        db.query(PersonEmbedding).update({PersonEmbedding.faiss_id: -PersonEmbedding.faiss_id - 1}, synchronize_session=False)
+        db.bulk_update_mappings(PersonEmbedding, [
+            {"id": int(embedding_id), "faiss_id": int(new_id)} for embedding_id, new_id in zip(embedding_ids, new_ids)
+        ])
+        db.flush()
+        for node, data_dir in enumerate(target_dirs):
+            members = np.flatnonzero(targets == node)
+            faiss_utils.open_data_dir(data_dir)
+            os.makedirs(data_dir, exist_ok=True)
+            if not members.size:
+                continue # The node starts with an empty index
+            metadata = load_vector_metadata(db, id_range=node_id_range(node))
+            if len(metadata) < members.size:
+                # Trailing rows without a photo; tombstoned below
+                metadata.set_rows(np.arange(len(metadata), members.size), photo_id=np.full(members.size - len(metadata), -1))
+            dead = ~found[members] | (metadata.column("photo_id")[:members.size] < 0)
+            metadata.delete(np.flatnonzero(dead))
+            if not faiss_utils.rebuild_faiss_index(vectors[members], metadata, index_type):
+                raise RuntimeError(f"could not build the index of node {node}")
+            print(f"Node {node}: {members.size} vectors ({int(dead.sum())} tombstoned) in {data_dir}")
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Reshard failed, person_embeddings is unchanged: {e}")
+        return False
+    print(f"Resharded {len(rows)} vectors over {num_nodes} nodes. Set FAISS_SERVICE_NODES to {num_nodes} "
+          f"addresses and start node i with --node i --data-dir {os.path.join(out_dir, 'node<i>')}.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check person_embeddings against the FAISS index and optionally rebuild it.")
+    parser.add_argument("--data-dir", default=faiss_utils.FAISS_DATA_DIR, help="Directory holding the index files")
+    parser.add_argument("--node", type=int, default=0, help="Index node to check when the index is sharded")
+    parser.add_argument("--tombstone-orphans", action="store_true", help="Hide live vectors that have no DB row")
+    parser.add_argument("--rebuild", choices=["raw", "reembed"],
+                        help="Rebuild from stored raw vectors, or re-embed every person crop with CLIP")
+    parser.add_argument("--reembed-missing", action="store_true", help="With --rebuild raw, re-embed rows whose vector is lost")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--type", default=faiss_utils.FAISS_INDEX_TYPE, choices=sorted(faiss_utils.FAISS_INDEX_FACTORY_STRINGS))
+    parser.add_argument("--reshard", type=int, metavar="N", help="Split the index over N nodes by event_id % N")
+    parser.add_argument("--node-dirs", help="With --reshard, comma-separated data directories of the current nodes "
+                                            "in node order (default: --data-dir)")
+    parser.add_argument("--out-dir", help="With --reshard, directory to write node0..node<N-1> into")
+    args = parser.parse_args()
+
+    # Work on the index files directly; stop the index service for this node before repairing
+    faiss_utils.FAISS_SERVICE_SOCKET = None
+    faiss_utils.FAISS_SERVICE_NODES = None
+    faiss_utils.FAISS_DATA_DIR = args.data_dir
+    faiss_utils.FAISS_INDEX_PATH = os.path.join(args.data_dir, faiss_utils.FAISS_INDEX_FILENAME)
+
+    db = SessionLocal()
+    try:
+        if args.reshard:
+            if args.reshard < 1 or not args.out_dir:
+                parser.error("--reshard needs N >= 1 and --out-dir")
+            source_dirs = args.node_dirs.split(",") if args.node_dirs else [args.data_dir]
+            sys.exit(0 if reshard(db, source_dirs, args.out_dir, args.reshard, args.type) else 1)
+
+        metadata = faiss_utils.load_saved_vector_metadata()
+        if metadata is None:
+            metadata = load_vector_metadata(db, id_range=node_id_range(args.node))
+        faiss_utils.set_vector_metadata(metadata)
+
+        report = check_index(db, args.node)
+        problems = print_report(report, args.node)
+
+        if args.tombstone_orphans and report["orphans"].size:
+            faiss_utils.delete_vectors(report["orphans"])
+            faiss_utils.save_vector_metadata()
+            print(f"Tombstoned {report['orphans'].size} orphan vectors.")
+        if args.rebuild:
+            rebuild(db, args.node, report, args.rebuild, args.workers, args.type, args.reembed_missing)
+        sys.exit(1 if problems and not args.rebuild else 0)
+    finally:
+        db.close()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.utils.identity_clusters import (
+    assign_pending, merge_all_events, run_clustering,
+    IDENTITY_CLUSTER_BATCH, IDENTITY_CLUSTER_INTERVAL_SECONDS, IDENTITY_MERGE_INTERVAL_SECONDS,
+)
+
+
+def cluster_once(batch_size=IDENTITY_CLUSTER_BATCH, merge=True):
+    """Clusters every detection that has no cluster yet, then optionally merges clusters."""
+    db = SessionLocal()
+    try:
+        skip, total = set(), 0
+        while True:
+            seen = assign_pending(db, batch_size, skip)
+            total += seen
+            if seen < batch_size:
+                break
+            print(f"Clustered {total} detections so far")
+        print(f"Done: {total} detections processed.")
+        if merge:
+            print(f"Merged {merge_all_events(db)} clusters.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group person detections into per-event identity clusters.")
+    parser.add_argument("--batch-size", type=int, default=IDENTITY_CLUSTER_BATCH, help="Detections per transaction")
+    parser.add_argument("--no-merge", action="store_true", help="Skip the cluster merge pass")
+    parser.add_argument("--loop", action="store_true", help="Keep running, like the API's background thread")
+    args = parser.parse_args()
+    if args.loop:
+        run_clustering(SessionLocal, interval=IDENTITY_CLUSTER_INTERVAL_SECONDS, merge_interval=IDENTITY_MERGE_INTERVAL_SECONDS)
+    else:
+        cluster_once(args.batch_size, merge=not args.no_merge)
@@ -0,0 +1,56 @@
+"""
+Fixtures shared by the DB-backed tests: a scratch SQLite database with one photographer
+and two events, and a helper that indexes a person detection in its SQL vector store.
+"""
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401 (registers every table on Base.metadata)
+import app.models.vector  # noqa: F401 (person_vectors for the SQL vector store)
+from app.database import Base
+from app.models.embedding import PersonEmbedding
+from app.models.event import Event
+from app.models.photo import Photo
+from app.models.user import User
+from app.utils.vector_store import SqlVectorStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    Session on a fresh database holding user 1 and events 1 and 2. `db.store` is a
+    SqlVectorStore on the same database; modules under test are pointed at it per file.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id=1, username="photographer", email="p@example.com"))
+    session.add_all([Event(id=1, name="Marathon", slug="marathon"), Event(id=2, name="10K", slug="10k")])
+    session.commit()
+    session.store = SqlVectorStore(sessionmaker(bind=engine))
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def add_detection(db, photo_id, base, rng, noise=0.2, event_id=1, is_public=True, bbox=(0.5, 0.5, 0.3, 0.6)):
+    """
+    Adds a person detection to a photo (created if it doesn't exist yet): a vector near
+    `base` in db.store and its PersonEmbedding row, flushed but not committed.
+    """
+    if db.get(Photo, photo_id) is None:
+        db.add(Photo(id=photo_id, event_id=event_id, photographer_id=1, is_public=is_public))
+    vector = (base + noise * rng.standard_normal(base.shape[-1])).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    ok, (faiss_id,) = db.store.add(vector[None], metadata={
+        "photo_id": [photo_id], "event_id": [event_id], "photographer_id": [1], "is_public": [is_public],
+    }, db=db)
+    x, y, w, h = bbox
+    detection = PersonEmbedding(photo_id=photo_id, event_id=event_id, faiss_id=faiss_id,
+                                bbox_x=x, bbox_y=y, bbox_w=w, bbox_h=h)
+    db.add(detection)
+    db.flush()
+    return detection
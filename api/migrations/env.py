@@ -10,6 +10,10 @@ from app.database import Base
 from app.models.user import User
 from app.models.event import Event
 from app.models.photo import Photo
+from app.models.vector import PersonVector, InactiveVectorEvent, PersonVectorIdCounter
+from app.models.photo_bib import PhotoBib
+from app.models.identity_cluster import IdentityCluster
+from app.models.saved_search import SavedSearch, SavedSearchMatch
 # Add imports for any other models here
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,62 @@
+"""create saved searches
+
+Revision ID: a9c4e2f7d3b8
+Revises: f3a8d1c5b9e2
+Create Date: 2026-10-19 19:06:31.218447
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e2f7d3b8'
+down_revision = 'f3a8d1c5b9e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('saved_searches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('clerk_user_id', sa.String(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=False),
+        sa.Column('bib', sa.String(), nullable=True),
+        sa.Column('query_vector', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_saved_searches_id'), 'saved_searches', ['id'], unique=False)
+    op.create_index(op.f('ix_saved_searches_clerk_user_id'), 'saved_searches', ['clerk_user_id'], unique=False)
+    op.create_index(op.f('ix_saved_searches_event_id'), 'saved_searches', ['event_id'], unique=False)
+    op.create_table('saved_search_matches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('saved_search_id', sa.Integer(), nullable=False),
+        sa.Column('clerk_user_id', sa.String(), nullable=False),
+        sa.Column('photo_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('match_type', sa.String(), nullable=False),
+        sa.Column('seen', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.ForeignKeyConstraint(['photo_id'], ['photos.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['saved_search_id'], ['saved_searches.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('saved_search_id', 'photo_id', name='uq_saved_search_matches_search_photo')
+    )
+    op.create_index(op.f('ix_saved_search_matches_id'), 'saved_search_matches', ['id'], unique=False)
+    op.create_index('ix_saved_search_matches_user_id', 'saved_search_matches', ['clerk_user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_saved_search_matches_user_id', table_name='saved_search_matches')
+    op.drop_index(op.f('ix_saved_search_matches_id'), table_name='saved_search_matches')
+    op.drop_table('saved_search_matches')
+    op.drop_index(op.f('ix_saved_searches_event_id'), table_name='saved_searches')
+    op.drop_index(op.f('ix_saved_searches_clerk_user_id'), table_name='saved_searches')
+    op.drop_index(op.f('ix_saved_searches_id'), table_name='saved_searches')
+    op.drop_table('saved_searches')
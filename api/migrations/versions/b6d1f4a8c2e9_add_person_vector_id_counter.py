@@ -0,0 +1,37 @@
+"""add person_vector_ids counter
+
+Revision ID: b6d1f4a8c2e9
+Revises: a9c4e2f7d3b8
+Create Date: 2026-10-19 18:40:12.304518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f4a8c2e9'
+down_revision = 'a9c4e2f7d3b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('person_vector_ids',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('next_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Continue after the vectors already stored
+    op.execute(
+        "INSERT INTO person_vector_ids (id, next_id) "
+        "SELECT 1, COALESCE(MAX(faiss_id) + 1, 0) FROM person_vectors"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('person_vector_ids')
@@ -0,0 +1,31 @@
+"""widen person_embeddings.faiss_id to bigint
+
+Revision ID: b81d2c6e4f93
+Revises: 7f22f8c883e7
+Create Date: 2026-10-19 10:12:04.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81d2c6e4f93'
+down_revision = '7f22f8c883e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Sharded index ids carry the node number in the high bits (see app/utils/index_router.py)
+    with op.batch_alter_table('person_embeddings', schema=None) as batch_op:
+        batch_op.alter_column('faiss_id', existing_type=sa.Integer(), type_=sa.BigInteger(), existing_nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('person_embeddings', schema=None) as batch_op:
+        batch_op.alter_column('faiss_id', existing_type=sa.BigInteger(), type_=sa.Integer(), existing_nullable=False)
@@ -0,0 +1,51 @@
+"""create person_vectors tables
+
+Revision ID: c4e9a7d1f2b6
+Revises: b81d2c6e4f93
+Create Date: 2026-10-19 14:02:51.730114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e9a7d1f2b6'
+down_revision = 'b81d2c6e4f93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('person_vectors',
+        sa.Column('faiss_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('embedding', sa.LargeBinary(), nullable=False),
+        sa.Column('photo_id', sa.Integer(), nullable=True),
+        sa.Column('event_id', sa.Integer(), nullable=True),
+        sa.Column('photographer_id', sa.Integer(), nullable=True),
+        sa.Column('is_public', sa.Boolean(), nullable=False),
+        sa.Column('timestamp', sa.BigInteger(), nullable=True),
+        sa.Column('bbox_x', sa.Float(), nullable=True),
+        sa.Column('bbox_y', sa.Float(), nullable=True),
+        sa.Column('bbox_w', sa.Float(), nullable=True),
+        sa.Column('bbox_h', sa.Float(), nullable=True),
+        sa.Column('deleted', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('faiss_id')
+    )
+    op.create_index(op.f('ix_person_vectors_photo_id'), 'person_vectors', ['photo_id'], unique=False)
+    op.create_index('ix_person_vectors_event_id_deleted', 'person_vectors', ['event_id', 'deleted'], unique=False)
+    op.create_table('person_vector_inactive_events',
+        sa.Column('event_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.PrimaryKeyConstraint('event_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('person_vector_inactive_events')
+    op.drop_index('ix_person_vectors_event_id_deleted', table_name='person_vectors')
+    op.drop_index(op.f('ix_person_vectors_photo_id'), table_name='person_vectors')
+    op.drop_table('person_vectors')
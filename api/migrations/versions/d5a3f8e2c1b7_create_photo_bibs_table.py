@@ -0,0 +1,38 @@
+"""create photo_bibs table
+
+Revision ID: d5a3f8e2c1b7
+Revises: c4e9a7d1f2b6
+Create Date: 2026-10-19 15:21:07.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a3f8e2c1b7'
+down_revision = 'c4e9a7d1f2b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing photos are filled in by backfill_photo_bibs.py, which can run while the API serves
+    op.create_table('photo_bibs',
+        sa.Column('photo_id', sa.Integer(), nullable=False),
+        sa.Column('bib', sa.String(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+        sa.ForeignKeyConstraint(['photo_id'], ['photos.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('photo_id', 'bib')
+    )
+    op.create_index('ix_photo_bibs_bib_event_id', 'photo_bibs', ['bib', 'event_id', 'photo_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_photo_bibs_bib_event_id', table_name='photo_bibs')
+    op.drop_table('photo_bibs')
@@ -0,0 +1,28 @@
+"""add photos event listing index
+
+Revision ID: e7b2c9d4a6f1
+Revises: d5a3f8e2c1b7
+Create Date: 2026-10-19 17:02:44.913520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2c9d4a6f1'
+down_revision = 'd5a3f8e2c1b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_photos_event_id_is_public_timestamp_id', 'photos', ['event_id', 'is_public', 'timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_photos_event_id_is_public_timestamp_id', table_name='photos')
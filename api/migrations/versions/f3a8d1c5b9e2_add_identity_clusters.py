@@ -0,0 +1,50 @@
+"""add identity clusters
+
+Revision ID: f3a8d1c5b9e2
+Revises: e7b2c9d4a6f1
+Create Date: 2026-10-19 17:48:12.530184
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d1c5b9e2'
+down_revision = 'e7b2c9d4a6f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('identity_clusters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.Integer(), nullable=True),
+        sa.Column('vector_sum', sa.LargeBinary(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_identity_clusters_id'), 'identity_clusters', ['id'], unique=False)
+    op.create_index(op.f('ix_identity_clusters_event_id'), 'identity_clusters', ['event_id'], unique=False)
+    # Existing detections have no cluster yet; the background clusterer picks them up
+    with op.batch_alter_table('person_embeddings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cluster_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_person_embeddings_cluster_id'), ['cluster_id'], unique=False)
+        batch_op.create_foreign_key('fk_person_embeddings_cluster_id', 'identity_clusters', ['cluster_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('person_embeddings', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_person_embeddings_cluster_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_person_embeddings_cluster_id'))
+        batch_op.drop_column('cluster_id')
+    op.drop_index(op.f('ix_identity_clusters_event_id'), table_name='identity_clusters')
+    op.drop_index(op.f('ix_identity_clusters_id'), table_name='identity_clusters')
+    op.drop_table('identity_clusters')
@@ -0,0 +1,196 @@
+import threading
+
+import faiss
+import numpy as np
+import pytest
+
+from app.utils import faiss_utils
+
+
+@pytest.fixture
+def fresh_index(tmp_path, monkeypatch):
+    """Point faiss_utils at a throwaway directory and start from an empty index."""
+    monkeypatch.setattr(faiss_utils, "FAISS_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(faiss_utils, "FAISS_INDEX_PATH", str(tmp_path / faiss_utils.FAISS_INDEX_FILENAME))
+    monkeypatch.setattr(faiss_utils, "_faiss_index", None)
+    monkeypatch.setattr(faiss_utils, "_raw_vector_store", None)
+    monkeypatch.setattr(faiss_utils, "_vector_metadata", faiss_utils.VectorMetadata())
+    yield
+    faiss_utils._faiss_index = None
+    faiss_utils._raw_vector_store = None
+
+
+def _random_vectors(n, seed):
+    vectors = np.random.default_rng(seed).random((n, faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _run_concurrently(targets):
+    """Start every (callable, args) pair at the same instant and collect any exceptions."""
+    errors = []
+    barrier = threading.Barrier(len(targets))
+
+    def wrap(fn, args):
+        try:
+            barrier.wait()
+            fn(*args)
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=wrap, args=(fn, args)) for fn, args in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=120)
+    return errors
+
+
+def _search_self(seed_vectors, worker_id, searches):
+    for i in range(searches):
+        expected = (worker_id * searches + i) % len(seed_vectors)
+        result = faiss_utils.search_faiss_index(seed_vectors[expected], k=5)
+        assert result is not None, "search failed"
+        _, indices = result
+        # Seed vectors are never removed, so a query must always find itself first
+        assert indices[0][0] == expected, f"expected {expected}, got {indices[0][0]}"
+
+
+def test_concurrent_search_and_add(fresh_index):
+    seed_vectors = _random_vectors(200, seed=0)
+    ok, _ = faiss_utils.add_embeddings_to_index(seed_vectors)
+    assert ok
+
+    num_writers, batches_per_writer, batch_size = 4, 25, 8
+    assigned_ids = []
+    ids_lock = threading.Lock()
+
+    def writer(worker_id):
+        for batch in range(batches_per_writer):
+            ok, ids = faiss_utils.add_embeddings_to_index(_random_vectors(batch_size, seed=10_000 + 1000 * worker_id + batch))
+            assert ok, "add failed"
+            with ids_lock:
+                assigned_ids.extend(ids)
+
+    targets = [(writer, (i,)) for i in range(num_writers)]
+    targets += [(_search_self, (seed_vectors, i, 100)) for i in range(8)]
+    errors = _run_concurrently(targets)
+
+    assert not errors, errors
+    expected_added = num_writers * batches_per_writer * batch_size
+    # Every add got its own, non-overlapping id range
+    assert sorted(assigned_ids) == list(range(len(seed_vectors), len(seed_vectors) + expected_added))
+    assert faiss_utils.get_index_size() == len(seed_vectors) + expected_added
+
+
+def test_reload_swaps_under_running_searches(fresh_index):
+    seed_vectors = _random_vectors(500, seed=1)
+    ok, _ = faiss_utils.add_embeddings_to_index(seed_vectors)
+    assert ok
+    assert faiss_utils.save_faiss_index()
+    original = faiss_utils.get_faiss_index()
+
+    def reloader():
+        for _ in range(20):
+            assert faiss_utils.save_faiss_index()
+            assert faiss_utils.get_faiss_index(force_reload=True) is not None
+
+    targets = [(reloader, ())]
+    targets += [(_search_self, (seed_vectors, i, 100)) for i in range(8)]
+    errors = _run_concurrently(targets)
+
+    assert not errors, errors
+    reloaded = faiss_utils.get_faiss_index()
+    assert reloaded is not original
+    assert faiss_utils.get_index_size() == len(seed_vectors)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8"])
+def test_compaction_folds_delta_and_tombstones(fresh_index, monkeypatch, index_type):
+    monkeypatch.setattr(faiss_utils, "FAISS_INDEX_TYPE", index_type)
+    monkeypatch.setattr(faiss_utils, "FAISS_DELTA_MAX_VECTORS", 10**9) # compact only when asked
+    monkeypatch.setattr(faiss_utils, "FAISS_COMPACT_DELETED_RATIO", 1.0)
+    vectors = _random_vectors(600, seed=2)
+    assert faiss_utils.add_embeddings_to_index(vectors[:500])[0]
+    assert faiss_utils.compact_index()
+    faiss_utils.delete_vectors(range(0, 500, 10))
+    assert faiss_utils.add_embeddings_to_index(vectors[500:])[0] # lands in the delta
+
+    def check_self_search():
+        _, indices = faiss_utils.search_faiss_index(vectors, k=1)
+        expected = np.arange(600)
+        live = expected % 10 != 0
+        live[500:] = True
+        assert (indices[live, 0] == expected[live]).all()
+        assert not np.isin(indices[~live, 0], expected[~live]).any()
+
+    check_self_search()
+    stats = faiss_utils.get_index_stats()
+    assert (stats["base_vectors"], stats["delta_vectors"]) == (500, 100)
+
+    assert faiss_utils.compact_index()
+    stats = faiss_utils.get_index_stats()
+    assert (stats["ntotal"], stats["base_vectors"], stats["delta_vectors"]) == (600, 550, 0)
+    check_self_search()
+
+    # The compacted base and the delta survive a reload from disk
+    assert faiss_utils.add_embeddings_to_index(_random_vectors(5, seed=3))[0]
+    assert faiss_utils.save_faiss_index()
+    faiss_utils.get_faiss_index(force_reload=True)
+    assert faiss_utils.get_index_size() == 605
+    vectors = np.vstack([vectors, _random_vectors(5, seed=3)])
+    _, indices = faiss_utils.search_faiss_index(vectors[600:], k=1)
+    assert (indices[:, 0] == np.arange(600, 605)).all()
+
+
+def test_codec_rebuild_keeps_metadata_and_drops_tombstones(fresh_index):
+    import build_faiss_index
+
+    vectors = _random_vectors(300, seed=5)
+    metadata = {"photo_id": np.arange(300) // 3, "event_id": np.ones(300, dtype=np.int64)}
+    assert faiss_utils.add_embeddings_to_index(vectors, metadata)[0]
+    faiss_utils.delete_vectors([5, 298, 299])
+    assert faiss_utils.save_faiss_index()
+    faiss_utils.get_faiss_index(force_reload=True)
+
+    build_faiss_index.build_index("sq8", [], dry_run=False, k=5, node=0)
+    stats = faiss_utils.get_index_stats()
+    assert (stats["ntotal"], stats["base_vectors"]) == (300, 297)
+
+    faiss_utils.get_faiss_index(force_reload=True)
+    saved = faiss_utils.load_saved_vector_metadata()
+    assert saved is not None and len(saved) == 300
+    assert (saved.column("photo_id") == np.arange(300) // 3).all()
+    assert set(np.flatnonzero(saved.column("deleted"))) == {5, 298, 299}
+    _, indices = faiss_utils.search_faiss_index(vectors, k=1)
+    live = ~np.isin(np.arange(300), [5, 298, 299])
+    assert (indices[live, 0] == np.arange(300)[live]).all()
+    assert not np.isin(indices[~live, 0], [5, 298, 299]).any()
+
+
+def test_concurrent_searches_are_coalesced(fresh_index, monkeypatch):
+    vectors = _random_vectors(1000, seed=4)
+    assert faiss_utils.add_embeddings_to_index(vectors)[0]
+    batcher = faiss_utils.SearchBatcher(faiss_utils.search_faiss_index, window=0.005, max_queries=256)
+    monkeypatch.setattr(faiss_utils, "_search_batcher", batcher)
+
+    def searcher(worker_id):
+        for i in range(20):
+            expected = worker_id * 20 + i
+            k = 1 + expected % 7
+            distances, indices = faiss_utils.search_batched(vectors[expected], k=k)
+            assert indices.shape == (1, k) and distances.shape == (1, k)
+            assert indices[0][0] == expected
+
+    errors = _run_concurrently([(searcher, (i,)) for i in range(16)])
+    assert not errors, errors
+    assert batcher.queries == 16 * 20
+    assert batcher.calls < batcher.queries
+
+
+def test_multi_query_with_per_query_k(fresh_index):
+    vectors = _random_vectors(300, seed=5)
+    assert faiss_utils.add_embeddings_to_index(vectors)[0]
+    results = faiss_utils.search_faiss_index_multi(vectors[[3, 30, 300 - 1]], ks=[1, 5, 10])
+    assert [len(indices) for _, indices in results] == [1, 5, 10]
+    assert [indices[0] for _, indices in results] == [3, 30, 299]
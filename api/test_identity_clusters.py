@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from app.models.embedding import PersonEmbedding
+from app.models.event import Event
+from app.models.identity_cluster import IdentityCluster
+from app.models.photo import Photo
+from app.utils import identity_clusters
+from conftest import add_detection
+
+
+@pytest.fixture(autouse=True)
+def _use_test_store(db, monkeypatch):
+    monkeypatch.setattr(identity_clusters, "get_vector_store", lambda: db.store)
+    identity_clusters._centroids.pop(1)
+
+
+rng = np.random.default_rng(0)
+RUNNER, BYSTANDER = rng.standard_normal((2, 512)).astype(np.float32)
+
+
+def _detect(db, photo_id, base, event_id=1):
+    return add_detection(db, photo_id, base, rng, event_id=event_id)
+
+
+def _clusters_by_photo(db):
+    return {
+        (row.photo_id, row.cluster_id)
+        for row in db.query(PersonEmbedding.photo_id, PersonEmbedding.cluster_id)
+    }
+
+
+def test_assigns_detections_to_per_event_identities(db):
+    runner = [_detect(db, 1, RUNNER), _detect(db, 2, RUNNER), _detect(db, 3, RUNNER)]
+    bystander = [_detect(db, 1, BYSTANDER), _detect(db, 3, BYSTANDER)]
+    other_event = _detect(db, 4, RUNNER, event_id=2)
+    db.commit()
+
+    assert identity_clusters.assign_pending(db) == 6
+    assert len({d.cluster_id for d in runner}) == 1
+    assert len({d.cluster_id for d in bystander}) == 1
+    assert runner[0].cluster_id != bystander[0].cluster_id
+    # Clusters never span events
+    assert other_event.cluster_id not in {runner[0].cluster_id, bystander[0].cluster_id}
+    assert db.get(IdentityCluster, runner[0].cluster_id).size == 3
+
+    assert identity_clusters.cluster_photo_ids(db, runner[0].cluster_id, exclude_photo_ids=[1]) == [2, 3]
+    query = (RUNNER / np.linalg.norm(RUNNER)).astype(np.float32)
+    cluster_id, similarity = identity_clusters.resolve_cluster(db, 1, query)
+    assert cluster_id == runner[0].cluster_id and similarity > 0.9
+
+    # Later detections join the existing cluster
+    late = _detect(db, 5, BYSTANDER)
+    db.commit()
+    assert identity_clusters.assign_pending(db) == 1
+    assert late.cluster_id == bystander[0].cluster_id
+
+
+def test_detections_committed_out_of_order_are_still_clustered(db):
+    later = _detect(db, 2, RUNNER)
+    later.id = 10
+    db.commit()
+    assert identity_clusters.assign_pending(db) == 1
+    # A detection with a lower id commits after id 10 was clustered
+    earlier = _detect(db, 1, RUNNER)
+    earlier.id = 5
+    db.commit()
+    assert identity_clusters.assign_pending(db) == 1
+    assert earlier.cluster_id == later.cluster_id
+
+    gone = _detect(db, 3, BYSTANDER)
+    db.commit()
+    db.store.delete([gone.faiss_id])
+    skip = set()
+    assert identity_clusters.assign_pending(db, skip=skip) == 1
+    assert skip == {gone.id} and identity_clusters.assign_pending(db, skip=skip) == 0
+
+
+def test_released_detections_leave_their_cluster(db):
+    runner = [_detect(db, photo_id, RUNNER) for photo_id in (1, 2, 3)]
+    db.commit()
+    identity_clusters.assign_pending(db)
+    cluster = db.get(IdentityCluster, runner[0].cluster_id)
+    vectors = db.store.get_vectors([d.faiss_id for d in runner])[1]
+
+    identity_clusters.release_detections(db, [1])
+    db.commit()
+    db.refresh(cluster)
+    assert cluster.size == 2 and runner[0].cluster_id is None
+    np.testing.assert_allclose(np.frombuffer(cluster.vector_sum, dtype=np.float32), vectors[1:].sum(axis=0), atol=1e-5)
+
+    identity_clusters.release_detections(db, [2, 3])
+    db.commit()
+    assert db.query(IdentityCluster).count() == 0
+
+
+def test_cluster_photos_skip_hidden_photos_and_inactive_events(db):
+    runner = [_detect(db, 1, RUNNER), _detect(db, 2, RUNNER), _detect(db, 3, RUNNER)]
+    db.commit()
+    identity_clusters.assign_pending(db)
+    db.get(Photo, 2).is_public = False
+    db.commit()
+    assert identity_clusters.cluster_photo_ids(db, runner[0].cluster_id) == [1, 3]
+    db.get(Event, 1).is_active = False
+    db.commit()
+    assert identity_clusters.cluster_photo_ids(db, runner[0].cluster_id) == []
+
+
+def test_merge_joins_split_identities_but_not_people_in_the_same_photo(db, monkeypatch):
+    _detect(db, 1, RUNNER)
+    _detect(db, 1, BYSTANDER)
+    _detect(db, 2, RUNNER)
+    _detect(db, 3, RUNNER)
+    _detect(db, 3, BYSTANDER)
+    db.commit()
+    # Too strict to join anything: every detection starts its own cluster
+    monkeypatch.setattr(identity_clusters, "IDENTITY_ASSIGN_THRESHOLD", 1.01)
+    identity_clusters.assign_pending(db)
+    assert db.query(IdentityCluster).count() == 5
+
+    assert identity_clusters.merge_event_clusters(db, 1) == 3
+    assert db.query(IdentityCluster).count() == 2
+    clusters = {}
+    for photo_id, cluster_id in _clusters_by_photo(db):
+        clusters.setdefault(cluster_id, set()).add(photo_id)
+    assert sorted(map(sorted, clusters.values())) == [[1, 2, 3], [1, 3]]
+    assert sorted(c.size for c in db.query(IdentityCluster)) == [2, 3]
+
+
+def test_cluster_ranking_keeps_unclustered_vector_hits(db):
+    from app.utils.vector_metadata import SearchFilter
+
+    runner = [_detect(db, 1, RUNNER), _detect(db, 2, RUNNER)]
+    db.commit()
+    identity_clusters.assign_pending(db)
+    _detect(db, 3, RUNNER) # Uploaded after the last clustering pass
+    db.commit()
+
+    query = (RUNNER / np.linalg.norm(RUNNER)).astype(np.float32)
+    cluster_id, similarity = identity_clusters.resolve_cluster(db, 1, query)
+    photo_ids, scores = db.store.aggregate_to_photos(*db.store.search(query[None], 10, search_filter=SearchFilter.for_event(1)))
+    ranked_ids, ranked_scores, match_types = identity_clusters.merge_cluster_ranking(db, cluster_id, similarity, photo_ids, scores)
+
+    assert sorted(ranked_ids.tolist()) == [1, 2, 3]
+    by_photo = dict(zip(ranked_ids.tolist(), match_types))
+    assert by_photo[1] == by_photo[2] == "identity" and by_photo[3] is None
+    assert (np.diff(ranked_scores) <= 0).all()
+    assert runner[0].cluster_id == cluster_id
+
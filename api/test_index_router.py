@@ -0,0 +1,251 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from app.utils import faiss_utils
+from app.utils.index_router import split_global_ids
+from app.utils.vector_metadata import SearchFilter
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+NUM_NODES = 3
+
+
+def _random_vectors(n, seed):
+    vectors = np.random.default_rng(seed).random((n, faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _wait_for_node(client, process, deadline=60):
+    start = time.time()
+    while time.time() - start < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Index node exited with code {process.returncode}")
+        try:
+            if client.call("ping") == "pong":
+                return
+        except (OSError, EOFError):
+            time.sleep(0.2)
+    raise RuntimeError("Index node did not start in time")
+
+
+@pytest.fixture
+def index_nodes(tmp_path, monkeypatch):
+    """Start NUM_NODES index service processes, each with its own empty index."""
+    processes, sockets = [], []
+    for node in range(NUM_NODES):
+        data_dir = tmp_path / f"node{node}"
+        data_dir.mkdir()
+        socket_path = str(tmp_path / f"node{node}.sock")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "app.utils.index_service", "--socket", socket_path, "--data-dir", str(data_dir)],
+            cwd=API_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        sockets.append(socket_path)
+
+    monkeypatch.setattr(faiss_utils, "FAISS_SERVICE_SOCKET", None)
+    monkeypatch.setattr(faiss_utils, "FAISS_SERVICE_NODES", ",".join(sockets))
+    monkeypatch.setattr(faiss_utils, "FAISS_SERVICE_TIMEOUT", 1.0)
+    router = faiss_utils.get_index_router()
+    try:
+        for client, process in zip(router.nodes, processes):
+            _wait_for_node(client, process)
+        yield processes
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                os.kill(process.pid, signal.SIGCONT)
+                process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+        faiss_utils._index_router = None
+        faiss_utils._index_router_config = None
+
+
+def _add_events(vectors, event_ids):
+    metadata = {
+        "photo_id": np.arange(len(vectors)),
+        "event_id": event_ids,
+        "photographer_id": np.zeros(len(vectors), dtype=np.int64),
+        "is_public": np.ones(len(vectors), dtype=bool),
+    }
+    ok, faiss_ids = faiss_utils.add_embeddings_to_index(vectors, metadata=metadata)
+    assert ok
+    return np.asarray(faiss_ids)
+
+
+def test_adds_are_routed_by_event(index_nodes):
+    vectors = _random_vectors(90, seed=1)
+    event_ids = np.arange(90) % 6
+    faiss_ids = _add_events(vectors, event_ids)
+
+    nodes, _ = split_global_ids(faiss_ids)
+    assert (nodes == event_ids % NUM_NODES).all()
+    assert len(set(faiss_ids.tolist())) == 90
+    stats = faiss_utils.get_index_stats()
+    assert stats["nodes_up"] == NUM_NODES and stats["ntotal"] == 90
+
+    found_ids, found = faiss_utils.get_vectors(faiss_ids[[5, 0, 40]])
+    assert found_ids.tolist() == faiss_ids[[5, 0, 40]].tolist()
+    np.testing.assert_allclose(found, vectors[[5, 0, 40]], rtol=1e-6)
+
+
+def test_scatter_gather_matches_single_index(index_nodes):
+    vectors = _random_vectors(300, seed=2)
+    faiss_ids = _add_events(vectors, np.arange(300) % 7)
+    queries = _random_vectors(5, seed=3)
+
+    distances, indices = faiss_utils.search_faiss_index(queries, k=10, search_filter=SearchFilter())
+
+    # Reference: exact search over every vector in one flat index
+    reference = faiss.IndexFlatIP(faiss_utils.EMBEDDING_DIM)
+    reference.add(vectors)
+    ref_distances, ref_positions = reference.search(queries, 10)
+    np.testing.assert_array_equal(indices, faiss_ids[ref_positions])
+    np.testing.assert_allclose(distances, ref_distances, rtol=1e-5)
+
+
+def test_multi_search_with_per_query_k(index_nodes):
+    vectors = _random_vectors(90, seed=5)
+    faiss_ids = _add_events(vectors, np.arange(90) % 5)
+    results = faiss_utils.search_faiss_index_multi(vectors[[3, 31, 89]], ks=[1, 4, 7], search_filter=SearchFilter())
+    assert [len(indices) for _, indices in results] == [1, 4, 7]
+    assert [indices[0] for _, indices in results] == faiss_ids[[3, 31, 89]].tolist()
+
+
+def test_event_filter_only_returns_that_event(index_nodes):
+    vectors = _random_vectors(120, seed=4)
+    event_ids = np.arange(120) % 4
+    faiss_ids = _add_events(vectors, event_ids)
+
+    _, indices = faiss_utils.search_faiss_index(vectors[:3], k=20, search_filter=SearchFilter.for_event(2))
+    expected = set(faiss_ids[event_ids == 2].tolist())
+    assert set(indices[indices >= 0].tolist()) <= expected
+
+    photo_ids, _ = faiss_utils.aggregate_hits_to_photos(*faiss_utils.search_faiss_index(
+        vectors[:3], k=20, search_filter=SearchFilter.for_event(2)))
+    assert set(photo_ids.tolist()) <= set(np.flatnonzero(event_ids == 2).tolist())
+
+
+def test_moving_an_event_moves_vectors_to_its_node(index_nodes):
+    vectors = _random_vectors(6, seed=7)
+    faiss_ids = _add_events(vectors, np.zeros(6, dtype=np.int64))
+    # Photo 0's two people move from event 0 (node 0) to event 1 (node 1); photo 1's to event 3 (node 0)
+    new_ids = faiss_utils.move_vectors(faiss_ids[:4].tolist(), {
+        "photo_id": [0, 0, 1, 1], "event_id": [1, 1, 3, 3], "photographer_id": [0] * 4, "is_public": [True] * 4,
+    })
+    nodes, _ = split_global_ids(new_ids)
+    assert nodes.tolist() == [1, 1, 0, 0]
+    assert new_ids[2:] == faiss_ids[2:4].tolist() # same node: ids kept
+
+    _, indices = faiss_utils.search_faiss_index(vectors[:2], k=5, search_filter=SearchFilter.for_event(1))
+    assert set(indices[indices >= 0].tolist()) == set(new_ids[:2])
+    _, indices = faiss_utils.search_faiss_index(vectors[:2], k=10, search_filter=SearchFilter.for_event(0))
+    assert set(indices[indices >= 0].tolist()) == set(faiss_ids[4:].tolist())
+
+
+def test_dead_node_returns_partial_results(index_nodes):
+    vectors = _random_vectors(90, seed=5)
+    faiss_ids = _add_events(vectors, np.arange(90) % NUM_NODES)
+    index_nodes[1].kill()
+    index_nodes[1].wait()
+
+    result = faiss_utils.search_faiss_index(vectors[:2], k=10, search_filter=SearchFilter())
+    assert result is not None
+    nodes, _ = split_global_ids(result[1][result[1] >= 0])
+    assert set(nodes.tolist()) == {0, 2}
+    assert faiss_utils.get_index_stats()["nodes_up"] == NUM_NODES - 1
+
+
+def test_slow_node_times_out_with_partial_results(index_nodes):
+    vectors = _random_vectors(90, seed=6)
+    _add_events(vectors, np.arange(90) % NUM_NODES)
+    os.kill(index_nodes[2].pid, signal.SIGSTOP)
+    try:
+        start = time.time()
+        result = faiss_utils.search_faiss_index(vectors[:2], k=10, search_filter=SearchFilter())
+        elapsed = time.time() - start
+    finally:
+        os.kill(index_nodes[2].pid, signal.SIGCONT)
+
+    assert result is not None
+    assert elapsed < 1.0 + 0.5 # the shard timeout, not however long the node stalls
+    nodes, _ = split_global_ids(result[1][result[1] >= 0])
+    assert set(nodes.tolist()) == {0, 1}
+
+
+@pytest.fixture
+def single_node(db, tmp_path, monkeypatch):
+    """In-process index on tmp_path/old, and the test DB (events 1-4) to point into it."""
+    from app.models.event import Event
+    from app.utils.vector_metadata import VectorMetadata
+
+    for name in ("FAISS_SERVICE_SOCKET", "FAISS_SERVICE_NODES", "_faiss_index", "_delta_index", "_saved_base", "_raw_vector_store"):
+        monkeypatch.setattr(faiss_utils, name, None)
+    monkeypatch.setattr(faiss_utils, "_vector_metadata", VectorMetadata())
+    monkeypatch.setattr(faiss_utils, "_index_size", 0)
+    monkeypatch.setattr(faiss_utils, "FAISS_DATA_DIR", faiss_utils.FAISS_DATA_DIR)
+    monkeypatch.setattr(faiss_utils, "FAISS_INDEX_PATH", faiss_utils.FAISS_INDEX_PATH)
+    faiss_utils.open_data_dir(str(tmp_path / "old"))
+    db.add_all([Event(id=3, name="5K", slug="5k"), Event(id=4, name="Relay", slug="relay")])
+    db.commit()
+    yield db
+    faiss_utils.open_data_dir(faiss_utils.FAISS_DATA_DIR)
+
+
+def test_reshard_splits_an_existing_index_by_event(single_node, tmp_path):
+    from check_faiss_index import reshard
+    from app.models.embedding import PersonEmbedding
+    from app.models.photo import Photo
+    from app.utils import index_service
+
+    db = single_node
+    vectors = _random_vectors(40, seed=9)
+    event_ids = 1 + np.arange(40) % 4
+    for photo_id in range(40):
+        db.add(Photo(id=photo_id + 1, event_id=int(event_ids[photo_id]), photographer_id=1))
+    db.flush()
+    faiss_ids = _add_events_in_process(vectors, event_ids)
+    db.add_all(PersonEmbedding(id=i + 1, photo_id=i + 1, event_id=int(event_ids[i]), faiss_id=int(faiss_ids[i]),
+                               bbox_x=0.5, bbox_y=0.5, bbox_w=0.3, bbox_h=0.6)
+               for i in range(40))
+    db.commit()
+    assert faiss_utils.save_faiss_index()
+
+    # Sharding the old layout without a reshard is refused at startup
+    with pytest.raises(RuntimeError, match="--reshard 3"):
+        index_service.load_index(node=0, num_nodes=3)
+    faiss_utils.open_data_dir(str(tmp_path / "old"))
+
+    assert reshard(db, [str(tmp_path / "old")], str(tmp_path / "new"), 3, "flat")
+    rows = db.query(PersonEmbedding.id, PersonEmbedding.faiss_id).order_by(PersonEmbedding.id).all()
+    nodes, _ = split_global_ids([faiss_id for _, faiss_id in rows])
+    assert nodes.tolist() == (event_ids % 3).tolist()
+
+    for node in range(3):
+        faiss_utils.open_data_dir(str(tmp_path / "new" / f"node{node}"))
+        index_service.load_index(node=node, num_nodes=3) # Every vector is on its event's node
+        members = np.flatnonzero(nodes == node)
+        local_ids = np.asarray([rows[i][1] for i in members]) & ((1 << 40) - 1)
+        found_ids, found = faiss_utils.get_vectors(local_ids)
+        np.testing.assert_allclose(found, vectors[members], rtol=1e-6)
+        _, indices = faiss_utils.search_faiss_index(vectors[members[:1]], k=1, search_filter=SearchFilter.for_event(int(event_ids[members[0]])))
+        assert indices[0, 0] == local_ids[0]
+
+
+def _add_events_in_process(vectors, event_ids):
+    metadata = {
+        "photo_id": np.arange(len(vectors)) + 1,
+        "event_id": event_ids,
+        "photographer_id": np.ones(len(vectors), dtype=np.int64),
+        "is_public": np.ones(len(vectors), dtype=bool),
+    }
+    ok, faiss_ids = faiss_utils.add_embeddings_to_index(vectors, metadata=metadata)
+    assert ok
+    return np.asarray(faiss_ids)
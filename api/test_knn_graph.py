@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from app.utils import knn_graph
+from conftest import add_detection
+
+
+@pytest.fixture(autouse=True)
+def _use_test_store(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(knn_graph, "get_vector_store", lambda: db.store)
+    monkeypatch.setattr(knn_graph, "KNN_GRAPH_DIR", str(tmp_path / "graphs"))
+
+
+rng = np.random.default_rng(0)
+RUNNERS = rng.standard_normal((4, 512)).astype(np.float32)
+
+
+def _detect(db, photo_id, runner, event_id=1):
+    add_detection(db, photo_id, RUNNERS[runner], rng, event_id=event_id)
+
+
+def test_graph_build_and_incremental_update(db):
+    # Photos 1-8 show runner (photo_id % 4), photo 9 is in another event
+    for photo_id in range(1, 9):
+        _detect(db, photo_id, photo_id % 4)
+    _detect(db, 9, 1, event_id=2)
+    db.commit()
+
+    assert knn_graph.update_event_graph(db, 1, k=3) == 8
+    graph = knn_graph.get_event_graph(1)
+    assert len(graph) == 8 and graph.neighbors.dtype == np.int32
+    similar = graph.similar_photos(1, limit=10)
+    assert similar[0][0] == 5 and similar[0][1] > 0.9
+    assert 1 not in dict(similar) and 9 not in dict(similar)
+
+    # Nothing new: the graph file is left alone
+    assert knn_graph.update_event_graph(db, 1, k=3) == 0
+
+    _detect(db, 10, 1)
+    db.commit()
+    assert knn_graph.update_all_graphs(db, k=3) == 2 # event 1's new detection and event 2's first
+    graph = knn_graph.get_event_graph(1)
+    assert len(graph) == 9
+    # The new detection has neighbors, and was offered to its neighbors' lists
+    assert {photo_id for photo_id, _ in graph.similar_photos(10, limit=2)} == {1, 5}
+    assert 10 in dict(graph.similar_photos(1, limit=10))
+    assert 10 in dict(graph.similar_photos(5, limit=10))
+
+
+def test_missing_graph(db):
+    assert knn_graph.get_event_graph(1) is None
+    knn_graph.delete_event_graph(1)
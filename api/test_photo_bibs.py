@@ -0,0 +1,182 @@
+import numpy as np
+
+from app.models.photo import Photo
+from app.models.photo_bib import PhotoBib
+from app.crud.photo import parse_bib_numbers, sync_photo_bibs
+from app.utils import bib_expansion, combined_search
+from app.utils.bib_index import BibIndex
+from backfill_photo_bibs import backfill_batch
+from conftest import add_detection
+
+
+def _photo(db, photo_id, bibs, event_id=1):
+    photo = Photo(id=photo_id, event_id=event_id, photographer_id=1, bib_numbers=bibs)
+    db.add(photo)
+    db.flush()
+    return photo
+
+
+def _photo_ids_by_bib(db, bib, event_id=None):
+    query = db.query(PhotoBib.photo_id).filter(PhotoBib.bib == bib)
+    if event_id is not None:
+        query = query.filter(PhotoBib.event_id == event_id)
+    return [photo_id for (photo_id,) in query]
+
+
+def test_parse_bib_numbers():
+    assert parse_bib_numbers(None) == []
+    assert parse_bib_numbers(" 12, 1234,,12 ,7") == ["12", "1234", "7"]
+
+
+def test_exact_bib_lookup_does_not_match_substrings(db):
+    sync_photo_bibs(db, _photo(db, 1, "12"))
+    sync_photo_bibs(db, _photo(db, 2, "1234,99"))
+    sync_photo_bibs(db, _photo(db, 3, "512", event_id=2))
+    sync_photo_bibs(db, _photo(db, 4, "12", event_id=2))
+    db.commit()
+
+    assert sorted(_photo_ids_by_bib(db, "12")) == [1, 4]
+    assert _photo_ids_by_bib(db, "12", event_id=2) == [4]
+    assert _photo_ids_by_bib(db, "1234") == [2]
+
+
+def test_sync_follows_retags_and_event_moves(db):
+    photo = _photo(db, 1, "12,34")
+    sync_photo_bibs(db, photo)
+    db.commit()
+
+    photo.bib_numbers = "34"
+    photo.event_id = 2
+    sync_photo_bibs(db, photo)
+    db.commit()
+    assert _photo_ids_by_bib(db, "12") == []
+    assert _photo_ids_by_bib(db, "34", event_id=2) == [1]
+    assert db.query(PhotoBib).count() == 1
+
+
+def test_backfill_in_batches_is_idempotent(db):
+    for photo_id in range(1, 8):
+        _photo(db, photo_id, f"{photo_id},100" if photo_id % 2 else None)
+    db.commit()
+
+    for _ in range(2): # A second run rewrites the same rows
+        last_id, batches = 0, 0
+        while True:
+            last_id, _written = backfill_batch(db, last_id, batch_size=3)
+            if last_id is None:
+                break
+            batches += 1
+        assert batches == 3
+    assert sorted(_photo_ids_by_bib(db, "100")) == [1, 3, 5, 7]
+    assert db.query(PhotoBib).count() == 8
+
+
+def _tagged(db, photo_id, bibs, event_id=1, is_public=True):
+    photo = _photo(db, photo_id, bibs, event_id=event_id)
+    photo.is_public = is_public
+    sync_photo_bibs(db, photo)
+    return photo
+
+
+def test_bib_index_suggestions(db):
+    for photo_id, bibs in enumerate(["1234", "1234", "7234", "1235", "12345", "234", "88"], start=1):
+        _tagged(db, photo_id, bibs)
+    _tagged(db, 8, "1234", is_public=False)
+    _tagged(db, 9, "1234", event_id=2)
+    db.commit()
+
+    suggestions = BibIndex().suggest(db, 1, "1234")
+    assert [(s["bib"], s["match"]) for s in suggestions] == [
+        ("1234", "exact"), ("7234", "ocr"), ("12345", "prefix"), ("1235", "fuzzy"), ("234", "fuzzy"),
+    ]
+    assert suggestions[0]["photo_count"] == 2 # the hidden photo and the other event don't count
+
+    assert [s["bib"] for s in BibIndex().suggest(db, 1, "12", limit=3)] == ["1234", "12345", "1235"]
+    assert [(s["bib"], s["match"]) for s in BibIndex().suggest(db, 1, "08")] == [("88", "ocr")]
+
+
+def test_bib_index_incremental_updates(db):
+    _tagged(db, 1, "100")
+    _tagged(db, 2, "100,200")
+    db.commit()
+    index = BibIndex()
+    assert index.photos_for_bib(db, 1, "100") == {1, 2}
+    assert index.photos_for_bib(db, 2, "300") == set()
+
+    index.update_photo(3, 1, ["100"]) # ingest
+    index.update_photo(2, 1, ["200"]) # untag 100
+    index.update_photo(1, 2, ["300"]) # moved to event 2, which is already loaded
+    assert index.photos_for_bib(db, 1, "100") == {3}
+    assert index.photos_for_bib(db, 2, "300") == {1}
+    index.update_photo(3, 1, ["100"], is_public=False) # hidden
+    index.remove_photo(2)
+    assert index.photos_for_bib(db, 1, "100") == set()
+    assert index.suggest(db, 1, "200") == []
+
+
+def test_bib_index_reloads_other_workers_writes_after_ttl(db, monkeypatch):
+    _tagged(db, 1, "100")
+    _tagged(db, 2, "100")
+    db.commit()
+    index = BibIndex(ttl=60)
+    assert index.photos_for_bib(db, 1, "100") == {1, 2}
+
+    # Another worker retags photo 1 and hides photo 2; this worker only sees the DB change
+    photo = db.get(Photo, 1)
+    photo.bib_numbers = "200"
+    sync_photo_bibs(db, photo)
+    db.get(Photo, 2).is_public = False
+    db.commit()
+    assert index.photos_for_bib(db, 1, "100") == {1, 2}
+
+    monkeypatch.setattr("app.utils.event_index.time.monotonic", lambda: float("inf"))
+    assert index.photos_for_bib(db, 1, "100") == set()
+    assert index.photos_for_bib(db, 1, "200") == {1}
+
+
+def test_bib_expansion_finds_untagged_photos_of_the_wearer(db, monkeypatch):
+    monkeypatch.setattr(bib_expansion, "get_vector_store", lambda: db.store)
+    rng = np.random.default_rng(0)
+    runner, bystander = rng.standard_normal((2, 512)).astype(np.float32)
+
+    def detect(photo, base, box):
+        add_detection(db, photo.id, base, rng, event_id=photo.event_id, bbox=(0.5, 0.5, box, box))
+
+    tagged = _tagged(db, 1, "42")
+    detect(tagged, runner, box=0.6)
+    detect(tagged, bystander, box=0.1)
+    detect(_photo(db, 2, None), runner, box=0.3)
+    detect(_photo(db, 3, None), bystander, box=0.5)
+    detect(_photo(db, 4, None, event_id=2), runner, box=0.5)
+    db.commit()
+
+    expanded = bib_expansion.expand_bib_hits(db, [tagged])
+    assert [photo_id for photo_id, _ in expanded] == [2]
+    assert 0 < expanded[0][1] < 1.0
+
+
+def test_combined_search_scores_close_bibs_by_appearance(db, monkeypatch):
+    monkeypatch.setattr(combined_search, "get_vector_store", lambda: db.store)
+    rng = np.random.default_rng(1)
+    runner, other = rng.standard_normal((2, 512)).astype(np.float32)
+
+    def detect(photo, base):
+        add_detection(db, photo.id, base, rng)
+
+    detect(_tagged(db, 1, "1234"), other)  # right bib, wrong person (a misread)
+    detect(_tagged(db, 2, "7234"), runner) # OCR-confused bib, right person
+    _tagged(db, 3, "1234")                 # right bib, nobody detected
+    detect(_tagged(db, 4, "555"), runner)  # unrelated bib: not a candidate
+    db.commit()
+
+    candidates = BibIndex().photos_for_query(db, 1, "1234")
+    assert candidates == {1: "exact", 2: "ocr", 3: "exact"}
+    query = combined_search.fuse_query_vectors(runner, None)
+    photo_ids, scores, match_types = combined_search.rank_combined(db, 1, query, candidates, vector_k=10)
+    assert photo_ids[0] == 2 and sorted(photo_ids.tolist()) == [1, 2, 3]
+    assert dict(zip(photo_ids.tolist(), match_types)) == {1: "combined", 2: "combined", 3: "bib"}
+    assert scores[0] > max(scores[1:])
+
+    # Bib only: ranked by match strength
+    photo_ids, _, match_types = combined_search.rank_combined(db, 1, None, candidates, vector_k=10)
+    assert photo_ids.tolist() == [1, 3, 2] and set(match_types) == {"bib"}
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app.models.photo import Photo
+from app.crud.photo import list_photos_page, decode_photo_cursor, sync_photo_bibs
+
+
+@pytest.fixture
+def db(db):
+    start = datetime(2026, 4, 12, 9, 0, 0)
+    for photo_id in range(1, 61):
+        # Bursts share a timestamp, every seventh photo has none, every tenth is hidden
+        timestamp = None if photo_id % 7 == 0 else start + timedelta(seconds=(61 - photo_id) // 3)
+        db.add(Photo(
+            id=photo_id, event_id=1 if photo_id <= 50 else 2, photographer_id=1, timestamp=timestamp,
+            bib_numbers="42" if photo_id % 4 == 0 else None, is_public=photo_id % 10 != 0,
+        ))
+    db.flush()
+    for photo in db.query(Photo):
+        sync_photo_bibs(db, photo)
+    db.commit()
+    return db
+
+
+def _walk(db, **filters):
+    seen, after = [], None
+    while True:
+        photos, cursor = list_photos_page(db, after=after, limit=4, **filters)
+        seen += [photo.id for photo in photos]
+        if cursor is None:
+            return seen
+        after = decode_photo_cursor(cursor)
+
+
+def test_event_pages_follow_timestamp_order_without_gaps(db):
+    expected = [
+        photo.id for photo in sorted(
+            db.query(Photo).filter(Photo.event_id == 1, Photo.is_public == True),
+            key=lambda photo: (photo.timestamp is not None, photo.timestamp or datetime.min, photo.id),
+        )
+    ]
+    assert _walk(db, event_id=1) == expected
+
+    # Legacy offsets see the same order
+    offset_page, _ = list_photos_page(db, event_id=1, limit=4, offset=8)
+    assert [photo.id for photo in offset_page] == expected[8:12]
+
+
+def test_pages_without_event_and_by_bib(db):
+    assert _walk(db) == [photo_id for photo_id in range(1, 61) if photo_id % 10]
+    assert _walk(db, event_id=1, bib="42") == [
+        photo_id for photo_id in _walk(db, event_id=1) if photo_id % 4 == 0
+    ]
+
+
+def test_malformed_cursor_is_rejected():
+    assert decode_photo_cursor("not-a-cursor") is None
+
+
+def test_event_listing_uses_composite_index(db):
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM photos WHERE event_id = 1 AND is_public = 1 "
+        "AND (timestamp, id) > ('2026-04-12 09:00:05', 3) ORDER BY timestamp, id LIMIT 5"
+    )).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_photos_event_id_is_public_timestamp_id" in details
+    assert "TEMP B-TREE" not in details
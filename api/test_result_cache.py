@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+
+from app.utils.result_cache import ResultCache, TTLCache, encode_cursor, decode_cursor
+
+
+def _ranking(*photo_ids):
+    return np.asarray(photo_ids, dtype=np.int64), np.linspace(1.0, 0.5, len(photo_ids), dtype=np.float32), None
+
+
+def test_keyed_results_are_reused_until_the_event_watermark_moves():
+    cache = ResultCache(max_entries=10, ttl=60)
+    computed = []
+    def compute():
+        computed.append(1)
+        return _ranking(*range(len(computed) * 10))
+
+    first = cache.get_or_compute(("bib", "42", 1, True), 1, compute)
+    assert cache.get_or_compute(("bib", "42", 1, True), 1, compute) == first
+    cache.bump_watermark(2) # another event
+    assert cache.get_or_compute(("bib", "42", 1, True), 1, compute) == first
+    assert len(computed) == 1
+
+    cache.bump_watermark(1)
+    second = cache.get_or_compute(("bib", "42", 1, True), 1, compute)
+    assert second != first and len(computed) == 2
+    # Cursors into the old snapshot keep paging through it
+    assert len(cache.get(first)[0]) == 10 and len(cache.get(second)[0]) == 20
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (2, 2, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_searches_across_events_follow_every_event():
+    cache = ResultCache(max_entries=10, ttl=60)
+    first = cache.get_or_compute(("bib", "42", None, True), None, lambda: _ranking(1, 2))
+    cache.bump_watermark(7)
+    assert cache.get_or_compute(("bib", "42", None, True), None, lambda: _ranking(1, 2, 3)) != first
+
+
+def test_an_ingest_during_compute_invalidates_its_result():
+    cache = ResultCache(max_entries=10, ttl=60)
+    def compute():
+        cache.bump_watermark(1) # photo ingested while the search ran
+        return _ranking(1)
+    first = cache.get_or_compute(("text", "red shirt", 1, None), 1, compute)
+    assert cache.get_or_compute(("text", "red shirt", 1, None), 1, lambda: _ranking(1, 2)) != first
+
+
+def test_size_and_ttl_bounds():
+    cache = ResultCache(max_entries=2, ttl=0.05)
+    tokens = [cache.put(*_ranking(i)) for i in range(3)]
+    assert cache.get(tokens[0]) is None and cache.get(tokens[2]) is not None
+    time.sleep(0.06)
+    assert cache.get(tokens[2]) is None
+    assert cache.stats()["expired"] == 2
+
+
+def test_pop_frees_the_entry():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.pop("a")
+    cache.pop("missing")
+    cache.put("c", 3) # fits without evicting "b"
+    assert len(cache) == 2 and cache.get("a") is None and cache.get("b") == 2
+
+
+def test_cursors_round_trip():
+    assert decode_cursor(encode_cursor("abc_-1", 150)) == ("abc_-1", 150)
+    assert decode_cursor("not a cursor") is None
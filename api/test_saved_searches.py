@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from app.crud.photo import sync_photo_bibs
+from app.models.photo import Photo
+from app.models.saved_search import SavedSearch, SavedSearchMatch
+from app.utils import saved_search_matching
+from conftest import add_detection
+
+
+@pytest.fixture(autouse=True)
+def _use_test_store(db, monkeypatch):
+    monkeypatch.setattr(saved_search_matching, "get_vector_store", lambda: db.store)
+    saved_search_matching.invalidate_event_searches(1)
+
+
+rng = np.random.default_rng(0)
+RUNNER, OTHER = (v / np.linalg.norm(v) for v in rng.standard_normal((2, 512)).astype(np.float32))
+
+
+def _ingest(db, photo_id, bibs=None, people=(), is_public=True, event_id=1):
+    photo = Photo(id=photo_id, event_id=event_id, photographer_id=1, bib_numbers=bibs, is_public=is_public)
+    db.add(photo)
+    db.flush()
+    sync_photo_bibs(db, photo)
+    for base in people:
+        add_detection(db, photo_id, base, rng, noise=0.01, event_id=event_id, is_public=is_public)
+    db.commit()
+    return photo_id
+
+
+def _inbox(db, clerk_user_id):
+    return sorted(
+        (match.photo_id, match.match_type)
+        for match in db.query(SavedSearchMatch).filter(SavedSearchMatch.clerk_user_id == clerk_user_id)
+    )
+
+
+def test_new_photos_land_in_matching_inboxes(db):
+    db.add_all([
+        SavedSearch(clerk_user_id="user_bib", event_id=1, bib="42"),
+        SavedSearch(clerk_user_id="user_selfie", event_id=1, query_vector=RUNNER.tobytes()),
+        SavedSearch(clerk_user_id="user_other_event", event_id=2, bib="42"),
+    ])
+    db.commit()
+
+    batch = [
+        _ingest(db, 1, bibs="42", people=[OTHER]),
+        _ingest(db, 2, people=[OTHER, RUNNER]),
+        _ingest(db, 3, bibs="42", people=[RUNNER], is_public=False),
+        _ingest(db, 4, bibs="421", people=[OTHER]),
+    ]
+    assert saved_search_matching.match_new_photos(db, 1, batch) == 2
+    assert _inbox(db, "user_bib") == [(1, "bib")]
+    assert _inbox(db, "user_selfie") == [(2, "visual")]
+    assert _inbox(db, "user_other_event") == []
+
+    # Re-matching (e.g. after a retag) never duplicates entries
+    assert saved_search_matching.match_new_photos(db, 1, batch) == 0
+    db.get(Photo, 2).bib_numbers = "42"
+    sync_photo_bibs(db, db.get(Photo, 2))
+    db.commit()
+    assert saved_search_matching.match_new_photos(db, 1, [2]) == 1
+    assert _inbox(db, "user_bib") == [(1, "bib"), (2, "bib")]
+
+
+def test_searches_saved_later_are_picked_up(db):
+    _ingest(db, 1, bibs="7")
+    assert saved_search_matching.match_new_photos(db, 1, [1]) == 0
+    db.add(SavedSearch(clerk_user_id="late", event_id=1, bib="7"))
+    db.commit()
+    saved_search_matching.invalidate_event_searches(1)
+    assert saved_search_matching.match_new_photos(db, 1, [_ingest(db, 2, bibs="7")]) == 1
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.photo import Photo
+from app.models.user import User
+from app.utils.temporal_index import TemporalIndex
+
+START = datetime(2026, 4, 12, 9, 0, 0)
+
+
+@pytest.fixture
+def db(db):
+    db.add(User(id=2, username="b", email="b@example.com"))
+    # Photographer 1 shoots a burst at 09:00:00-09:00:01.5 and another frame at 09:00:30;
+    # photographer 2 shoots at the same moment from another spot
+    for photo_id, photographer_id, offset in [(1, 1, 0.0), (2, 1, 0.5), (3, 1, 1.5), (4, 1, 30.0), (5, 2, 0.2)]:
+        db.add(Photo(id=photo_id, event_id=1, photographer_id=photographer_id, timestamp=START + timedelta(seconds=offset)))
+    db.add(Photo(id=6, event_id=1, photographer_id=1, timestamp=START + timedelta(seconds=1), is_public=False))
+    db.add(Photo(id=7, event_id=1, photographer_id=1, timestamp=None))
+    db.commit()
+    return db
+
+
+def test_nearby_stays_within_photographer_and_window(db):
+    index = TemporalIndex()
+    assert index.nearby(db, 1, 2, seconds=5) == [(1, 0.5), (3, 1.0)]
+    assert index.nearby(db, 1, 1, seconds=1) == [(2, 0.5)]
+    assert index.nearby(db, 1, 4, seconds=5) == []
+    assert index.nearby(db, 1, 7) == [] # no capture time
+
+
+def test_expand_scores_fade_with_time_and_skip_hits(db):
+    expanded = TemporalIndex().expand(db, 1, [(1, 1.0), (3, 0.5)], seconds=2)
+    assert [photo_id for photo_id, _ in expanded] == [2]
+    assert 0.5 < expanded[0][1] < 0.8
+
+
+def test_incremental_updates(db):
+    index = TemporalIndex()
+    assert index.nearby(db, 1, 1, seconds=1) == [(2, 0.5)]
+    index.update_photo(6, 1, 1, START + timedelta(seconds=1)) # made public
+    index.update_photo(2, 2, 1, START)                          # moved to another event
+    index.update_photo(8, 1, 1, START - timedelta(seconds=0.25)) # new upload
+    assert index.nearby(db, 1, 1, seconds=1) == [(8, 0.25), (6, 1.0)]
+    index.remove_photo(6)
+    assert index.nearby(db, 1, 1, seconds=1) == [(8, 0.25)]
+
+
+def test_other_workers_writes_show_up_after_ttl(db, monkeypatch):
+    index = TemporalIndex(ttl=60)
+    assert index.nearby(db, 1, 1, seconds=1) == [(2, 0.5)]
+    # Another worker deletes photo 2 and re-times photo 3 into the window
+    db.delete(db.get(Photo, 2))
+    db.get(Photo, 3).timestamp = START + timedelta(seconds=0.75)
+    db.commit()
+    assert index.nearby(db, 1, 1, seconds=1) == [(2, 0.5)]
+
+    monkeypatch.setattr("app.utils.event_index.time.monotonic", lambda: float("inf"))
+    assert index.nearby(db, 1, 1, seconds=1) == [(3, 0.75)]
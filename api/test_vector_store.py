@@ -0,0 +1,248 @@
+"""
+Conformance and benchmark suite run against every VectorStore backend.
+Postgres is included when TEST_POSTGRES_URL points at a scratch database.
+"""
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.vector import PersonVector, InactiveVectorEvent, PersonVectorIdCounter
+from app.utils import faiss_utils
+from app.utils.vector_metadata import SearchFilter, VectorMetadata
+from app.utils.vector_store import FaissVectorStore, SqlVectorStore
+
+BACKENDS = ["faiss", "sqlite"] + (["postgres"] if os.getenv("TEST_POSTGRES_URL") else [])
+BENCH_VECTORS = int(os.getenv("VECTOR_STORE_BENCH_N", "5000"))
+
+
+def _sql_store(url):
+    engine = create_engine(url)
+    tables = [PersonVector.__table__, InactiveVectorEvent.__table__, PersonVectorIdCounter.__table__]
+    Base.metadata.drop_all(engine, tables=tables)
+    Base.metadata.create_all(engine, tables=tables)
+    return SqlVectorStore(sessionmaker(bind=engine)), engine
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path, monkeypatch):
+    if request.param == "faiss":
+        monkeypatch.setattr(faiss_utils, "FAISS_DATA_DIR", str(tmp_path))
+        monkeypatch.setattr(faiss_utils, "FAISS_INDEX_PATH", str(tmp_path / faiss_utils.FAISS_INDEX_FILENAME))
+        monkeypatch.setattr(faiss_utils, "FAISS_SERVICE_SOCKET", None)
+        monkeypatch.setattr(faiss_utils, "FAISS_SERVICE_NODES", None)
+        monkeypatch.setattr(faiss_utils, "_faiss_index", None)
+        monkeypatch.setattr(faiss_utils, "_raw_vector_store", None)
+        monkeypatch.setattr(faiss_utils, "_vector_metadata", VectorMetadata())
+        yield FaissVectorStore()
+        faiss_utils._faiss_index = None
+        faiss_utils._raw_vector_store = None
+        return
+    url = f"sqlite:///{tmp_path / 'vectors.db'}" if request.param == "sqlite" else os.getenv("TEST_POSTGRES_URL")
+    sql_store, engine = _sql_store(url)
+    yield sql_store
+    engine.dispose()
+
+
+def _random_vectors(n, seed):
+    vectors = np.random.default_rng(seed).random((n, faiss_utils.EMBEDDING_DIM), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _metadata(n, events=3, photographers=2, photos_per_vector=1):
+    ids = np.arange(n)
+    return {
+        "photo_id": ids // photos_per_vector,
+        "event_id": ids % events,
+        "photographer_id": 100 + ids % photographers,
+        "is_public": ids % 5 != 0,
+        "timestamp": 1_700_000_000 + ids,
+        "bbox": np.tile([0.5, 0.5, 0.2, 0.4], (n, 1)),
+    }
+
+
+def _ids(result):
+    _, indices = result
+    return indices[indices >= 0]
+
+
+def test_add_assigns_sequential_ids_and_finds_itself(store):
+    vectors = _random_vectors(50, seed=0)
+    ok, ids = store.add(vectors[:30], metadata=_metadata(30))
+    assert ok and ids == list(range(30))
+    ok, more = store.add(vectors[30:], metadata={name: values[30:] for name, values in _metadata(50).items()})
+    assert ok and more == list(range(30, 50))
+
+    distances, indices = store.search(vectors, k=3)
+    assert distances.shape == indices.shape == (50, 3)
+    assert (indices[:, 0] == np.arange(50)).all()
+    np.testing.assert_allclose(distances[:, 0], 1.0, rtol=1e-4)
+    assert (np.diff(distances, axis=1) <= 1e-6).all() # best first
+
+
+def test_sql_workers_get_disjoint_ids(tmp_path):
+    # Two workers with their own engines; the first adds inside a transaction it hasn't committed
+    url = f"sqlite:///{tmp_path / 'vectors.db'}"
+    first, first_engine = _sql_store(url)
+    second = SqlVectorStore(sessionmaker(bind=create_engine(url)))
+    vectors = _random_vectors(6, seed=9)
+    session = first.session_factory()
+    ok, first_ids = first.add(vectors[:3], metadata=_metadata(3), db=session)
+    assert ok
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(ids=second.add(vectors[3:], metadata=_metadata(3))[1]))
+    worker.start()
+    time.sleep(0.2) # The second add waits for the first transaction
+    session.commit()
+    session.close()
+    worker.join()
+    assert first_ids == [0, 1, 2] and result["ids"] == [3, 4, 5]
+    first_engine.dispose()
+
+
+def test_search_pads_when_k_exceeds_matches(store):
+    vectors = _random_vectors(4, seed=1)
+    store.add(vectors, metadata=_metadata(4))
+    distances, indices = store.search(vectors[:1], k=10)
+    assert indices.shape == (1, 10)
+    assert sorted(indices[0, :4].tolist()) == [0, 1, 2, 3]
+    assert (indices[0, 4:] == -1).all()
+
+
+def test_search_multi_with_per_query_k(store):
+    vectors = _random_vectors(30, seed=10)
+    store.add(vectors, metadata=_metadata(30))
+    results = store.search_multi(vectors[[3, 12, 29]], ks=[1, 5, 10])
+    assert [len(indices) for _, indices in results] == [1, 5, 10]
+    assert [indices[0] for _, indices in results] == [3, 12, 29]
+    assert store.search_multi(vectors[:2], ks=[1]) is None
+
+
+def test_group_ranking_prefers_photos_with_more_faces(store, monkeypatch):
+    from app.utils import group_search
+
+    monkeypatch.setattr(group_search, "get_vector_store", lambda: store)
+    vectors = _random_vectors(9, seed=11)
+    # Photo 0 shows both friends; photos 1 and 2 show one each; the rest show strangers
+    metadata = _metadata(9)
+    metadata["photo_id"] = np.array([0, 0, 1, 2, 3, 4, 5, 6, 7])
+    metadata["is_public"] = np.ones(9, dtype=bool)
+    store.add(vectors, metadata=metadata)
+    friends = np.vstack([vectors[0] + vectors[2], vectors[1] + vectors[3]])
+    faiss.normalize_L2(friends)
+
+    photo_ids, scores = group_search.rank_group(friends, ks=[2, 2])
+    assert photo_ids[0] == 0
+    assert set(photo_ids.tolist()) == {0, 1, 2}
+    assert (np.diff(scores) <= 0).all()
+
+
+def test_delete_excludes_vectors(store):
+    vectors = _random_vectors(20, seed=2)
+    store.add(vectors, metadata=_metadata(20))
+    store.delete([3, 7])
+    found = _ids(store.search(vectors, k=20))
+    assert not np.isin([3, 7], found).any()
+    assert store.stats()["deleted"] == 2
+
+
+def test_filters(store):
+    n = 60
+    vectors = _random_vectors(n, seed=3)
+    meta = _metadata(n)
+    store.add(vectors, metadata=meta)
+
+    found = _ids(store.search(vectors[:5], k=n, search_filter=SearchFilter.for_event(1)))
+    assert set(found.tolist()) == set(np.flatnonzero((meta["event_id"] == 1) & meta["is_public"]).tolist())
+
+    found = _ids(store.search(vectors[:5], k=n, search_filter=SearchFilter(photographer_ids=(101,), public_only=False)))
+    assert set(found.tolist()) == set(np.flatnonzero(meta["photographer_id"] == 101).tolist())
+
+    found = _ids(store.search(vectors[:5], k=n, search_filter=SearchFilter.for_event(1, photo_ids=(1, 4, 7, 9))))
+    assert set(found.tolist()) == {1, 4, 7} # 9 is in event 0
+
+    store.set_event_active(2, False)
+    found = _ids(store.search(vectors[:5], k=n, search_filter=SearchFilter()))
+    assert set(found.tolist()) == set(np.flatnonzero((meta["event_id"] != 2) & meta["is_public"]).tolist())
+    store.set_event_active(2, True)
+    found = _ids(store.search(vectors[:5], k=n, search_filter=SearchFilter()))
+    assert set(found.tolist()) == set(np.flatnonzero(meta["is_public"]).tolist())
+
+
+def test_vectors_without_metadata_only_match_unfiltered_search(store):
+    vectors = _random_vectors(10, seed=4)
+    store.add(vectors[:5], metadata=_metadata(5))
+    store.add(vectors[5:])
+    assert set(_ids(store.search(vectors, k=10)).tolist()) == set(range(10))
+    filtered = _ids(store.search(vectors, k=10, search_filter=SearchFilter(public_only=False)))
+    assert set(filtered.tolist()) == set(range(5))
+
+
+def test_update_metadata_changes_filter_results(store):
+    vectors = _random_vectors(10, seed=5)
+    meta = _metadata(10)
+    meta["is_public"] = np.ones(10, dtype=bool)
+    store.add(vectors, metadata=meta)
+    store.update_metadata([1, 2], is_public=[False, False], event_id=[7, 7])
+    public = _ids(store.search(vectors, k=10, search_filter=SearchFilter()))
+    assert not np.isin([1, 2], public).any()
+    event7 = _ids(store.search(vectors, k=10, search_filter=SearchFilter.for_event(7, public_only=False)))
+    assert set(event7.tolist()) == {1, 2}
+
+
+def test_get_vectors_returns_stored_vectors(store):
+    vectors = _random_vectors(10, seed=9)
+    store.add(vectors, metadata=_metadata(10))
+    store.delete([4])
+    ids, found = store.get_vectors([7, 4, 2, 99, 7])
+    assert ids.tolist() == [7, 2, 7]
+    np.testing.assert_allclose(found, vectors[[7, 2, 7]], rtol=1e-6)
+
+
+def test_aggregate_to_photos_keeps_best_score_per_photo(store):
+    vectors = _random_vectors(12, seed=6)
+    store.add(vectors, metadata=_metadata(12, photos_per_vector=3))
+    photo_ids, scores = store.aggregate_to_photos(*store.search(vectors[:1], k=12))
+    assert sorted(photo_ids.tolist()) == [0, 1, 2, 3]
+    assert photo_ids[0] == 0 and scores[0] == pytest.approx(1.0, rel=1e-4)
+    assert (np.diff(scores) <= 0).all()
+
+
+def test_snapshot_and_stats(store):
+    store.add(_random_vectors(8, seed=7), metadata=_metadata(8))
+    assert store.snapshot()
+    stats = store.stats()
+    assert stats["backend"] == store.name
+    assert stats["ntotal"] == 8
+
+
+def test_benchmark(store):
+    """Throughput and latency on BENCH_VECTORS vectors; recall is checked against brute force."""
+    vectors = _random_vectors(BENCH_VECTORS, seed=8)
+    meta = _metadata(BENCH_VECTORS, events=10)
+    started = time.perf_counter()
+    for start in range(0, BENCH_VECTORS, 500):
+        store.add(vectors[start:start + 500], metadata={name: values[start:start + 500] for name, values in meta.items()})
+    add_seconds = time.perf_counter() - started
+
+    queries = vectors[:50]
+    started = time.perf_counter()
+    _, indices = store.search(queries, k=10)
+    search_ms = 1000 * (time.perf_counter() - started) / len(queries)
+    started = time.perf_counter()
+    store.search(queries, k=10, search_filter=SearchFilter.for_event(3))
+    filtered_ms = 1000 * (time.perf_counter() - started) / len(queries)
+
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(indices, exact)])
+    print(f"\n{store.name}: {BENCH_VECTORS / add_seconds:,.0f} adds/s, {search_ms:.2f} ms/query, "
+          f"{filtered_ms:.2f} ms/query (one event), recall@10 {recall:.3f}")
+    assert recall >= 0.95